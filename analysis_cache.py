@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from data_manager import get_pool
+
+CACHE_PATH = os.getenv("ANALYSIS_CACHE_DB", 'data/analysis_cache.db')
+
+# Persistent, size-bounded LRU cache of model analysis results
+class AnalysisCache:
+    def __init__(self, path=None, max_entries=2000, max_bytes=32 * 1024 * 1024):
+        self.path = path or CACHE_PATH
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with get_pool(self.path).connection() as conn:
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS analysis_cache (
+                        key TEXT PRIMARY KEY,
+                        model TEXT,
+                        result TEXT,
+                        size INTEGER,
+                        created REAL,
+                        last_used REAL,
+                        hits INTEGER DEFAULT 0
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)')
+
+    # Content address for one analysis: image bytes + prompt + model
+    @staticmethod
+    def make_key(image_bytes, prompt, model_name):
+        digest = hashlib.sha256()
+        for part in (model_name.encode(), prompt.encode(), image_bytes):
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with get_pool(self.path).connection() as conn:
+            with conn:
+                row = conn.execute('SELECT result FROM analysis_cache WHERE key = ?', (key,)).fetchone()
+                if row:
+                    conn.execute(
+                        'UPDATE analysis_cache SET last_used = ?, hits = hits + 1 WHERE key = ?',
+                        (time.time(), key)
+                    )
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, result, model_name=''):
+        payload = json.dumps(result)
+        now = time.time()
+        with get_pool(self.path).connection() as conn:
+            with conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO analysis_cache (key, model, result, size, created, last_used, hits)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                ''', (key, model_name, payload, len(payload), now, now))
+                self._evict(conn)
+
+    # Drop least recently used entries until both bounds hold
+    def _evict(self, conn):
+        count, total = conn.execute('SELECT COUNT(*), TOTAL(size) FROM analysis_cache').fetchone()
+        if count > self.max_entries:
+            conn.execute('''
+                DELETE FROM analysis_cache WHERE key IN (
+                    SELECT key FROM analysis_cache ORDER BY last_used LIMIT ?
+                )
+            ''', (count - self.max_entries,))
+            total = conn.execute('SELECT TOTAL(size) FROM analysis_cache').fetchone()[0]
+        while total > self.max_bytes:
+            row = conn.execute('SELECT key, size FROM analysis_cache ORDER BY last_used LIMIT 1').fetchone()
+            if row is None:
+                break
+            conn.execute('DELETE FROM analysis_cache WHERE key = ?', (row[0],))
+            total -= row[1]
+
+    def clear(self):
+        with get_pool(self.path).connection() as conn:
+            with conn:
+                conn.execute('DELETE FROM analysis_cache')
+
+    def stats(self):
+        with get_pool(self.path).connection() as conn:
+            entries, size = conn.execute('SELECT COUNT(*), TOTAL(size) FROM analysis_cache').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": int(size)
+        }
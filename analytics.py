@@ -0,0 +1,135 @@
+import threading
+from datetime import date, timedelta
+from data_manager import DEFAULT_USER_ID
+from metrics import timed
+from storage import get_storage
+from utils import calculate_daily_calories
+
+# Report windows offered by the app, in days; any other length works too
+WINDOWS = {"7 days": 7, "30 days": 30, "365 days": 365}
+
+MACROS = ('calories', 'protein', 'carbs', 'fat')
+
+# A logged day is on target within this fraction of the calorie target
+ADHERENCE_TOLERANCE = 0.1
+
+def _window_dates(days, end=None):
+    if days < 1:
+        raise ValueError("An analytics window needs at least one day")
+    end = end or date.today().isoformat()
+    return (date.fromisoformat(end) - timedelta(days=days - 1)).isoformat(), end
+
+# Per-day totals and meal-type breakdowns of one user's window, kept between
+# reports. Each refresh reads the window's daily totals (at most `days`
+# rows, from one index range) and goes back to the food log only for the days
+# whose totals differ from what is held: new days, today's latest entries,
+# or imports and edits of older days.
+class NutritionWindow:
+    def __init__(self, user_id, days):
+        self.user_id = user_id
+        self.days = days
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.meals = {}
+        self._report = None
+
+    def refresh(self, end=None):
+        start, end = _window_dates(self.days, end)
+        storage = get_storage()
+        with timed('analytics_refresh'):
+            rows = storage.load_daily_totals(start, end, self.user_id)
+        totals = {row[0]: row[1:] for row in rows}
+        changed = [day for day, values in totals.items() if self.totals.get(day) != values]
+        meals = {day: self.meals[day] for day in totals if day not in changed}
+        if changed:
+            # Read through iter_log_rows, so archived days are included
+            wanted = set(changed)
+            for rows in storage.iter_log_rows('food_log', min(changed), max(changed),
+                                              ['date', 'meal_type', *MACROS], user_id=self.user_id):
+                for day, meal_type, *values in rows:
+                    if day in wanted:
+                        by_meal = meals.setdefault(day, {})
+                        previous = by_meal.get(meal_type or 'Other', (0,) * (len(MACROS) + 1))
+                        by_meal[meal_type or 'Other'] = (previous[0] + 1, *(
+                            total + (value or 0) for total, value in zip(previous[1:], values)
+                        ))
+        if changed or totals.keys() != self.totals.keys():
+            self._report = None
+        self.totals, self.meals = totals, meals
+        self.start, self.end = start, end
+        return len(changed)
+
+    # Averages per logged day, adherence to `target` kcal and the meal-type
+    # breakdown of the window last refreshed
+    def report(self, target=None):
+        import numpy as np
+        import pandas as pd
+
+        if self._report is not None and self._report['target'] == target \
+                and (self._report['start'], self._report['end']) == (self.start, self.end):
+            return {**self._report, 'meals': self._report['meals'].copy()}
+        values = np.array([values[1:] for values in self.totals.values()], dtype=float).reshape(-1, len(MACROS))
+        logged = len(values)
+        report = {
+            'start': self.start,
+            'end': self.end,
+            'days': self.days,
+            'days_logged': logged,
+            'averages': dict(zip(MACROS, values.mean(axis=0) if logged else [0.0] * len(MACROS))),
+            'target': target,
+            'on_target_days': None,
+            'adherence': None,
+            'target_ratio': None,
+        }
+        if target and logged:
+            ratio = values[:, 0] / target
+            on_target = int((np.abs(ratio - 1) <= ADHERENCE_TOLERANCE).sum())
+            report.update(on_target_days=on_target, adherence=on_target / logged, target_ratio=float(ratio.mean()))
+
+        breakdown = {}
+        for by_meal in self.meals.values():
+            for meal_type, meal_values in by_meal.items():
+                previous = breakdown.get(meal_type, (0,) * len(meal_values))
+                breakdown[meal_type] = tuple(a + b for a, b in zip(previous, meal_values))
+        meals = pd.DataFrame(
+            [(meal_type, *meal_values) for meal_type, meal_values in breakdown.items()],
+            columns=['meal_type', 'entries', *MACROS]
+        ).sort_values('calories', ascending=False, ignore_index=True)
+        total = meals['calories'].sum()
+        meals['calorie_share'] = meals['calories'] / total if total else 0.0
+        meals[list(MACROS)] = meals[list(MACROS)].div(logged or 1)
+        report['meals'] = meals
+        self._report = report
+        return {**report, 'meals': meals.copy()}
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+def _window(user_id, days):
+    key = (get_storage().scope, user_id, days)
+    with _windows_lock:
+        if key not in _windows:
+            _windows[key] = NutritionWindow(user_id, days)
+        return _windows[key]
+
+# Nutrition over the `days` days ending at `end` (default today): macro
+# averages per logged day, adherence to the profile's calculate_daily_calories
+# target and per-day meal-type averages. Windows are cached per (user, days)
+# and refreshed incrementally.
+def nutrition_report(days, end=None, user_id=DEFAULT_USER_ID):
+    profile = get_storage().load_user_data(user_id)
+    target = None
+    if profile:
+        target = calculate_daily_calories(
+            profile['weight'], profile['height'], profile['age'],
+            profile['gender'], profile['exercise_level'], profile['goal']
+        )
+    window = _window(user_id, days)
+    with window.lock:
+        window.refresh(end)
+        return window.report(target)
+
+# Daily totals between two dates with rolling averages over the trailing
+# `window` calendar days (logged days only), computed by the database
+def daily_trend(start, end, window=7, user_id=DEFAULT_USER_ID):
+    return get_storage().load_daily_trend(start, end, window, user_id)
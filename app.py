@@ -1,19 +1,67 @@
+import os
 import streamlit as st
 from datetime import datetime
-import pandas as pd
-import plotly.express as px
-from data_manager import init_db, save_user_data, load_user_data, save_food_log, load_food_log, save_workout_log, load_workout_log, save_progress, load_progress
+from data_manager import DEFAULT_USER_ID, QueryCache, use_query_cache
+from exercise import MET_ACTIVITIES, calories_burned as calories_burned_for, intensities
+from food_db import hot_cache, suggest_foods
+from metrics import prometheus_text, summarize_trace, timed, to_json, trace_render
+from storage import get_storage
 from utils import calculate_bmi, get_bmi_category, calculate_daily_calories
-from nutrition_analyzer import NutritionAnalyzer, get_analysis_prompt
 
-# Initialize database
-init_db()
+# Heavy modules (the model client, PIL, plotly, pandas) are imported by the
+# pages that need them, so a rerun of any other page never pays for them.
+
+# Initialize the storage backend (HEALTH_TRACKER_STORAGE) once per process
+@st.cache_resource
+def setup_database():
+    get_storage().init()
+
+# Expose /metrics for Prometheus when METRICS_PORT is set
+@st.cache_resource
+def start_metrics_server():
+    port = os.getenv("METRICS_PORT")
+    if port:
+        from metrics import serve
+        return serve(int(port))
+
+# One analyzer (model client and result cache) shared by all sessions
+@st.cache_resource
+def get_analyzer():
+    from nutrition_analyzer import NutritionAnalyzer
+    return NutritionAnalyzer()
+
+# The user whose data this session is viewing
+def current_user():
+    return st.session_state.get("user_id", DEFAULT_USER_ID)
+
+def user_selector():
+    users = dict(get_storage().list_users())
+    ids = list(users)
+    if st.session_state.get("user_id") not in users:
+        st.session_state.user_id = ids[0]
+    st.sidebar.selectbox("User", ids, format_func=users.get, key="user_id")
+    with st.sidebar.expander("Add user"):
+        name = st.text_input("Name", key="new_user_name")
+        if st.button("Create user", key="create_user") and name.strip():
+            if name.strip() in users.values():
+                st.error("A user with that name already exists")
+            else:
+                st.session_state.pending_user_id = get_storage().create_user(name)
+                st.rerun()
+
+FAILED_WRITE_LABELS = {"food_log": "food", "workout_log": "exercise", "progress": "weight"}
+
+# Entries saved with write-behind are committed after the page said so;
+# report the ones that did not make it on the user's next rerun
+def show_failed_writes():
+    for table, params, error in get_storage().take_failed_writes(current_user()):
+        st.error(f"A {FAILED_WRITE_LABELS.get(table, table)} entry for {params[0]} was not saved: {error}")
 
 # Page Functions
 def home_page():
     st.title("Welcome to Be-Healthier!")
     st.text("- Developed By: Mohammad Ayaz Alam")
-    user_data = load_user_data()
+    user_data = get_storage().load_user_data(current_user())
     
     if not user_data:
         st.info("👋 Welcome! Please complete your profile to get started.")
@@ -33,20 +81,19 @@ def home_page():
             user_data['weight'], user_data['height'], user_data['age'],
             user_data['gender'], user_data['exercise_level'], user_data['goal']
         )
-        food_log = load_food_log(datetime.now().strftime("%Y-%m-%d"))
-        calories_consumed = food_log['calories'].sum()
+        summary = get_storage().load_daily_summary(datetime.now().strftime("%Y-%m-%d"), current_user())
+        calories_consumed = summary['calories']
         st.metric("Calories", f"{calories_consumed}/{daily_calories}",
           delta=float(daily_calories - calories_consumed))  # Convert to float
         
     with col3:
         st.subheader("Exercise Log")
-        workout_log = load_workout_log(datetime.now().strftime("%Y-%m-%d"))
-        calories_burned = workout_log['calories_burned'].sum()
+        calories_burned = summary['calories_burned']
         st.metric("Calories Burned", f"{calories_burned}")
 
 def profile_page():
     st.header("User Profile")
-    user_data = load_user_data()
+    user_data = get_storage().load_user_data(current_user())
     
     col1, col2 = st.columns(2)
     
@@ -104,9 +151,122 @@ def profile_page():
             "allergies": allergies,
             "last_updated": datetime.now().strftime("%Y-%m-%d")
         }
-        save_user_data(user_data)
+        get_storage().save_user_data(user_data, current_user())
         st.success("Profile updated successfully!")
 
+# Analyze one upload, listing detected food items while the response streams in
+def stream_analysis(analyzer, uploaded_file, image_type):
+    from nutrition_analyzer import get_analysis_prompt
+    
+    prompt = get_analysis_prompt(image_type)
+    placeholder = st.empty()
+    detected = []
+    try:
+        processed_image = analyzer.preprocess_image(uploaded_file)
+        for event, payload in analyzer.extract_nutrition_info_stream(processed_image, prompt):
+            if event == "item":
+                detected.append(f"🔸 {payload.get('name', 'Item')}: {payload.get('calories', '?')} kcal")
+                placeholder.markdown("🍽️ Detected so far:\n\n" + "\n\n".join(detected))
+            else:
+                return payload
+    except ValueError as e:
+        return e
+    finally:
+        placeholder.empty()
+
+def analysis_result_section(analysis):
+    result = analysis["result"]
+    image_type = analysis["image_type"]
+    uploaded_file = analysis["uploaded_file"]
+    key = analysis["id"]
+    
+    st.subheader(f"Analysis Results: {uploaded_file.name}")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.image(uploaded_file, caption="Uploaded Image", use_container_width=True)
+    
+    with col2:
+        if image_type == "Food Label":
+            st.write("📊 Nutritional Information:")
+            st.write(f"🔸 Calories: {result['calories']} kcal")
+            st.write(f"🔸 Protein: {result.get('protein', 0)}g")
+            st.write(f"🔸 Carbs: {result.get('carbohydrates', 0)}g")
+            st.write(f"🔸 Fat: {result.get('fat', 0)}g")
+        else:
+            st.write("🍽️ Detected Food Items:")
+            for item in result['food_items']:
+                st.write(f"🔸 {item['name']}: {item['calories']} kcal")
+            st.write("📊 Total Nutritional Information:")
+            st.write(f"🔸 Total Calories: {result['total_calories']} kcal")
+            st.write(f"🔸 Total Protein: {result.get('total_protein', 0)}g")
+            st.write(f"🔸 Total Carbs: {result.get('total_carbs', 0)}g")
+            st.write(f"🔸 Total Fat: {result.get('total_fat', 0)}g")
+    
+    # Add to food log section
+    st.subheader("Add to Food Log")
+    col1, col2 = st.columns(2)
+    with col1:
+        meal_type = st.selectbox("Meal Type", ["Breakfast", "Lunch", "Dinner", "Snack"], key=f"meal_type_{key}")
+        food_name = st.text_input("Food Name", 
+                                value="Analyzed Food Item" if image_type == "Food Label" 
+                                else ", ".join([item['name'] for item in result.get('food_items', [])]),
+                                key=f"food_name_{key}")
+    
+    if st.button("Add to Food Log", key=f"add_{key}"):
+        if image_type == "Food Label":
+            total_calories = result['calories']
+            total_protein = result.get('protein', 0)
+            total_carbs = result.get('carbohydrates', 0)
+            total_fat = result.get('fat', 0)
+        else:
+            total_calories = result['total_calories']
+            total_protein = result.get('total_protein', 0)
+            total_carbs = result.get('total_carbs', 0)
+            total_fat = result.get('total_fat', 0)
+        
+        entry = {
+            'date': datetime.now().strftime("%Y-%m-%d"),
+            'meal_type': meal_type,
+            'food_item': food_name,
+            'calories': float(total_calories),
+            'protein': float(total_protein),
+            'carbs': float(total_carbs),
+            'fat': float(total_fat)
+        }
+        get_storage().save_food_log(entry, current_user())
+        hot_cache(current_user()).record(entry)
+        st.success("✅ Food added to log successfully!")
+        # Clear this analysis result after adding to log
+        st.session_state.analysis_results.remove(analysis)
+
+# Copy a food suggestion into the manual entry fields. Runs as a button
+# callback, before those widgets are drawn again.
+def fill_manual_entry(food):
+    st.session_state.manual_food_name = food['name']
+    st.session_state.manual_calories = min(int(round(food['calories'] or 0)), 2000)
+    for field, key in (('protein', 'manual_protein'), ('carbs', 'manual_carbs'), ('fat', 'manual_fat')):
+        st.session_state[key] = min(float(food[field] or 0), 200.0)
+
+# Autocomplete from the user's frequent foods and the local food database
+def food_search():
+    query = st.text_input("Search foods", key="manual_food_search",
+                          placeholder="Start typing, e.g. 'chicken br'")
+    if not query:
+        return
+    suggestions = suggest_foods(query, current_user())
+    if not suggestions:
+        st.caption("No matching foods - enter the details below.")
+        return
+    labels = [
+        f"{food['name']}" + (f" ({food['brand']})" if food.get('brand') else "")
+        + f" - {food['calories'] or 0:.0f} kcal" + (f" per {food['serving']}" if food.get('serving') else "")
+        for food in suggestions
+    ]
+    choice = st.selectbox("Matching foods", range(len(suggestions)), format_func=labels.__getitem__,
+                          key="manual_food_choice")
+    st.button("Use this food", key="manual_use_food", on_click=fill_manual_entry, args=(suggestions[choice],))
+
 def food_analyzer_page():
     st.header("Food Analyzer & Logger")
     
@@ -116,104 +276,49 @@ def food_analyzer_page():
     with tab1:
         st.subheader("Analyze Food Image")
         image_type = st.radio("What are you uploading?", ["Food Label", "Food Image"])
-        uploaded_file = st.file_uploader(
-            "Upload Image", 
-            type=['png', 'jpg', 'jpeg'],
-            help="Upload either a nutrition label or a photo of your food"
+        uploaded_files = st.file_uploader(
+            "Upload Images", 
+            type=['png', 'jpg', 'jpeg', 'webp', 'heic', 'heif'],
+            accept_multiple_files=True,
+            help="Upload nutrition labels or photos of your food - several at once to log a whole day"
         )
         
-        # Initialize session state for analysis result
-        if "analysis_result" not in st.session_state:
-            st.session_state.analysis_result = None
+        # Initialize session state for analysis results
+        if "analysis_results" not in st.session_state:
+            st.session_state.analysis_results = []
         
-        if uploaded_file and st.button("Analyze"):
-            with st.spinner("Analyzing image..."):
+        if uploaded_files and st.button("Analyze"):
+            with st.spinner(f"Analyzing {len(uploaded_files)} image(s)..."):
                 try:
-                    analyzer = NutritionAnalyzer()
-                    prompt = get_analysis_prompt(image_type)
-                    processed_image = analyzer.preprocess_image(uploaded_file)
-                    result = analyzer.extract_nutrition_info(processed_image, prompt)
+                    analyzer = get_analyzer()
+                    if len(uploaded_files) == 1:
+                        results = [stream_analysis(analyzer, uploaded_files[0], image_type)]
+                    else:
+                        results = analyzer.analyze_many(uploaded_files, image_type)
                     
-                    if result is None:
-                        st.error("Analysis failed: No result returned")
-                        return
-                    
-                    # Store the result in session state
-                    st.session_state.analysis_result = {
-                        "result": result,
-                        "image_type": image_type,
-                        "uploaded_file": uploaded_file
-                    }
+                    # Store the results in session state
+                    st.session_state.analysis_results = []
+                    for uploaded_file, result in zip(uploaded_files, results):
+                        if isinstance(result, Exception) or result is None:
+                            st.error(f"Error analyzing {uploaded_file.name}: {result or 'No result returned'}")
+                            continue
+                        st.session_state.analysis_results.append({
+                            "id": uploaded_file.file_id,
+                            "result": result,
+                            "image_type": image_type,
+                            "uploaded_file": uploaded_file
+                        })
                     
                 except Exception as e:
                     st.error(f"Error during analysis: {str(e)}")
         
         # Display analysis results if available
-        if st.session_state.analysis_result:
-            result = st.session_state.analysis_result["result"]
-            image_type = st.session_state.analysis_result["image_type"]
-            uploaded_file = st.session_state.analysis_result["uploaded_file"]
-            
-            st.subheader("Analysis Results")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.image(uploaded_file, caption="Uploaded Image", use_container_width=True)
-            
-            with col2:
-                if image_type == "Food Label":
-                    st.write("📊 Nutritional Information:")
-                    st.write(f"🔸 Calories: {result['calories']} kcal")
-                    st.write(f"🔸 Protein: {result.get('protein', 0)}g")
-                    st.write(f"🔸 Carbs: {result.get('carbohydrates', 0)}g")
-                    st.write(f"🔸 Fat: {result.get('fat', 0)}g")
-                else:
-                    st.write("🍽️ Detected Food Items:")
-                    for item in result['food_items']:
-                        st.write(f"🔸 {item['name']}: {item['calories']} kcal")
-                    st.write("📊 Total Nutritional Information:")
-                    st.write(f"🔸 Total Calories: {result['total_calories']} kcal")
-                    st.write(f"🔸 Total Protein: {result.get('total_protein', 0)}g")
-                    st.write(f"🔸 Total Carbs: {result.get('total_carbs', 0)}g")
-                    st.write(f"🔸 Total Fat: {result.get('total_fat', 0)}g")
-            
-            # Add to food log section
-            st.subheader("Add to Food Log")
-            col1, col2 = st.columns(2)
-            with col1:
-                meal_type = st.selectbox("Meal Type", ["Breakfast", "Lunch", "Dinner", "Snack"])
-                food_name = st.text_input("Food Name", 
-                                        value="Analyzed Food Item" if image_type == "Food Label" 
-                                        else ", ".join([item['name'] for item in result.get('food_items', [])]))
-            
-            if st.button("Add to Food Log"):
-                if image_type == "Food Label":
-                    total_calories = result['calories']
-                    total_protein = result.get('protein', 0)
-                    total_carbs = result.get('carbohydrates', 0)
-                    total_fat = result.get('fat', 0)
-                else:
-                    total_calories = result['total_calories']
-                    total_protein = result.get('total_protein', 0)
-                    total_carbs = result.get('total_carbs', 0)
-                    total_fat = result.get('total_fat', 0)
-                
-                entry = {
-                    'date': datetime.now().strftime("%Y-%m-%d"),
-                    'meal_type': meal_type,
-                    'food_item': food_name,
-                    'calories': float(total_calories),
-                    'protein': float(total_protein),
-                    'carbs': float(total_carbs),
-                    'fat': float(total_fat)
-                }
-                save_food_log(entry)
-                st.success("✅ Food added to log successfully!")
-                # Clear the analysis result after adding to log
-                st.session_state.analysis_result = None
+        for analysis in list(st.session_state.analysis_results):
+            analysis_result_section(analysis)
     
     with tab2:
         st.subheader("Manual Food Entry")
+        food_search()
         col1, col2 = st.columns(2)
         with col1:
             meal_type = st.selectbox("Select Meal Type", ["Breakfast", "Lunch", "Dinner", "Snack"], key="manual_meal_type")
@@ -234,12 +339,13 @@ def food_analyzer_page():
                 'carbs': float(carbs),
                 'fat': float(fat)
             }
-            save_food_log(entry)
+            get_storage().save_food_log(entry, current_user())
+            hot_cache(current_user()).record(entry)
             st.success("✅ Food item added to log!")
     
     # Display today's food log
     st.subheader("Today's Food Log")
-    food_log = load_food_log(datetime.now().strftime("%Y-%m-%d"))
+    food_log = get_storage().load_food_log(datetime.now().strftime("%Y-%m-%d"), current_user())
     if not food_log.empty:
         st.dataframe(food_log)
         col1, col2, col3 = st.columns(3)
@@ -253,7 +359,7 @@ def food_analyzer_page():
 def exercise_page():
     st.header("Exercise Tracker")
     
-    user_data = load_user_data()
+    user_data = get_storage().load_user_data(current_user())
     if not user_data:
         st.warning("Please complete your profile first!")
         return
@@ -262,11 +368,17 @@ def exercise_page():
     
     with col1:
         st.subheader("Log Exercise")
-        exercise_type = st.selectbox("Exercise Type", ["Cardio", "Strength", "Flexibility", "HIIT"])
-        exercise = st.selectbox("Exercise", ["Running", "Cycling", "Swimming", "Push-ups", "Yoga", "Burpees"])
+        exercise_type = st.selectbox("Exercise Type", list(MET_ACTIVITIES))
+        activity = st.selectbox("Exercise", list(MET_ACTIVITIES[exercise_type]))
+        levels = intensities(exercise_type, activity)
+        exercise = next(iter(levels))
+        if len(levels) > 1:
+            exercise = st.selectbox("Intensity", list(levels), format_func=lambda label: label[len(activity) + 2:])
         duration = st.number_input("Duration (minutes)", 1, 180)
         
-        calories_burned = duration * 7  # Example calculation (adjust based on exercise type)
+        # MET x body weight x hours
+        calories_burned = calories_burned_for(exercise, duration, user_data['weight'])
+        st.caption(f"{levels[exercise]} MET · about {calories_burned:.0f} kcal at {user_data['weight']} kg")
         
         if st.button("Log Exercise"):
             entry = {
@@ -276,27 +388,32 @@ def exercise_page():
                 'duration': duration,
                 'calories_burned': calories_burned
             }
-            save_workout_log(entry)
+            get_storage().save_workout_log(entry, current_user())
             st.success("Exercise logged successfully!")
     
     with col2:
         st.subheader("Today's Exercise Summary")
-        workout_log = load_workout_log(datetime.now().strftime("%Y-%m-%d"))
+        workout_log = get_storage().load_workout_log(datetime.now().strftime("%Y-%m-%d"), current_user())
         if not workout_log.empty:
             st.dataframe(workout_log)
             st.metric("Total Calories Burned", f"{workout_log['calories_burned'].sum():.0f}")
+        
+        with st.expander("Recalculate history"):
+            st.caption("Re-derive calories burned for every logged workout from the MET table "
+                       "and your weight at the time.")
+            if st.button("Recalculate", key="recompute_burned"):
+                from exercise import recompute_calories_burned
+                updated = recompute_calories_burned(current_user())
+                st.success(f"Updated {updated} workouts")
 
 def progress_tracker_page():
     st.header("Progress Tracker")
     
-    user_data = load_user_data()
+    user_data = get_storage().load_user_data(current_user())
     if not user_data:
         st.warning("Please complete your profile first!")
         return
     
-    # Weight tracking
-    progress_df = load_progress()
-    
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Log Today's Weight")
@@ -308,23 +425,78 @@ def progress_tracker_page():
                 'calories_consumed': 0,  # Placeholder
                 'exercise_minutes': 0    # Placeholder
             }
-            save_progress(entry)
+            get_storage().save_progress(entry, current_user())
             st.success("Weight logged successfully!")
     
-    # Progress visualization
-    if not progress_df.empty:
+    # Progress visualization, downsampled so long histories stay light
+    weight_series = get_storage().load_weight_series(user_id=current_user())
+    if not weight_series.empty:
+        import plotly.express as px
+        
         st.subheader("Weight Progress")
-        fig = px.line(progress_df, x='date', y='weight', 
-                     title='Weight Over Time')
-        st.plotly_chart(fig)
+        with timed('plotly_render'):
+            fig = px.line(weight_series, x='date', y='weight', 
+                         title='Weight Over Time')
+            st.plotly_chart(fig)
         
         # Calculate stats
-        if len(progress_df) > 1:
-            total_loss = progress_df['weight'].iloc[-1] - progress_df['weight'].iloc[0]
+        change = get_storage().load_weight_change(current_user())
+        if change and len(weight_series) > 1:
+            total_loss = change[1] - change[0]
             st.metric("Total Weight Change", f"{total_loss:.1f} kg")
+        
+        # Weekly and monthly trends
+        period = st.radio("Trend by", ["week", "month"], horizontal=True, format_func=str.title)
+        rollup = get_storage().load_progress_rollup(period, user_id=current_user())
+        if not rollup.empty:
+            slope = rollup['slope_per_day'].iloc[-1]
+            if rollup['slope_per_day'].notna().iloc[-1]:
+                st.metric(f"Trend this {period}", f"{slope * 7:+.2f} kg/week")
+            st.dataframe(rollup.round(2), hide_index=True)
+    
+    nutrition_trends()
+
+# Macro averages, calorie-target adherence and meal breakdown over a window
+def nutrition_trends():
+    from analytics import ADHERENCE_TOLERANCE, WINDOWS, daily_trend, nutrition_report
+    
+    st.subheader("Nutrition Trends")
+    days = WINDOWS[st.radio("Window", list(WINDOWS), horizontal=True, key="trend_window")]
+    report = nutrition_report(days, user_id=current_user())
+    if not report['days_logged']:
+        st.info("No meals logged in this window yet.")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    averages = report['averages']
+    col1.metric("Avg Calories", f"{averages['calories']:.0f} kcal")
+    col2.metric("Avg Protein", f"{averages['protein']:.1f}g")
+    col3.metric("Avg Carbs", f"{averages['carbs']:.1f}g")
+    col4.metric("Avg Fat", f"{averages['fat']:.1f}g")
+    if report['adherence'] is not None:
+        st.metric("Days on calorie target", f"{report['on_target_days']}/{report['days_logged']}",
+                  help=f"Within {ADHERENCE_TOLERANCE:.0%} of {report['target']} kcal")
+    
+    trend = daily_trend(report['start'], report['end'], user_id=current_user())
+    st.line_chart(trend.set_index('date')[['calories', 'calories_avg']])
+    st.dataframe(report['meals'].round(2), hide_index=True)
 
 def main():
     st.set_page_config(page_title="Health & Fitness Tracker", layout="wide")
+    start_metrics_server()
+    # Loader results are kept for the session and dropped when a save
+    # touches their table, so reruns from unrelated widgets skip SQLite
+    if "query_cache" not in st.session_state:
+        st.session_state.query_cache = QueryCache()
+    with trace_render() as stages, use_query_cache(st.session_state.query_cache):
+        with timed('render'):
+            render()
+    if st.session_state.get("debug_timings"):
+        debug_panel(stages)
+
+def render():
+    with timed('setup_database'):
+        setup_database()
     
     # Navigation
     pages = {
@@ -337,8 +509,30 @@ def main():
     st.sidebar.title("Navigation")
     page = st.sidebar.radio("Go to", list(pages.keys()))
     
+    # Share one pooled connection across every query in this render
+    with get_storage().connection():
+        # Switch to a just-created user before the selector is drawn
+        if "pending_user_id" in st.session_state:
+            st.session_state.user_id = st.session_state.pop("pending_user_id")
+        user_selector()
+        show_failed_writes()
+        with timed('sidebar'):
+            render_sidebar()
+        with timed('page', page=page):
+            pages[page]()
+    st.sidebar.checkbox("Show render timings", key="debug_timings")
+
+# Per-stage latency of this render (stages nest, so they overlap), plus the
+# process-wide metrics for download
+def debug_panel(stages):
+    with st.sidebar.expander("Render timings", expanded=True):
+        st.table(summarize_trace(stages))
+        st.download_button("Metrics (Prometheus)", prometheus_text(), file_name="metrics.txt", key="metrics_prom")
+        st.download_button("Metrics (JSON)", to_json(), file_name="metrics.json", key="metrics_json")
+
+def render_sidebar():
     # Show user stats in sidebar if profile exists
-    user_data = load_user_data()
+    user_data = get_storage().load_user_data(current_user())
     if user_data:
         st.sidebar.subheader("Daily Targets")
         daily_calories = calculate_daily_calories(
@@ -347,11 +541,10 @@ def main():
         )
         
         # Get today's totals
-        food_log = load_food_log(datetime.now().strftime("%Y-%m-%d"))
-        workout_log = load_workout_log(datetime.now().strftime("%Y-%m-%d"))
+        summary = get_storage().load_daily_summary(datetime.now().strftime("%Y-%m-%d"), current_user())
         
-        calories_consumed = food_log['calories'].sum()
-        calories_burned = workout_log['calories_burned'].sum()
+        calories_consumed = summary['calories']
+        calories_burned = summary['calories_burned']
         
         # Display metrics
         st.sidebar.metric("Calorie Target", f"{daily_calories}")
@@ -361,14 +554,11 @@ def main():
                          f"{calories_consumed - calories_burned:.0f}")
         
         # Display macronutrient breakdown
-        if not food_log.empty:
+        if summary['food_entries']:
             st.sidebar.subheader("Today's Macros")
-            st.sidebar.metric("Protein", f"{food_log['protein'].sum():.1f}g")
-            st.sidebar.metric("Carbs", f"{food_log['carbs'].sum():.1f}g")
-            st.sidebar.metric("Fat", f"{food_log['fat'].sum():.1f}g")
-    
-    # Render selected page
-    pages[page]()
+            st.sidebar.metric("Protein", f"{summary['protein']:.1f}g")
+            st.sidebar.metric("Carbs", f"{summary['carbs']:.1f}g")
+            st.sidebar.metric("Fat", f"{summary['fat']:.1f}g")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""Bulk import/export throughput on a multi-million-row synthetic food log.
+
+Writes a synthetic log to CSV, imports it into a fresh database, exports
+it to every format and re-imports each export, reporting rows/sec against
+the targets below.
+
+    python benchmarks/bulk_import_export.py [--rows 2000000] [--formats csv,jsonl,parquet]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Minimum acceptable throughput, rows/sec. At these rates ten years of
+# history (a few million rows) imports or exports in well under a minute.
+TARGETS = {
+    "import": {"csv": 100_000, "jsonl": 80_000, "parquet": 150_000},
+    "export": {"csv": 150_000, "jsonl": 100_000, "parquet": 200_000},
+}
+
+MEALS = ["Breakfast", "Lunch", "Dinner", "Snack"]
+FOODS = ["Oatmeal", "Chicken salad", "Rice and beans", "Apple", "Greek yogurt", "Pasta", "Eggs", "Smoothie"]
+
+def write_synthetic_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    first_day = date(2015, 1, 1)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["date", "meal_type", "food_item", "calories", "protein", "carbs", "fat"])
+        for i in range(rows):
+            day = first_day + timedelta(days=i // 6)
+            writer.writerow([
+                day.isoformat(), rng.choice(MEALS), rng.choice(FOODS),
+                round(rng.uniform(50, 900), 1), round(rng.uniform(0, 60), 1),
+                round(rng.uniform(0, 120), 1), round(rng.uniform(0, 40), 1)
+            ])
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    count = fn(*args, **kwargs)
+    return count, time.perf_counter() - start
+
+def report(operation, file_format, count, seconds):
+    rate = count / seconds
+    target = TARGETS[operation][file_format]
+    status = "ok" if rate >= target else "BELOW TARGET"
+    print(f"{operation:<8}{file_format:<9}{count:>11,}{seconds:>10.2f}{rate:>14,.0f}{target:>12,}  {status}")
+    return rate >= target
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--formats", default="csv,jsonl,parquet")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ["HEALTH_TRACKER_DB"] = os.path.join(workdir, "health_tracker.db")
+    import data_manager
+    import bulk_io
+    data_manager.init_db()
+
+    source = os.path.join(workdir, "source.csv")
+    print(f"writing {args.rows:,} synthetic rows to {source}")
+    write_synthetic_csv(source, args.rows)
+
+    print(f"{'op':<8}{'format':<9}{'rows':>11}{'seconds':>10}{'rows/sec':>14}{'target':>12}")
+    passed = True
+    count, seconds = timed(bulk_io.import_file, source, "food_log", chunk_size=args.chunk_size)
+    passed &= report("import", "csv", count, seconds)
+
+    for file_format in args.formats.split(","):
+        path = os.path.join(workdir, f"export.{file_format}")
+        count, seconds = timed(bulk_io.export_table, "food_log", path, chunk_size=args.chunk_size)
+        passed &= report("export", file_format, count, seconds)
+
+        # Re-import into a clean table so every import sees the same starting size
+        with data_manager.transaction() as conn:
+            conn.execute("DELETE FROM food_log")
+        count, seconds = timed(bulk_io.import_file, path, "food_log", chunk_size=args.chunk_size)
+        passed &= report("import", file_format, count, seconds)
+
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Throughput of vectorized health scoring versus the per-record scorer.
+
+    python benchmarks/health_score.py [--rows 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("NUTRITION_BACKEND", "replay")
+
+import numpy as np
+import pandas as pd
+
+from nutrition_analyzer import NutritionAnalyzer
+
+def synthetic_records(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "calories": rng.gamma(4, 80, rows),
+        "sugar": rng.gamma(2, 8, rows),
+        "saturated_fat": rng.gamma(2, 2, rows),
+        "sodium": rng.gamma(3, 180, rows),
+        "protein": rng.gamma(2, 6, rows),
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--loop-rows", type=int, default=100_000,
+                        help="rows scored by the per-record loop (extrapolated)")
+    args = parser.parse_args()
+
+    analyzer = NutritionAnalyzer(cache=False)
+    df = synthetic_records(args.rows)
+
+    records = df.head(args.loop_rows).to_dict("records")
+    start = time.perf_counter()
+    loop_scores = [analyzer.calculate_health_score(record)["total_score"] for record in records]
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    binary = analyzer.score_many(df)
+    binary_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyzer.score_many(df, continuous=True, weights={"sugar": 2, "sodium": 1.5}, thresholds="low_sodium")
+    continuous_seconds = time.perf_counter() - start
+
+    assert np.allclose(binary["total_score"][:len(loop_scores)], loop_scores)
+
+    print(f"{'scorer':<34}{'rows':>10}{'seconds':>10}{'rows/sec':>14}")
+    print(f"{'calculate_health_score loop':<34}{len(records):>10}{loop_seconds:>10.3f}{len(records) / loop_seconds:>14,.0f}")
+    print(f"{'score_many (binary)':<34}{args.rows:>10}{binary_seconds:>10.3f}{args.rows / binary_seconds:>14,.0f}")
+    print(f"{'score_many (continuous, weighted)':<34}{args.rows:>10}{continuous_seconds:>10.3f}{args.rows / continuous_seconds:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
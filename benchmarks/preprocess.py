@@ -0,0 +1,75 @@
+"""Compare the upload preprocessing pipeline against the previous implementation.
+
+The previous path decoded the full photo, LANCZOS-resized it to 1024px and
+handed the PIL image to the Gemini SDK, which re-serialized it as lossless
+WebP. The current path decodes in JPEG draft mode and returns JPEG bytes.
+
+    python benchmarks/preprocess.py [--repeat 5] [--size 4032x3024]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("NUTRITION_BACKEND", "replay")
+
+from PIL import Image, ImageFilter
+
+from nutrition_analyzer import NutritionAnalyzer
+
+# A noisy, blurred gradient compresses about like a real phone photo
+def synthetic_photo(width, height, fmt="JPEG", orientation=6):
+    noise = Image.effect_noise((width // 4, height // 4), 64).resize((width, height))
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (noise, gradient, noise.filter(ImageFilter.GaussianBlur(3))))
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    image.save(buffer, format=fmt, quality=92, exif=exif.tobytes())
+    return buffer.getvalue()
+
+def legacy_pipeline(image_file):
+    image = Image.open(image_file)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    max_size = 1024
+    if max(image.size) > max_size:
+        ratio = max_size / max(image.size)
+        new_size = tuple(int(dim * ratio) for dim in image.size)
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+    # What the SDK uploads for an in-memory PIL image
+    buffer = io.BytesIO()
+    image.save(buffer, format="webp", lossless=True)
+    return buffer.getvalue()
+
+def measure(fn, data, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = fn(io.BytesIO(data))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), len(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", default="4032x3024", help="photo size, default 12MP")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    analyzer = NutritionAnalyzer(cache=False)
+    photos = {"JPEG": synthetic_photo(width, height, "JPEG"), "PNG": synthetic_photo(width, height, "PNG")}
+
+    print(f"{width}x{height} synthetic photos, median of {args.repeat} runs")
+    print(f"{'input':<8}{'pipeline':<12}{'latency (ms)':>14}{'payload (KB)':>14}")
+    for fmt, data in photos.items():
+        for name, fn in (("previous", legacy_pipeline), ("current", analyzer.preprocess_image)):
+            seconds, size = measure(fn, data, args.repeat)
+            print(f"{fmt:<8}{name:<12}{seconds * 1000:>14.1f}{size / 1024:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure Streamlit cold-start cost: module import times and first render per page.
+
+Every measurement runs in a fresh interpreter so nothing is already imported.
+
+    python benchmarks/startup.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "streamlit",
+    "pandas",
+    "plotly.express",
+    "PIL.Image",
+    "google.generativeai",
+    "data_manager",
+    "utils",
+    "nutrition_analyzer",
+]
+
+PAGES = ["Home", "User Profile", "Food Analyzer", "Exercise Tracker", "Progress Tracker"]
+
+IMPORT_SNIPPET = """
+import time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+# Times the cold first run of the app (which always lands on Home), the
+# first visit to the requested page, and a warm rerun of that page
+RENDER_SNIPPET = """
+import json, time, warnings
+warnings.simplefilter("ignore")
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+start = time.perf_counter()
+at.run()
+startup = time.perf_counter() - start
+start = time.perf_counter()
+at.sidebar.radio[0].set_value({page!r}).run()
+first_visit = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+rerun = time.perf_counter() - start
+print(json.dumps({{"startup": startup, "first_visit": first_visit, "rerun": rerun,
+                   "errors": [str(e.value) for e in at.exception]}}))
+"""
+
+def run_python(code, env):
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.update({
+        "HEALTH_TRACKER_DB": os.path.join(workdir, "health_tracker.db"),
+        "ANALYSIS_CACHE_DB": os.path.join(workdir, "analysis_cache.db"),
+        "NUTRITION_BACKEND": "replay",
+    })
+
+    results = {"imports": {}, "renders": {}}
+    for module in MODULES:
+        times = []
+        for _ in range(args.repeat):
+            try:
+                times.append(float(run_python(IMPORT_SNIPPET.format(module=module), env)))
+            except subprocess.CalledProcessError:
+                break
+        results["imports"][module] = statistics.median(times) if times else None
+
+    app = os.path.join(ROOT, "app.py")
+    for page in PAGES:
+        samples = [
+            json.loads(run_python(RENDER_SNIPPET.format(app=app, page=page), env))
+            for _ in range(args.repeat)
+        ]
+        results["renders"][page] = {
+            key: statistics.median(s[key] for s in samples)
+            for key in ("startup", "first_visit", "rerun")
+        }
+        results["renders"][page]["errors"] = samples[-1]["errors"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'module':<24}{'import (ms)':>12}")
+    for module, seconds in results["imports"].items():
+        value = f"{seconds * 1000:.1f}" if seconds is not None else "n/a"
+        print(f"{module:<24}{value:>12}")
+    print()
+    print(f"{'page':<20}{'app startup (ms)':>18}{'first visit (ms)':>18}{'rerun (ms)':>12}")
+    for page, timing in results["renders"].items():
+        print(f"{page:<20}{timing['startup'] * 1000:>18.1f}"
+              f"{timing['first_visit'] * 1000:>18.1f}{timing['rerun'] * 1000:>12.1f}")
+        for error in timing["errors"]:
+            print(f"  error: {error}")
+
+if __name__ == "__main__":
+    main()
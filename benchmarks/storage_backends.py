@@ -0,0 +1,273 @@
+"""The storage backends side by side: latency of each read and whether
+both return the same result.
+
+Seeds user 1's history into a benchmark SQLite database (see suite.py) and
+into a PostgreSQL database, then times the reads a render makes against
+each. Point --postgres (or HEALTH_TRACKER_DATABASE_URL) at a throwaway
+database: its tables are replaced when the seeded data does not match.
+
+    python benchmarks/storage_backends.py --postgres postgresql://localhost/bench [--size 100k] [--repeat 5]
+
+--check instead writes the same small history through both backends and
+compares every read, update and food search, plus a failed bulk insert and
+cache invalidation by a write from another process. It works in its own schema (storage_check),
+dropped afterwards, exits non-zero on a mismatch and is skipped (exit 0)
+when no database URL is given.
+
+    python benchmarks/storage_backends.py --check
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy as np
+import pandas as pd
+
+import data_manager
+from storage import PostgresBackend, SQLiteBackend, set_storage
+from suite import FIRST_DAY, MEALS_PER_DAY, ROWS_PER_USER, SIZES, _user_rows, measure, seed_database
+
+# Load user 1's seeded rows into Postgres unless they are already there
+def seed_postgres(backend, rows):
+    food_rows = min(rows, ROWS_PER_USER)
+    backend.init()
+    with backend.connection() as conn:
+        seeded = conn.execute("SELECT COUNT(*) FROM food_log WHERE user_id = 1").fetchone()[0]
+        if seeded == food_rows:
+            return
+        conn.execute("TRUNCATE food_log, workout_log, progress RESTART IDENTITY")
+    backend.save_user_data(data_manager.load_user_data())
+    for table, table_rows in _user_rows(np.random.default_rng(0), food_rows).items():
+        backend.bulk_insert(table, table_rows)
+    with backend.connection() as conn:
+        conn.execute("ANALYZE")
+
+def cases(rows):
+    user_days = min(rows, ROWS_PER_USER) // MEALS_PER_DAY
+    last_day = (FIRST_DAY + timedelta(days=user_days - 1)).isoformat()
+    day = lambda back: (FIRST_DAY + timedelta(days=max(user_days - back, 0))).isoformat()
+    return {
+        "load_user_data": lambda b: b.load_user_data(),
+        "load_daily_summary": lambda b: b.load_daily_summary(last_day),
+        "load_food_log[day]": lambda b: b.load_food_log(last_day),
+        "load_daily_totals[30d]": lambda b: sorted(b.load_daily_totals(day(30), last_day)),
+        "load_daily_totals[365d]": lambda b: sorted(b.load_daily_totals(day(365), last_day)),
+        "load_daily_trend[90d]": lambda b: b.load_daily_trend(day(90), last_day),
+        "load_progress_rollup[week]": lambda b: b.load_progress_rollup("week"),
+        "load_weight_change": lambda b: b.load_weight_change(),
+        "load_weight_series": lambda b: b.load_weight_series(),
+        "load_food_log_range[year]": lambda b: b.load_food_log_range(day(365), last_day),
+        "iter_log_rows[all]": lambda b: sum(len(batch) for batch in b.iter_log_rows("food_log")),
+    }
+
+# Results as frames, so rows of tuples, dicts and scalars compare alike
+def _frame(value):
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, dict):
+        value = [tuple(value.values())]
+    elif not isinstance(value, list):
+        value = [value]
+    return pd.DataFrame(value)
+
+def same(a, b):
+    try:
+        pd.testing.assert_frame_equal(_frame(a), _frame(b), check_dtype=False)
+    except AssertionError:
+        return False
+    return True
+
+CHECK_SCHEMA = "storage_check"
+
+# A small history with NULLs, repeated names and several entries per day,
+# as bulk_insert tuples for user 2 plus entries saved one at a time
+def _check_rows():
+    rng = random.Random(0)
+    food, workout, progress = [], [], []
+    for i in range(3000):
+        day = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        food.append((day, rng.choice(["Breakfast", "Lunch", "Dinner", None]),
+                     rng.choice(["Apple", "apple", "Chicken breast", "Rice"]), rng.uniform(10, 800),
+                     rng.uniform(0, 50), rng.uniform(0, 90), None if i % 7 == 0 else rng.uniform(0, 40)))
+        workout.append((day, "Cardio", "Running, 6 mph", rng.randint(10, 90), rng.uniform(50, 600)))
+        progress.append((day, None if i % 5 == 0 else rng.uniform(70, 90), rng.uniform(1500, 3000),
+                         rng.randint(0, 90)))
+    by_date = lambda row: row[0]
+    rows = {"food_log": sorted(food, key=by_date), "workout_log": sorted(workout, key=by_date),
+            "progress": sorted(progress, key=by_date)}
+    saved = [dict(zip(["date", "meal_type", "food_item", "calories", "protein", "carbs", "fat"], row))
+             for row in rows["food_log"][2000:]]
+    rows["food_log"] = rows["food_log"][:2000]
+    return rows, saved
+
+CHECK_FOODS = [
+    ("Chicken breast", "Acme", "100 g", 165.0, 31.0, 0.0, 3.6, "check"),
+    ("Chickpeas", None, "100 g", 164.0, 8.9, 27.0, 2.6, "check"),
+    ("Brown rice", "Uncle", "1 cup", 216.0, 5.0, 45.0, 1.8, "check"),
+]
+
+CHECK_PROFILE = {
+    "weight": 80.0, "height": 180.0, "age": 30, "gender": "Male", "target_weight": 75.0, "goal": "Lose Weight",
+    "exercise_level": "Moderately Active", "dietary_pref": "None", "allergies": ["nuts", "milk"],
+    "last_updated": "2024-01-01",
+}
+
+CHECK_READS = {
+    "list_users": lambda b: b.list_users(),
+    "load_user_data": lambda b: b.load_user_data(2),
+    "load_user_data[none]": lambda b: b.load_user_data(1),
+    "load_food_log[day]": lambda b: b.load_food_log("2024-03-05", 2),
+    "load_food_log[all]": lambda b: b.load_food_log(None, 2),
+    "load_food_log_range": lambda b: b.load_food_log_range("2024-02-01", "2024-04-30", ["date", "food_item", "fat"], 2),
+    "load_workout_log_range": lambda b: b.load_workout_log_range(None, "2024-05-01", None, 2),
+    "load_workout_log[day]": lambda b: b.load_workout_log("2024-06-01", 2),
+    "load_progress": lambda b: b.load_progress(2),
+    "load_progress_range": lambda b: b.load_progress_range("2024-05-01", None, ["date", "weight"], 2),
+    "load_daily_summary": lambda b: b.load_daily_summary("2024-06-01", 2),
+    "load_daily_summary[empty]": lambda b: b.load_daily_summary("2030-06-01", 2),
+    "load_daily_totals": lambda b: sorted(b.load_daily_totals("2024-01-01", "2024-12-31", 2)),
+    "load_daily_trend": lambda b: b.load_daily_trend("2024-03-01", "2024-05-31", 7, 2),
+    "load_progress_rollup[week]": lambda b: b.load_progress_rollup("week", None, None, 4, 2),
+    "load_progress_rollup[month]": lambda b: b.load_progress_rollup("month", "2024-03-15", "2024-09-10", 3, 2),
+    "load_weight_change": lambda b: b.load_weight_change(2),
+    "load_weight_change[none]": lambda b: b.load_weight_change(1),
+    "load_weight_series[raw]": lambda b: b.load_weight_series(200, 20000, 2),
+    "load_weight_series[weekly]": lambda b: b.load_weight_series(50, 100, 2),
+    "iter_log_rows": lambda b: [row for batch in b.iter_log_rows("food_log", "2024-05-01", "2024-08-01",
+                                                                 ["id", "date", "calories"], 333, 2) for row in batch],
+    "load_frequent_foods": lambda b: b.load_frequent_foods(2, 10),
+    "find_foods[all]": lambda b: b.find_foods(["chick", "br"], 10),
+    "find_foods[any]": lambda b: sorted(b.find_foods(["ch", "ri"], 10, match_all=False)),
+    "column_types": lambda b: sorted(b.column_types("progress").items()),
+}
+
+# A write from another process must reach this one's cached reads
+_REMOTE_WRITE = """
+import sys
+sys.path.insert(0, {root!r})
+from storage import PostgresBackend
+PostgresBackend({conninfo!r}).save_food_log({entry!r}, 2)
+"""
+
+def _cross_process(postgres, conninfo):
+    entry = {"date": "2024-06-02", "meal_type": "Lunch", "food_item": "Soup", "calories": 100.0,
+             "protein": 1.0, "carbs": 2.0, "fat": 3.0}
+    with data_manager.use_query_cache(data_manager.QueryCache()):
+        before = len(postgres.load_food_log(entry["date"], 2))
+        code = _REMOTE_WRITE.format(root=os.path.dirname(HERE), conninfo=conninfo, entry=entry)
+        subprocess.run([sys.executable, "-c", code], check=True)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if len(postgres.load_food_log(entry["date"], 2)) == before + 1:
+                return True
+            time.sleep(0.05)
+    return False
+
+# A batch with a row that cannot be bound must fail as a whole, leaving the
+# per-row summary trigger that bulk_insert swaps out in place
+def _failed_bulk_insert(backend):
+    good = ("2024-06-03", "Lunch", "Soup", 100.0, 1.0, 2.0, 3.0)
+    before = backend.load_daily_summary("2024-06-03", 2)["food_entries"]
+    try:
+        backend.bulk_insert("food_log", [good, good[:2] + ({"nested": 1},) + good[3:]], user_id=2)
+        return False
+    except Exception:
+        pass
+    backend.save_food_log(dict(zip(("date", "meal_type", "food_item", "calories", "protein", "carbs", "fat"), good)), 2)
+    return backend.load_daily_summary("2024-06-03", 2)["food_entries"] == before + 1
+
+def check(url):
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+
+    with psycopg.connect(url, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {CHECK_SCHEMA}")
+    conninfo = make_conninfo(url, options=f"-c search_path={CHECK_SCHEMA}")
+    failures = 0
+
+    def report(name, ok):
+        nonlocal failures
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<6}{name}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_manager.DB_PATH = os.path.join(directory, "check.db")
+        sqlite = set_storage(SQLiteBackend())
+        postgres = PostgresBackend(conninfo)
+        try:
+            rows, saved = _check_rows()
+            for backend in (sqlite, postgres):
+                backend.init()
+                backend.init()
+                backend.create_user("Alice")
+                backend.save_user_data(CHECK_PROFILE, 2)
+                backend.save_user_data({**CHECK_PROFILE, "weight": 81.0}, 2)
+                backend.save_user_data({**CHECK_PROFILE, "last_updated": "2024-02-01"}, 2)
+                for table, table_rows in rows.items():
+                    backend.bulk_insert(table, table_rows, batch_size=700, user_id=2)
+                backend.bulk_insert("foods", CHECK_FOODS, user_id=None)
+                for entry in saved:
+                    backend.save_food_log(entry, 2)
+                backend.save_workout_log({"date": "2024-06-01", "exercise_type": "Strength", "exercise": "Squats",
+                                          "duration": 30, "calories_burned": 100.0}, 2)
+                backend.save_progress({"date": "2024-06-01", "weight": 77.7, "calories_consumed": 2000,
+                                       "exercise_minutes": 30}, 2)
+
+            for name, read in CHECK_READS.items():
+                report(name, same(read(sqlite), read(postgres)))
+            workouts = sqlite.load_workout_log_range(None, None, ["id", "duration"], 2)
+            burned = list(zip((workouts["duration"] * 3.3).round(1).tolist(), workouts["id"].tolist()))
+            report("update_calories_burned",
+                   sqlite.update_calories_burned(iter(burned), 2) == postgres.update_calories_burned(iter(burned), 2)
+                   and same(sqlite.load_workout_log(None, 2), postgres.load_workout_log(None, 2))
+                   and same(sqlite.load_daily_summary("2024-06-01", 2), postgres.load_daily_summary("2024-06-01", 2)))
+            report("failed bulk_insert keeps the summary triggers",
+                   all(_failed_bulk_insert(backend) for backend in (sqlite, postgres))
+                   and same(sqlite.load_daily_summary("2024-06-03", 2), postgres.load_daily_summary("2024-06-03", 2)))
+            report("cross-process invalidation", _cross_process(postgres, conninfo))
+        finally:
+            postgres.close()
+            data_manager.close_pools()
+            with psycopg.connect(url, autocommit=True) as conn:
+                conn.execute(f"DROP SCHEMA IF EXISTS {CHECK_SCHEMA} CASCADE")
+    print(f"{failures} of {len(CHECK_READS) + 3} checks failed" if failures else "all checks passed")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--postgres", default=os.getenv("HEALTH_TRACKER_DATABASE_URL"))
+    parser.add_argument("--size", default="100k", choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"))
+    parser.add_argument("--check", action="store_true", help="compare the backends' results on a small history")
+    args = parser.parse_args()
+    if args.check:
+        if not args.postgres:
+            print("skipped: no PostgreSQL database (set HEALTH_TRACKER_DATABASE_URL or --postgres)")
+            return
+        sys.exit(1 if check(args.postgres) else 0)
+    if not args.postgres:
+        parser.error("a PostgreSQL URL is needed: --postgres or HEALTH_TRACKER_DATABASE_URL")
+
+    rows = SIZES[args.size]
+    data_manager.DB_PATH = seed_database(rows, args.data_dir)
+    sqlite, postgres = SQLiteBackend(), PostgresBackend(args.postgres)
+    seed_postgres(postgres, rows)
+
+    print(f"{'case':<28}{'sqlite (ms)':>12}{'postgres (ms)':>15}{'same':>6}")
+    for name, fn in cases(rows).items():
+        timings = [measure(lambda: fn(backend), args.repeat)["median"] * 1000 for backend in (sqlite, postgres)]
+        print(f"{name:<28}{timings[0]:>12.2f}{timings[1]:>15.2f}{'yes' if same(fn(sqlite), fn(postgres)) else 'NO':>6}")
+    postgres.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Benchmark suite for data_manager, utils and the analyzer pipeline.
+
+Seeds synthetic databases (cached under benchmarks/.data, so only the first
+run pays for seeding), times every case and saves the results as JSON.
+The model is the offline replay backend, so nothing touches the network.
+
+    python benchmarks/suite.py [--sizes 1k,100k,10m] [--filter food_log] [--repeat 5]
+    python benchmarks/suite.py --compare benchmarks/results/<earlier run>.json
+
+With --compare, cases more than --threshold slower than the baseline are
+flagged and the exit status is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("NUTRITION_BACKEND", "replay")
+
+import numpy as np
+
+import data_manager
+from health_score import synthetic_records
+from preprocess import synthetic_photo
+
+SIZES = {"1k": 1_000, "100k": 100_000, "10m": 10_000_000}
+
+# Bump when the seeded data changes so cached databases are rebuilt
+SEED_VERSION = 1
+
+# Food log rows per user; bigger databases get more users rather than
+# centuries of history for one
+ROWS_PER_USER = 100_000
+MEALS_PER_DAY = 6
+FIRST_DAY = date(2015, 1, 1)
+
+MEALS = np.array(["Breakfast", "Lunch", "Dinner", "Snack"])
+FOODS = np.array(["Oatmeal", "Chicken salad", "Rice and beans", "Apple", "Greek yogurt", "Pasta", "Eggs", "Smoothie"])
+EXERCISES = np.array(["Running", "Cycling", "Swimming", "Walking", "Weight Training", "Yoga"])
+
+def _days(count):
+    return [(FIRST_DAY + timedelta(days=i)).isoformat() for i in range(count)]
+
+# food_log, workout_log and progress for one user, as bulk_insert tuples
+def _user_rows(rng, food_rows):
+    days = _days(food_rows // MEALS_PER_DAY + 1)
+    food_days = np.arange(food_rows) // MEALS_PER_DAY
+    food = zip(
+        (days[d] for d in food_days), MEALS[rng.integers(0, len(MEALS), food_rows)].tolist(),
+        FOODS[rng.integers(0, len(FOODS), food_rows)].tolist(),
+        np.round(rng.uniform(50, 900, food_rows), 1).tolist(), np.round(rng.uniform(0, 60, food_rows), 1).tolist(),
+        np.round(rng.uniform(0, 120, food_rows), 1).tolist(), np.round(rng.uniform(0, 40, food_rows), 1).tolist()
+    )
+    workout_rows = food_rows // 3
+    workout = zip(
+        (days[d] for d in np.arange(workout_rows) // 2), EXERCISES[rng.integers(0, len(EXERCISES), workout_rows)].tolist(),
+        EXERCISES[rng.integers(0, len(EXERCISES), workout_rows)].tolist(),
+        rng.integers(10, 90, workout_rows).tolist(), np.round(rng.uniform(50, 800, workout_rows), 1).tolist()
+    )
+    weights = 90 - np.cumsum(rng.normal(0.01, 0.2, len(days)))
+    progress = zip(days, np.round(weights, 1).tolist(), [0] * len(days), [0] * len(days))
+    return {"food_log": food, "workout_log": workout, "progress": progress}
+
+# Build (or reuse) a database with `rows` food_log rows
+def seed_database(rows, data_dir, seed=0):
+    path = os.path.join(data_dir, f"health_tracker_{rows}_s{seed}_v{SEED_VERSION}.db")
+    if os.path.exists(path):
+        # Databases seeded before a schema change pick up the new migrations
+        data_manager.DB_PATH = path
+        data_manager.migrate()
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    building = path + ".building"
+    for leftover in (building, building + "-wal", building + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+    data_manager.DB_PATH = building
+    data_manager.init_db()
+    data_manager.save_user_data({
+        "weight": 80.0, "height": 178.0, "age": 35, "gender": "Male", "target_weight": 75.0,
+        "goal": "Weight Loss", "exercise_level": "Moderate", "dietary_pref": "None", "allergies": [],
+        "last_updated": FIRST_DAY.isoformat()
+    })
+    rng = np.random.default_rng(seed)
+    remaining = rows
+    user_id = data_manager.DEFAULT_USER_ID
+    while remaining > 0:
+        food_rows = min(remaining, ROWS_PER_USER)
+        for table, table_rows in _user_rows(rng, food_rows).items():
+            data_manager.bulk_insert(table, table_rows, user_id=user_id)
+        remaining -= food_rows
+        if remaining > 0:
+            user_id = data_manager.create_user(f"User {user_id + 1}")
+    with data_manager.connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("ANALYZE")
+    data_manager.close_pools()
+    os.replace(building, path)
+    return path
+
+# Per-call seconds over `repeat` samples. Fast cases are looped (timeit
+# style) until a sample takes at least `min_sample` seconds, so timer noise
+# does not dominate sub-millisecond results.
+def measure(fn, repeat, min_sample=0.02):
+    start = time.perf_counter()
+    fn()  # warm up caches and lazy imports
+    number = max(1, int(min_sample / max(time.perf_counter() - start, 1e-7)))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {"median": statistics.median(times), "min": min(times), "repeat": repeat, "number": number}
+
+# Cases against a seeded database; user 1 always has the full history
+def database_cases(rows):
+    user_days = min(rows, ROWS_PER_USER) // MEALS_PER_DAY
+    last_day = (FIRST_DAY + timedelta(days=user_days - 1)).isoformat()
+    last_year = (FIRST_DAY + timedelta(days=max(user_days - 365, 0))).isoformat()
+    last_month = (FIRST_DAY + timedelta(days=max(user_days - 30, 0))).isoformat()
+
+    def daily_totals_from_log():
+        with data_manager.connection() as conn:
+            conn.execute(
+                "SELECT date, SUM(calories), SUM(protein) FROM food_log "
+                "WHERE user_id = 1 AND date BETWEEN ? AND ? GROUP BY date", (last_month, last_day)
+            ).fetchall()
+
+    return {
+        "load_food_log[day]": lambda: data_manager.load_food_log(last_day),
+        "load_food_log_range[year]": lambda: data_manager.load_food_log_range(last_year, last_day),
+        "load_food_log_range[year,calories]": lambda: data_manager.load_food_log_range(
+            last_year, last_day, columns=["date", "calories"]),
+        "load_log_typed[year]": lambda: data_manager.load_log_typed("food_log", last_year, last_day),
+        "load_workout_log[day]": lambda: data_manager.load_workout_log(last_day),
+        "load_progress": lambda: data_manager.load_progress(),
+        "load_progress_rollup[week]": lambda: data_manager.load_progress_rollup("week"),
+        "load_weight_series": lambda: data_manager.load_weight_series(),
+        "load_daily_summary": lambda: data_manager.load_daily_summary(last_day),
+        "daily_totals_from_log[month]": daily_totals_from_log,
+        "load_user_data": lambda: data_manager.load_user_data(),
+    }
+
+# Cases that do not depend on the database size
+def standalone_cases(data_dir):
+    from nutrition_analyzer import IncrementalJSONParser, NutritionAnalyzer, get_analysis_prompt, parse_json_response
+    from model_backends import CANNED_RESPONSES, ReplayBackend
+    import utils
+
+    analyzer = NutritionAnalyzer(cache=False, backend=ReplayBackend())
+    photos = {
+        "jpeg_12mp": synthetic_photo(4032, 3024, "JPEG"),
+        "jpeg_3mp": synthetic_photo(2016, 1512, "JPEG"),
+        "png_12mp": synthetic_photo(4032, 3024, "PNG"),
+    }
+    food_text = "Here is the analysis:\n```json\n" + json.dumps(CANNED_RESPONSES["food"], indent=2) + "\n```"
+    label_text = json.dumps(CANNED_RESPONSES["label"])
+    prompt = get_analysis_prompt("Food Image")
+    image = analyzer.preprocess_image(io.BytesIO(photos["jpeg_3mp"]))
+    records = synthetic_records(10_000).to_dict("records")
+    frame = synthetic_records(1_000_000)
+    profiles = synthetic_records(100_000).assign(
+        weight=lambda df: 50 + df["protein"], height=175.0, age=40, gender="Female",
+        exercise_level="Moderate", goal="Maintenance"
+    )
+
+    def stream_parse():
+        parser = IncrementalJSONParser()
+        for start in range(0, len(food_text), 64):
+            parser.feed(food_text[start:start + 64])
+        parser.result()
+
+    # The analyzer prints every raw response
+    def extract():
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyzer.extract_nutrition_info(image, prompt)
+
+    def bulk_insert_50k():
+        path = os.path.join(data_dir, "bulk_insert.db")
+        for leftover in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        data_manager.DB_PATH = path
+        data_manager.init_db()
+        rows = _user_rows(np.random.default_rng(0), 50_000)["food_log"]
+        data_manager.bulk_insert("food_log", rows)
+        data_manager.close_pools()
+
+    cases = {f"preprocess_image[{name}]": (lambda data=data: analyzer.preprocess_image(io.BytesIO(data)))
+             for name, data in photos.items()}
+    cases.update({
+        "parse_json_response[food]": lambda: parse_json_response(food_text),
+        "parse_json_response[label]": lambda: parse_json_response(label_text),
+        "IncrementalJSONParser[64b chunks]": stream_parse,
+        "extract_nutrition_info[replay]": extract,
+        "calculate_health_score[10k records]": lambda: [analyzer.calculate_health_score(r) for r in records],
+        "score_many[1m rows]": lambda: analyzer.score_many(frame),
+        "metabolic_profile_many[100k]": lambda: utils.metabolic_profile_many(profiles),
+        "bulk_insert[50k food_log, new db]": bulk_insert_50k,
+    })
+    return cases
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'case':<52}{'baseline (ms)':>14}{'now (ms)':>12}{'ratio':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result["median"] / before["median"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<52}{before['median'] * 1000:>14.3f}{result['median'] * 1000:>12.3f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1k,100k", help=f"database sizes, from {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"))
+    parser.add_argument("--save", default=None, help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown ratio flagged as a regression")
+    args = parser.parse_args()
+
+    unknown = [size for size in args.sizes.split(",") if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    results = {}
+
+    def run(name, fn):
+        if args.filter not in name:
+            return
+        results[name] = measure(fn, args.repeat)
+        print(f"{name:<52}{results[name]['median'] * 1000:>12.3f}{results[name]['min'] * 1000:>12.3f}")
+
+    print(f"{'case':<52}{'median (ms)':>12}{'min (ms)':>12}")
+    for size in args.sizes.split(","):
+        path = seed_database(SIZES[size], args.data_dir)
+        data_manager.DB_PATH = path
+        for name, fn in database_cases(SIZES[size]).items():
+            run(f"{name}@{size}", fn)
+        data_manager.close_pools()
+    for name, fn in standalone_cases(args.data_dir).items():
+        run(name, fn)
+
+    save = args.save or os.path.join(HERE, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+    with open(save, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"\nSaved {len(results)} results to {save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Latency and memory of the typed log loader against read_sql_query.
+
+Loads a user's whole food log from a seeded benchmark database (see
+suite.py) four ways: the old `SELECT *` through read_sql_query, the
+projected load_food_log_range, and load_log_typed with NumPy and with
+Arrow-backed columns.
+
+    python benchmarks/typed_loading.py [--size 100k] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pandas as pd
+
+import data_manager
+from suite import SIZES, seed_database
+
+def select_star():
+    with data_manager.connection() as conn:
+        return pd.read_sql_query("SELECT * FROM food_log WHERE user_id = 1", conn)
+
+LOADERS = {
+    "read_sql_query SELECT *": select_star,
+    "load_food_log_range": lambda: data_manager.load_food_log_range(),
+    "load_log_typed": lambda: data_manager.load_log_typed("food_log"),
+    "load_log_typed (arrow)": lambda: data_manager.load_log_typed("food_log", arrow=True),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="100k", choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"))
+    args = parser.parse_args()
+
+    data_manager.DB_PATH = seed_database(SIZES[args.size], args.data_dir)
+
+    print(f"{'loader':<26}{'rows':>9}{'median (ms)':>13}{'frame (MB)':>12}{'peak (MB)':>11}")
+    for name, load in LOADERS.items():
+        frame = load()
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        load()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        size = frame.memory_usage(deep=True).sum()
+        print(f"{name:<26}{len(frame):>9,}{statistics.median(times) * 1000:>13.1f}"
+              f"{size / 1e6:>12.2f}{peak / 1e6:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import csv
+import json
+import os
+from itertools import islice
+from data_manager import DEFAULT_USER_ID, TABLE_COLUMNS
+from storage import get_storage
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Work out the file format from an explicit name or the file extension
+def detect_format(path, file_format=None):
+    file_format = (file_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    if file_format in ('ndjson', 'json'):
+        file_format = 'jsonl'
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}'. Choose one of: {', '.join(FORMATS)}")
+    return file_format
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("Parquet support needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+# Arrow schema for a projection, taken from the declared column types
+def _arrow_schema(pa, table, columns):
+    declared = get_storage().column_types(table)
+    types = {'INTEGER': pa.int64(), 'REAL': pa.float64()}
+    return pa.schema([(column, types.get(declared.get(column), pa.string())) for column in columns])
+
+# Stream records (dicts) out of a CSV, JSON Lines or Parquet file in chunks
+def read_records(path, file_format=None, chunk_size=50000, delimiter=','):
+    file_format = detect_format(path, file_format)
+    if file_format == 'parquet':
+        pa = _require_pyarrow()
+        for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    with open(path, newline='' if file_format == 'csv' else None, encoding='utf-8') as f:
+        if file_format == 'csv':
+            records = csv.DictReader(f, delimiter=delimiter)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+# Stream row tuples in `columns` order straight from a file, skipping the
+# per-record dicts read_records builds. Missing columns and empty CSV
+# cells come back as None.
+def read_rows(path, columns, file_format=None, chunk_size=50000, delimiter=','):
+    file_format = detect_format(path, file_format)
+    if file_format == 'parquet':
+        pa = _require_pyarrow()
+        parquet_file = pa.parquet.ParquetFile(path)
+        present = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=present):
+            values = {column: batch.column(column).to_pylist() for column in present}
+            missing = [None] * batch.num_rows
+            yield list(zip(*(values.get(column, missing) for column in columns)))
+        return
+
+    with open(path, newline='' if file_format == 'csv' else None, encoding='utf-8') as f:
+        if file_format == 'csv':
+            reader = csv.reader(f, delimiter=delimiter)
+            header = next(reader, [])
+            positions = {name: index for index, name in enumerate(header)}
+            indexes = [positions.get(column) for column in columns]
+
+            def convert(row):
+                values = tuple(row[i] if i is not None and i < len(row) else None for i in indexes)
+                return tuple(None if value == '' else value for value in values) if '' in values else values
+
+            rows = map(convert, reader)
+        else:
+            rows = (tuple(map(json.loads(line).get, columns)) for line in f if line.strip())
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+# Import a file into one of a user's log tables; returns the number of rows
+# added. Source ids are ignored and missing columns are stored as NULL. Numeric
+# strings from CSV are stored as numbers of the columns' declared types.
+def import_file(path, table, file_format=None, chunk_size=50000, user_id=DEFAULT_USER_ID):
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table '{table}'")
+    columns = [column for column in TABLE_COLUMNS[table] if column != 'id']
+    rows = (row for chunk in read_rows(path, columns, file_format, chunk_size) for row in chunk)
+    return get_storage().bulk_insert(table, rows, batch_size=chunk_size, user_id=user_id)
+
+# Stream a user's log table (optionally a date range) to a file; returns the
+# row count. user_id=None exports every user's rows.
+def export_table(table, path, file_format=None, start=None, end=None, columns=None, chunk_size=50000,
+                 user_id=DEFAULT_USER_ID):
+    file_format = detect_format(path, file_format)
+    columns = list(columns or TABLE_COLUMNS[table])
+    batches = get_storage().iter_log_rows(table, start, end, columns, batch_size=chunk_size, user_id=user_id)
+    total = 0
+
+    if file_format == 'parquet':
+        pa = _require_pyarrow()
+        schema = _arrow_schema(pa, table, columns)
+        with pa.parquet.ParquetWriter(path, schema) as writer:
+            for batch in batches:
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                total += len(batch)
+        return total
+
+    with open(path, 'w', newline='' if file_format == 'csv' else None, encoding='utf-8') as f:
+        if file_format == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for batch in batches:
+                writer.writerows(batch)
+                total += len(batch)
+        else:
+            for batch in batches:
+                f.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+                total += len(batch)
+    return total
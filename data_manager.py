@@ -1,168 +1,1730 @@
+import atexit
+import contextvars
+import copy
+import functools
+import inspect
+import os
+import queue
 import sqlite3
-import pandas as pd
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import groupby, islice
+from metrics import increment, timed
 
-# Initialize SQLite database
-def init_db():
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    
-    # Create tables if they don't exist
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            weight REAL,
-            height REAL,
-            age INTEGER,
-            gender TEXT,
-            target_weight REAL,
-            goal TEXT,
-            exercise_level TEXT,
-            dietary_pref TEXT,
-            allergies TEXT,
-            last_updated TEXT
+DB_PATH = os.getenv("HEALTH_TRACKER_DB", 'data/health_tracker.db')
+
+# Applied to every new connection. WAL lets readers run alongside a writer,
+# so concurrent Streamlit sessions no longer block each other on the file lock.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+)
+
+# Connection pool
+class ConnectionPool:
+    def __init__(self, path, max_size=8, timeout=30.0, cached_statements=256):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.opened = 0
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @timed('db_connect')
+    def _open(self):
+        # Connections are handed between threads by the pool but only ever
+        # used by one thread at a time. The statement cache keeps the
+        # compiled form of every query below, so they act as prepared statements.
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
         )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS food_log (
-            id INTEGER PRIMARY KEY,
-            date TEXT,
-            meal_type TEXT,
-            food_item TEXT,
-            calories REAL,
-            protein REAL,
-            carbs REAL,
-            fat REAL
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        # Nested calls on the same thread share the outer connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Get the process-wide pool for a database file
+def get_pool(path=None):
+    path = path or DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+# Borrow a pooled connection
+def connection():
+    return get_pool().connection()
+
+# Borrow a pooled connection and commit (or roll back) around the block
+@contextmanager
+def transaction():
+    with connection() as conn:
+        with conn:
+            yield conn
+
+# Close all pooled connections
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+# Write-behind for the log inserts. Writes are queued and committed by a
+# background thread, many per transaction, so saving an entry returns in
+# microseconds and the database sees far fewer commits under load. The
+# queue is bounded (put blocks when it is full), flushed at exit, and
+# readers of a table wait for the writes already queued for it, so a
+# session always sees what it just saved. A save is not confirmed: a row
+# that fails to commit is kept in `failed` and reported afterwards, by
+# take_failed_writes on the user's next page view or by flush_writes.
+class WriteBehindQueue:
+    def __init__(self, max_size=10000, max_batch=500):
+        self.max_batch = max_batch
+        self.failed = []
+        self._queue = queue.Queue(maxsize=max_size)
+        self._cond = threading.Condition()
+        # Keeps sequence numbers in queue order
+        self._put_lock = threading.Lock()
+        self._sequence = 0
+        self._enqueued = {}
+        self._committed = {}
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, table, sql, params):
+        with self._put_lock:
+            with self._cond:
+                self._sequence += 1
+                self._enqueued[table] = self._sequence
+            self._queue.put((self._sequence, table, sql, params))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        with timed('write_behind_commit'):
+            try:
+                with transaction() as conn:
+                    # Consecutive writes of the same statement go in one executemany
+                    for sql, items in groupby(batch, key=lambda item: item[2]):
+                        conn.executemany(sql, [item[3] for item in items])
+            except sqlite3.Error:
+                # Retry one by one so a bad row does not lose the whole batch
+                for item in batch:
+                    try:
+                        with transaction() as conn:
+                            conn.execute(item[2], item[3])
+                    except sqlite3.Error as e:
+                        with self._cond:
+                            self.failed.append((item[1], item[3], e))
+        increment('write_behind_rows', len(batch))
+        with self._cond:
+            for sequence, table, _, _ in batch:
+                self._committed[table] = max(self._committed.get(table, 0), sequence)
+            self._cond.notify_all()
+
+    # Block until every write queued so far for `tables` (default: all) is
+    # committed; returns False on timeout
+    def wait(self, tables=None, timeout=None):
+        with self._cond:
+            targets = {
+                table: sequence for table, sequence in self._enqueued.items()
+                if tables is None or table in tables
+            }
+            return self._cond.wait_for(
+                lambda: all(self._committed.get(table, 0) >= sequence for table, sequence in targets.items()),
+                timeout
+            )
+
+    # Remove and return the failed writes, (table, params, error) each, of
+    # one user (default: all). The user id is the last insert parameter.
+    def take_failed(self, user_id=None):
+        with self._cond:
+            taken = [item for item in self.failed if user_id is None or item[1][-1] == user_id]
+            self.failed = [item for item in self.failed if item not in taken]
+        return taken
+
+    # Commit everything queued and stop the writer thread
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+# Switch the log inserts (save_food_log, save_workout_log, save_progress) to
+# write-behind. Also enabled by init_db when HEALTH_TRACKER_WRITE_BEHIND=1.
+def enable_write_behind(max_size=10000, max_batch=500):
+    global _write_behind
+    with _write_behind_lock:
+        if _write_behind is None:
+            _write_behind = WriteBehindQueue(max_size, max_batch)
+            atexit.register(disable_write_behind)
+
+# Commit the queued writes and go back to synchronous inserts
+def disable_write_behind():
+    global _write_behind
+    with _write_behind_lock:
+        writer, _write_behind = _write_behind, None
+    if writer is not None:
+        writer.close()
+        _raise_failed(writer)
+
+# Wait for the queued writes to be committed
+def flush_writes(timeout=None):
+    writer = _write_behind
+    if writer is not None:
+        if not writer.wait(timeout=timeout):
+            raise ValueError(f"Queued writes were not committed within {timeout}s")
+        _raise_failed(writer)
+
+def _raise_failed(writer):
+    failed = writer.take_failed()
+    if failed:
+        raise ValueError(f"{len(failed)} queued write(s) failed, first: {failed[0][2]}")
+
+# Queued writes of a user that failed to commit after their save returned,
+# as (table, params, error); each is returned once
+def take_failed_writes(user_id):
+    writer = _write_behind
+    if writer is None:
+        return []
+    return writer.take_failed(user_id)
+
+def _write_log(table, sql, params):
+    writer = _write_behind
+    if writer is not None:
+        writer.put(table, sql, params)
+        return
+    with transaction() as conn:
+        conn.execute(sql, params)
+
+# Read-your-writes: let queued writes to `tables` land before reading them
+def _await_writes(*tables):
+    writer = _write_behind
+    if writer is not None:
+        writer.wait(tables)
+
+# Query result cache. Every write bumps a version counter for the table and
+# user it touched, and for the date when it has one; a cached result is
+# served only while the counters it was read under are unchanged and it is
+# younger than the cache's TTL, which catches writes made by other processes.
+_versions = {}
+_versions_lock = threading.Lock()
+
+# Counter keys are (db, table, user, date); these stand in for the date
+_ANY_DATE = '*'
+_ALL_DATES = '**'
+
+# Names the database the version counters and cached results belong to:
+# the active storage backend's scope (the SQLite path, or the PostgreSQL URL)
+def _cache_scope():
+    from storage import get_storage
+    return get_storage().scope
+
+# Record a write to `table`. Without a date (bulk loads, deletes) every
+# cached read of the user's table is invalidated; user_id=None means every
+# user.
+def table_changed(table, user_id=None, date=None):
+    db = _cache_scope()
+    with _versions_lock:
+        for key in ((db, table, user_id, _ANY_DATE), (db, table, user_id, date or _ALL_DATES)):
+            _versions[key] = _versions.get(key, 0) + 1
+
+# The counters a read of `tables` depends on. A one-date read sees writes to
+# that date and undated writes; any other read sees every write.
+def _read_versions(tables, user_id, date=None):
+    db = _cache_scope()
+    keys = []
+    for table in tables:
+        for user in (user_id, None):
+            if date:
+                keys += [(db, table, user, date), (db, table, user, _ALL_DATES)]
+            else:
+                keys.append((db, table, user, _ANY_DATE))
+    with _versions_lock:
+        return tuple(_versions.get(key, 0) for key in keys)
+
+# Bounded LRU of loader results, meant to live for one Streamlit session (see
+# use_query_cache) so reruns caused by unrelated widgets skip SQLite
+class QueryCache:
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored, expires, value = entry
+            if stored != versions or time.monotonic() > expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, versions, value):
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+_query_cache = contextvars.ContextVar('query_cache', default=None)
+
+# Serve the cached loaders from `cache` inside the block
+@contextmanager
+def use_query_cache(cache):
+    token = _query_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _query_cache.reset(token)
+
+# Cache a loader's results in the active QueryCache. The loader reads
+# `tables` for its user_id argument, and for its date argument when it
+# takes one. Callers get a copy, so mutating a result leaves the cache intact.
+def cached_query(*tables):
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = _query_cache.get()
+            if cache is None:
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            key = (_cache_scope(), fn.__name__) + tuple(
+                tuple(value) if isinstance(value, list) else value for value in arguments.values()
+            )
+            # Read the counters first: a write landing during the query
+            # leaves the entry already out of date
+            versions = _read_versions(tables, arguments['user_id'], arguments.get('date'))
+            entry = cache.get(key, versions)
+            if entry is not None:
+                increment('query_cache', result='hit')
+                return copy.deepcopy(entry[2])
+            increment('query_cache', result='miss')
+            value = fn(*args, **kwargs)
+            cache.put(key, versions, value)
+            return copy.deepcopy(value)
+        return wrapper
+    return decorate
+
+# Columns that may be projected by the range loaders
+TABLE_COLUMNS = {
+    'food_log': ('id', 'date', 'meal_type', 'food_item', 'calories', 'protein', 'carbs', 'fat'),
+    'workout_log': ('id', 'date', 'exercise_type', 'exercise', 'duration', 'calories_burned'),
+    'progress': ('id', 'date', 'weight', 'calories_consumed', 'exercise_minutes'),
+}
+
+# Log rows older than this many days are moved to the archive files by
+# archive_logs, which init_db runs when HEALTH_TRACKER_ARCHIVE_DAYS is set.
+# Archived rows store the date as a day number (days since 1970-01-01) and
+# these repeated strings as ids into a per-file labels table.
+ARCHIVE_DAYS = int(os.getenv("HEALTH_TRACKER_ARCHIVE_DAYS") or 730)
+ARCHIVE_LABELS = {
+    'food_log': ('meal_type', 'food_item'),
+    'workout_log': ('exercise_type', 'exercise'),
+    'progress': (),
+}
+EPOCH_JULIAN_DAY = 2440587.5
+
+# Archive files live next to the database, one per year for all log tables
+def archive_dir(db_path=None):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path or get_pool().path)), 'archive')
+
+def _day_number(date_text):
+    return datetime.strptime(date_text, '%Y-%m-%d').toordinal() - 719163
+
+# Bucket start for each progress rollup period, as SQL over a date expression
+ROLLUP_PERIODS = {
+    'week': "date({date}, 'weekday 0', '-6 days')",
+    'month': "strftime('%Y-%m-01', {date})",
+}
+
+# Add one progress row to its bucket. x is the day offset inside the bucket,
+# so sx/sxx/sxy give the least-squares weight trend without revisiting rows.
+_ROLLUP_ADD = '''
+    INSERT INTO progress_rollup (user_id, period, period_start, n, weight_min, weight_max, weight_sum, sx, sxx, sxy)
+    SELECT NEW.user_id, '{period}', bucket, 1, NEW.weight, NEW.weight, NEW.weight, x, x * x, x * NEW.weight
+    FROM (SELECT {bucket} AS bucket, julianday(NEW.date) - julianday({bucket}) AS x)
+    WHERE NEW.weight IS NOT NULL
+    ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+        n = n + 1,
+        weight_min = MIN(weight_min, excluded.weight_min),
+        weight_max = MAX(weight_max, excluded.weight_max),
+        weight_sum = weight_sum + excluded.weight_sum,
+        sx = sx + excluded.sx,
+        sxx = sxx + excluded.sxx,
+        sxy = sxy + excluded.sxy;
+'''
+
+# Rebuild the bucket a row belonged to from the live rows (migration 4,
+# replaced by _ROLLUP_REMOVE once rows could be archived)
+_ROLLUP_REBUILD = '''
+    DELETE FROM progress_rollup
+    WHERE user_id = {row}.user_id AND period = '{period}' AND period_start = {bucket};
+    INSERT INTO progress_rollup (user_id, period, period_start, n, weight_min, weight_max, weight_sum, sx, sxx, sxy)
+    SELECT user_id, '{period}', bucket, COUNT(*), MIN(weight), MAX(weight), SUM(weight),
+           SUM(x), SUM(x * x), SUM(x * weight)
+    FROM (
+        SELECT user_id, weight, {bucket} AS bucket, julianday(date) - julianday({bucket}) AS x
+        FROM progress
+        WHERE user_id = {row}.user_id AND weight IS NOT NULL
+          AND date >= {bucket} AND date < date({bucket}, '+{length}')
+    )
+    GROUP BY user_id;
+'''
+
+_ROLLUP_BACKFILL = '''
+    INSERT INTO progress_rollup (user_id, period, period_start, n, weight_min, weight_max, weight_sum, sx, sxx, sxy)
+    SELECT user_id, '{period}', bucket, COUNT(*), MIN(weight), MAX(weight), SUM(weight),
+           SUM(x), SUM(x * x), SUM(x * weight)
+    FROM (
+        SELECT user_id, weight, {bucket} AS bucket, julianday(date) - julianday({bucket}) AS x
+        FROM progress WHERE weight IS NOT NULL
+    )
+    GROUP BY user_id, bucket;
+'''
+
+# Take one progress row out of its bucket. The sums are subtracted, so rows
+# moved to the archive stay counted; min/max are only recomputed when the
+# row held one, from the bucket's live rows and its archived_min/max.
+_ROLLUP_REMOVE = '''
+    UPDATE progress_rollup SET
+        n = n - 1,
+        weight_sum = weight_sum - OLD.weight,
+        sx = sx - ({x}),
+        sxx = sxx - ({x}) * ({x}),
+        sxy = sxy - ({x}) * OLD.weight,
+        weight_min = CASE WHEN OLD.weight > weight_min THEN weight_min ELSE (
+            SELECT MIN(weight) FROM ({live} UNION ALL SELECT archived_min)
+        ) END,
+        weight_max = CASE WHEN OLD.weight < weight_max THEN weight_max ELSE (
+            SELECT MAX(weight) FROM ({live} UNION ALL SELECT archived_max)
+        ) END
+    WHERE user_id = OLD.user_id AND period = '{period}' AND period_start = {bucket} AND OLD.weight IS NOT NULL;
+    DELETE FROM progress_rollup
+    WHERE user_id = OLD.user_id AND period = '{period}' AND period_start = {bucket} AND n <= 0;
+'''
+
+_ROLLUP_LIVE = '''
+    SELECT weight FROM progress
+    WHERE user_id = OLD.user_id AND weight IS NOT NULL
+      AND date >= {bucket} AND date < date({bucket}, '+{length}')
+'''
+
+# Lowest and highest weight of each bucket's archived rows, folded in by
+# _archive_year before the rows leave main.progress
+_ROLLUP_ARCHIVED = '''
+    INSERT INTO progress_rollup (user_id, period, period_start, n, archived_min, archived_max)
+    SELECT user_id, '{period}', {bucket}, 0, MIN(weight), MAX(weight)
+    FROM main.progress WHERE weight IS NOT NULL AND {condition}
+    GROUP BY user_id, {bucket}
+    ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+        archived_min = COALESCE(MIN(archived_min, excluded.archived_min), excluded.archived_min),
+        archived_max = COALESCE(MAX(archived_max, excluded.archived_max), excluded.archived_max)
+'''
+
+_ROLLUP_LENGTHS = {'week': '7 days', 'month': '1 month'}
+
+def _progress_rollup_migration():
+    def add(period):
+        return _ROLLUP_ADD.format(period=period, bucket=ROLLUP_PERIODS[period].format(date='NEW.date'))
+
+    def rebuild(period, row):
+        return _ROLLUP_REBUILD.format(
+            period=period, row=row, length=_ROLLUP_LENGTHS[period],
+            bucket=ROLLUP_PERIODS[period].format(date=f'{row}.date')
         )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS workout_log (
-            id INTEGER PRIMARY KEY,
-            date TEXT,
-            exercise_type TEXT,
-            exercise TEXT,
-            duration INTEGER,
-            calories_burned REAL
+
+    backfill = ''.join(
+        _ROLLUP_BACKFILL.format(period=period, bucket=ROLLUP_PERIODS[period].format(date='date'))
+        for period in ROLLUP_PERIODS
+    )
+    return f'''
+    CREATE TABLE IF NOT EXISTS progress_rollup (
+        user_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        period_start TEXT NOT NULL,
+        n INTEGER NOT NULL,
+        weight_min REAL,
+        weight_max REAL,
+        weight_sum REAL,
+        sx REAL,
+        sxx REAL,
+        sxy REAL,
+        PRIMARY KEY (user_id, period, period_start)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER trg_progress_insert AFTER INSERT ON progress BEGIN
+        {''.join(add(period) for period in ROLLUP_PERIODS)}
+    END;
+
+    CREATE TRIGGER trg_progress_delete AFTER DELETE ON progress BEGIN
+        {''.join(rebuild(period, 'OLD') for period in ROLLUP_PERIODS)}
+    END;
+
+    CREATE TRIGGER trg_progress_update AFTER UPDATE ON progress BEGIN
+        {''.join(rebuild(period, 'OLD') + rebuild(period, 'NEW') for period in ROLLUP_PERIODS)}
+    END;
+
+    {backfill}
+    '''
+
+def _progress_rollup_archive_migration():
+    def remove(period):
+        bucket = ROLLUP_PERIODS[period].format(date='OLD.date')
+        return _ROLLUP_REMOVE.format(
+            period=period, bucket=bucket, x=f'julianday(OLD.date) - julianday({bucket})',
+            live=_ROLLUP_LIVE.format(bucket=bucket, length=_ROLLUP_LENGTHS[period])
         )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS progress (
-            id INTEGER PRIMARY KEY,
-            date TEXT,
-            weight REAL,
-            calories_consumed REAL,
-            exercise_minutes INTEGER
+
+    def add(period):
+        return _ROLLUP_ADD.format(period=period, bucket=ROLLUP_PERIODS[period].format(date='NEW.date'))
+
+    # Buckets counting more rows than main.progress holds already lost rows
+    # to the archive; their exact extremes are not at hand, so the current
+    # ones are kept
+    archived = ''.join(f'''
+    UPDATE progress_rollup SET archived_min = weight_min, archived_max = weight_max
+    WHERE period = '{period}' AND n > (
+        SELECT COUNT(*) FROM progress p
+        WHERE p.user_id = progress_rollup.user_id AND p.weight IS NOT NULL
+          AND p.date >= period_start AND p.date < date(period_start, '+{length}')
+    );''' for period, length in _ROLLUP_LENGTHS.items())
+    return f'''
+    ALTER TABLE progress_rollup ADD COLUMN archived_min REAL;
+    ALTER TABLE progress_rollup ADD COLUMN archived_max REAL;
+    {archived}
+
+    DROP TRIGGER trg_progress_delete;
+    DROP TRIGGER trg_progress_update;
+
+    CREATE TRIGGER trg_progress_delete AFTER DELETE ON progress BEGIN
+        {''.join(remove(period) for period in ROLLUP_PERIODS)}
+    END;
+
+    CREATE TRIGGER trg_progress_update AFTER UPDATE ON progress BEGIN
+        {''.join(remove(period) for period in ROLLUP_PERIODS)}
+        {''.join(add(period) for period in ROLLUP_PERIODS)}
+    END;
+    '''
+
+# Schema migrations, applied in order and tracked through PRAGMA user_version
+MIGRATIONS = [
+    # 1: index the date columns every loader filters on
+    '''
+    CREATE INDEX IF NOT EXISTS idx_food_log_date ON food_log (date);
+    CREATE INDEX IF NOT EXISTS idx_food_log_date_meal ON food_log (date, meal_type);
+    CREATE INDEX IF NOT EXISTS idx_workout_log_date ON workout_log (date);
+    CREATE INDEX IF NOT EXISTS idx_progress_date ON progress (date);
+    ''',
+    # 2: per-day totals kept current by triggers on the log tables
+    '''
+    CREATE TABLE IF NOT EXISTS daily_summary (
+        date TEXT PRIMARY KEY,
+        food_entries INTEGER NOT NULL DEFAULT 0,
+        calories REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        fat REAL NOT NULL DEFAULT 0,
+        workout_entries INTEGER NOT NULL DEFAULT 0,
+        exercise_minutes INTEGER NOT NULL DEFAULT 0,
+        calories_burned REAL NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_food_log_insert AFTER INSERT ON food_log BEGIN
+        INSERT INTO daily_summary (date, food_entries, calories, protein, carbs, fat)
+        VALUES (NEW.date, 1, COALESCE(NEW.calories, 0), COALESCE(NEW.protein, 0),
+                COALESCE(NEW.carbs, 0), COALESCE(NEW.fat, 0))
+        ON CONFLICT (date) DO UPDATE SET
+            food_entries = food_entries + 1,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fat = fat + excluded.fat;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_food_log_delete AFTER DELETE ON food_log BEGIN
+        UPDATE daily_summary SET
+            food_entries = food_entries - 1,
+            calories = calories - COALESCE(OLD.calories, 0),
+            protein = protein - COALESCE(OLD.protein, 0),
+            carbs = carbs - COALESCE(OLD.carbs, 0),
+            fat = fat - COALESCE(OLD.fat, 0)
+        WHERE date = OLD.date;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_workout_log_insert AFTER INSERT ON workout_log BEGIN
+        INSERT INTO daily_summary (date, workout_entries, exercise_minutes, calories_burned)
+        VALUES (NEW.date, 1, COALESCE(NEW.duration, 0), COALESCE(NEW.calories_burned, 0))
+        ON CONFLICT (date) DO UPDATE SET
+            workout_entries = workout_entries + 1,
+            exercise_minutes = exercise_minutes + excluded.exercise_minutes,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_workout_log_delete AFTER DELETE ON workout_log BEGIN
+        UPDATE daily_summary SET
+            workout_entries = workout_entries - 1,
+            exercise_minutes = exercise_minutes - COALESCE(OLD.duration, 0),
+            calories_burned = calories_burned - COALESCE(OLD.calories_burned, 0)
+        WHERE date = OLD.date;
+    END;
+
+    -- Updates are replayed as a delete of the old row plus an insert of the new one
+    CREATE TRIGGER IF NOT EXISTS trg_food_log_update AFTER UPDATE ON food_log BEGIN
+        UPDATE daily_summary SET
+            food_entries = food_entries - 1,
+            calories = calories - COALESCE(OLD.calories, 0),
+            protein = protein - COALESCE(OLD.protein, 0),
+            carbs = carbs - COALESCE(OLD.carbs, 0),
+            fat = fat - COALESCE(OLD.fat, 0)
+        WHERE date = OLD.date;
+        INSERT INTO daily_summary (date, food_entries, calories, protein, carbs, fat)
+        VALUES (NEW.date, 1, COALESCE(NEW.calories, 0), COALESCE(NEW.protein, 0),
+                COALESCE(NEW.carbs, 0), COALESCE(NEW.fat, 0))
+        ON CONFLICT (date) DO UPDATE SET
+            food_entries = food_entries + 1,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fat = fat + excluded.fat;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_workout_log_update AFTER UPDATE ON workout_log BEGIN
+        UPDATE daily_summary SET
+            workout_entries = workout_entries - 1,
+            exercise_minutes = exercise_minutes - COALESCE(OLD.duration, 0),
+            calories_burned = calories_burned - COALESCE(OLD.calories_burned, 0)
+        WHERE date = OLD.date;
+        INSERT INTO daily_summary (date, workout_entries, exercise_minutes, calories_burned)
+        VALUES (NEW.date, 1, COALESCE(NEW.duration, 0), COALESCE(NEW.calories_burned, 0))
+        ON CONFLICT (date) DO UPDATE SET
+            workout_entries = workout_entries + 1,
+            exercise_minutes = exercise_minutes + excluded.exercise_minutes,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+
+    -- Backfill from rows logged before the summary existed
+    INSERT INTO daily_summary (date, food_entries, calories, protein, carbs, fat,
+                               workout_entries, exercise_minutes, calories_burned)
+    SELECT date, SUM(food_entries), SUM(calories), SUM(protein), SUM(carbs), SUM(fat),
+           SUM(workout_entries), SUM(exercise_minutes), SUM(calories_burned)
+    FROM (
+        SELECT date, COUNT(*) AS food_entries, TOTAL(calories) AS calories,
+               TOTAL(protein) AS protein, TOTAL(carbs) AS carbs, TOTAL(fat) AS fat,
+               0 AS workout_entries, 0 AS exercise_minutes, 0 AS calories_burned
+        FROM food_log GROUP BY date
+        UNION ALL
+        SELECT date, 0, 0, 0, 0, 0, COUNT(*), TOTAL(duration), TOTAL(calories_burned)
+        FROM workout_log GROUP BY date
+    )
+    GROUP BY date;
+    ''',
+    # 3: multiple users. Every log row belongs to a user, existing data to
+    # user 1; accounts points at each user's current profile row in `users`
+    # (which keeps the profile history); daily_summary is keyed by
+    # (user_id, date) and the date indexes lead with user_id.
+    '''
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        current_profile_id INTEGER REFERENCES users (id),
+        created TEXT
+    );
+    ALTER TABLE users ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE food_log ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE workout_log ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE progress ADD COLUMN user_id INTEGER NOT NULL DEFAULT 1;
+    INSERT OR IGNORE INTO accounts (id, name, current_profile_id, created)
+    VALUES (1, 'Default', (SELECT MAX(id) FROM users), date('now'));
+
+    DROP INDEX IF EXISTS idx_food_log_date;
+    DROP INDEX IF EXISTS idx_food_log_date_meal;
+    DROP INDEX IF EXISTS idx_workout_log_date;
+    DROP INDEX IF EXISTS idx_progress_date;
+    CREATE INDEX idx_food_log_user_date ON food_log (user_id, date);
+    CREATE INDEX idx_food_log_user_date_meal ON food_log (user_id, date, meal_type);
+    CREATE INDEX idx_workout_log_user_date ON workout_log (user_id, date);
+    CREATE INDEX idx_progress_user_date ON progress (user_id, date);
+    CREATE INDEX idx_users_user ON users (user_id);
+
+    DROP TRIGGER trg_food_log_insert;
+    DROP TRIGGER trg_food_log_delete;
+    DROP TRIGGER trg_food_log_update;
+    DROP TRIGGER trg_workout_log_insert;
+    DROP TRIGGER trg_workout_log_delete;
+    DROP TRIGGER trg_workout_log_update;
+
+    ALTER TABLE daily_summary RENAME TO daily_summary_v2;
+    CREATE TABLE daily_summary (
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        food_entries INTEGER NOT NULL DEFAULT 0,
+        calories REAL NOT NULL DEFAULT 0,
+        protein REAL NOT NULL DEFAULT 0,
+        carbs REAL NOT NULL DEFAULT 0,
+        fat REAL NOT NULL DEFAULT 0,
+        workout_entries INTEGER NOT NULL DEFAULT 0,
+        exercise_minutes INTEGER NOT NULL DEFAULT 0,
+        calories_burned REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    ) WITHOUT ROWID;
+    INSERT INTO daily_summary
+    SELECT 1, date, food_entries, calories, protein, carbs, fat,
+           workout_entries, exercise_minutes, calories_burned
+    FROM daily_summary_v2;
+    DROP TABLE daily_summary_v2;
+
+    CREATE TRIGGER trg_food_log_insert AFTER INSERT ON food_log BEGIN
+        INSERT INTO daily_summary (user_id, date, food_entries, calories, protein, carbs, fat)
+        VALUES (NEW.user_id, NEW.date, 1, COALESCE(NEW.calories, 0), COALESCE(NEW.protein, 0),
+                COALESCE(NEW.carbs, 0), COALESCE(NEW.fat, 0))
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            food_entries = food_entries + 1,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fat = fat + excluded.fat;
+    END;
+
+    CREATE TRIGGER trg_food_log_delete AFTER DELETE ON food_log BEGIN
+        UPDATE daily_summary SET
+            food_entries = food_entries - 1,
+            calories = calories - COALESCE(OLD.calories, 0),
+            protein = protein - COALESCE(OLD.protein, 0),
+            carbs = carbs - COALESCE(OLD.carbs, 0),
+            fat = fat - COALESCE(OLD.fat, 0)
+        WHERE user_id = OLD.user_id AND date = OLD.date;
+    END;
+
+    CREATE TRIGGER trg_food_log_update AFTER UPDATE ON food_log BEGIN
+        UPDATE daily_summary SET
+            food_entries = food_entries - 1,
+            calories = calories - COALESCE(OLD.calories, 0),
+            protein = protein - COALESCE(OLD.protein, 0),
+            carbs = carbs - COALESCE(OLD.carbs, 0),
+            fat = fat - COALESCE(OLD.fat, 0)
+        WHERE user_id = OLD.user_id AND date = OLD.date;
+        INSERT INTO daily_summary (user_id, date, food_entries, calories, protein, carbs, fat)
+        VALUES (NEW.user_id, NEW.date, 1, COALESCE(NEW.calories, 0), COALESCE(NEW.protein, 0),
+                COALESCE(NEW.carbs, 0), COALESCE(NEW.fat, 0))
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            food_entries = food_entries + 1,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fat = fat + excluded.fat;
+    END;
+
+    CREATE TRIGGER trg_workout_log_insert AFTER INSERT ON workout_log BEGIN
+        INSERT INTO daily_summary (user_id, date, workout_entries, exercise_minutes, calories_burned)
+        VALUES (NEW.user_id, NEW.date, 1, COALESCE(NEW.duration, 0), COALESCE(NEW.calories_burned, 0))
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            workout_entries = workout_entries + 1,
+            exercise_minutes = exercise_minutes + excluded.exercise_minutes,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+
+    CREATE TRIGGER trg_workout_log_delete AFTER DELETE ON workout_log BEGIN
+        UPDATE daily_summary SET
+            workout_entries = workout_entries - 1,
+            exercise_minutes = exercise_minutes - COALESCE(OLD.duration, 0),
+            calories_burned = calories_burned - COALESCE(OLD.calories_burned, 0)
+        WHERE user_id = OLD.user_id AND date = OLD.date;
+    END;
+
+    CREATE TRIGGER trg_workout_log_update AFTER UPDATE ON workout_log BEGIN
+        UPDATE daily_summary SET
+            workout_entries = workout_entries - 1,
+            exercise_minutes = exercise_minutes - COALESCE(OLD.duration, 0),
+            calories_burned = calories_burned - COALESCE(OLD.calories_burned, 0)
+        WHERE user_id = OLD.user_id AND date = OLD.date;
+        INSERT INTO daily_summary (user_id, date, workout_entries, exercise_minutes, calories_burned)
+        VALUES (NEW.user_id, NEW.date, 1, COALESCE(NEW.duration, 0), COALESCE(NEW.calories_burned, 0))
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            workout_entries = workout_entries + 1,
+            exercise_minutes = exercise_minutes + excluded.exercise_minutes,
+            calories_burned = calories_burned + excluded.calories_burned;
+    END;
+    ''',
+    # 4: weekly/monthly weight rollups for the progress chart
+    _progress_rollup_migration(),
+    # 5: local food database for manual entry, searched through an FTS5
+    # index kept in step with foods by triggers (see food_db)
+    '''
+    CREATE TABLE IF NOT EXISTS foods (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        brand TEXT,
+        serving TEXT,
+        calories REAL,
+        protein REAL,
+        carbs REAL,
+        fat REAL,
+        source TEXT
+    );
+    CREATE VIRTUAL TABLE foods_fts USING fts5(
+        name, brand, content = 'foods', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    );
+
+    CREATE TRIGGER trg_foods_insert AFTER INSERT ON foods BEGIN
+        INSERT INTO foods_fts (rowid, name, brand) VALUES (NEW.id, NEW.name, NEW.brand);
+    END;
+
+    CREATE TRIGGER trg_foods_delete AFTER DELETE ON foods BEGIN
+        INSERT INTO foods_fts (foods_fts, rowid, name, brand) VALUES ('delete', OLD.id, OLD.name, OLD.brand);
+    END;
+
+    CREATE TRIGGER trg_foods_update AFTER UPDATE ON foods BEGIN
+        INSERT INTO foods_fts (foods_fts, rowid, name, brand) VALUES ('delete', OLD.id, OLD.name, OLD.brand);
+        INSERT INTO foods_fts (rowid, name, brand) VALUES (NEW.id, NEW.name, NEW.brand);
+    END;
+    ''',
+    # 6: per-year archive files of old log rows (see archive_logs)
+    '''
+    CREATE TABLE archive_partitions (
+        table_name TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, year)
+    ) WITHOUT ROWID;
+    ''',
+    # 7: progress edits and deletes update their rollup bucket incrementally,
+    # so buckets keep the contribution of archived rows
+    _progress_rollup_archive_migration(),
+]
+
+# Rows written without an explicit user belong to the default account
+DEFAULT_USER_ID = 1
+
+SUMMARY_COLUMNS = (
+    'food_entries', 'calories', 'protein', 'carbs', 'fat',
+    'workout_entries', 'exercise_minutes', 'calories_burned'
+)
+
+PROFILE_COLUMNS = (
+    'weight', 'height', 'age', 'gender', 'target_weight', 'goal',
+    'exercise_level', 'dietary_pref', 'allergies', 'last_updated'
+)
+
+# The log inserts take the row's values in TABLE_COLUMNS order (without id)
+# followed by the user_id
+INSERT_USER = '''
+    INSERT INTO users (weight, height, age, gender, target_weight, goal, exercise_level, dietary_pref, allergies, last_updated, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+UPDATE_USER = '''
+    UPDATE users SET weight = ?, height = ?, age = ?, gender = ?, target_weight = ?, goal = ?,
+        exercise_level = ?, dietary_pref = ?, allergies = ?, last_updated = ?
+    WHERE id = ?
+'''
+INSERT_FOOD_LOG = '''
+    INSERT INTO food_log (date, meal_type, food_item, calories, protein, carbs, fat, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_WORKOUT_LOG = '''
+    INSERT INTO workout_log (date, exercise_type, exercise, duration, calories_burned, user_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+INSERT_PROGRESS = '''
+    INSERT INTO progress (date, weight, calories_consumed, exercise_minutes, user_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+INSERT_FOODS = '''
+    INSERT INTO foods (name, brand, serving, calories, protein, carbs, fat, source)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_STATEMENTS = {
+    'food_log': INSERT_FOOD_LOG,
+    'workout_log': INSERT_WORKOUT_LOG,
+    'progress': INSERT_PROGRESS,
+    'foods': INSERT_FOODS,
+}
+
+# Initialize SQLite database
+def init_db():
+    with transaction() as conn:
+        c = conn.cursor()
+
+        # Create tables if they don't exist
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                weight REAL,
+                height REAL,
+                age INTEGER,
+                gender TEXT,
+                target_weight REAL,
+                goal TEXT,
+                exercise_level TEXT,
+                dietary_pref TEXT,
+                allergies TEXT,
+                last_updated TEXT
+            )
+        ''')
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS food_log (
+                id INTEGER PRIMARY KEY,
+                date TEXT,
+                meal_type TEXT,
+                food_item TEXT,
+                calories REAL,
+                protein REAL,
+                carbs REAL,
+                fat REAL
+            )
+        ''')
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS workout_log (
+                id INTEGER PRIMARY KEY,
+                date TEXT,
+                exercise_type TEXT,
+                exercise TEXT,
+                duration INTEGER,
+                calories_burned REAL
+            )
+        ''')
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS progress (
+                id INTEGER PRIMARY KEY,
+                date TEXT,
+                weight REAL,
+                calories_consumed REAL,
+                exercise_minutes INTEGER
+            )
+        ''')
+
+    migrate()
+    if os.getenv("HEALTH_TRACKER_ARCHIVE_DAYS"):
+        archive_logs()
+    if os.getenv("HEALTH_TRACKER_WRITE_BEHIND") == "1":
+        enable_write_behind()
+
+# Bring the schema up to the latest migration
+def migrate():
+    with connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            # executescript does not take part in the implicit transaction,
+            # so each migration is wrapped explicitly with its version bump
+            conn.executescript(f'BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;')
+
+# List every user as (id, name)
+def list_users():
+    with connection() as conn:
+        return conn.execute('SELECT id, name FROM accounts ORDER BY id').fetchall()
+
+# Create a user and return its id
+def create_user(name):
+    with transaction() as conn:
+        cursor = conn.execute(
+            "INSERT INTO accounts (name, created) VALUES (?, date('now'))", (name.strip(),)
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-# Save user data
-def save_user_data(user_data):
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO users (weight, height, age, gender, target_weight, goal, exercise_level, dietary_pref, allergies, last_updated)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+        return cursor.lastrowid
+
+# Save user data. Edits on the same day update the current profile in
+# place; a later edit starts a new profile version and moves the pointer.
+def save_user_data(user_data, user_id=DEFAULT_USER_ID):
+    values = (
         user_data['weight'], user_data['height'], user_data['age'], user_data['gender'],
         user_data['target_weight'], user_data['goal'], user_data['exercise_level'],
         user_data['dietary_pref'], ','.join(user_data['allergies']), user_data['last_updated']
-    ))
-    conn.commit()
-    conn.close()
+    )
+    with transaction() as conn:
+        current = conn.execute('''
+            SELECT u.id, u.last_updated FROM accounts a JOIN users u ON u.id = a.current_profile_id
+            WHERE a.id = ?
+        ''', (user_id,)).fetchone()
+        if current and current[1] == user_data['last_updated']:
+            conn.execute(UPDATE_USER, values + (current[0],))
+        else:
+            profile_id = conn.execute(INSERT_USER, values + (user_id,)).lastrowid
+            conn.execute('UPDATE accounts SET current_profile_id = ? WHERE id = ?', (profile_id, user_id))
+    table_changed('users', user_id)
 
 # Load user data
-def load_user_data():
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM users ORDER BY id DESC LIMIT 1')
-    user_data = c.fetchone()
-    conn.close()
-    
+@cached_query('users')
+def load_user_data(user_id=DEFAULT_USER_ID):
+    with connection() as conn, timed('db_query', table='users'):
+        user_data = conn.execute(f'''
+            SELECT {', '.join('u.' + column for column in PROFILE_COLUMNS)}
+            FROM accounts a JOIN users u ON u.id = a.current_profile_id
+            WHERE a.id = ?
+        ''', (user_id,)).fetchone()
+
     if user_data:
-        return {
-            "weight": user_data[1],
-            "height": user_data[2],
-            "age": user_data[3],
-            "gender": user_data[4],
-            "target_weight": user_data[5],
-            "goal": user_data[6],
-            "exercise_level": user_data[7],
-            "dietary_pref": user_data[8],
-            "allergies": user_data[9].split(','),
-            "last_updated": user_data[10]
-        }
+        user_data = dict(zip(PROFILE_COLUMNS, user_data))
+        user_data['allergies'] = user_data['allergies'].split(',')
+        return user_data
     return {}
 
 # Save food log
-def save_food_log(entry):
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO food_log (date, meal_type, food_item, calories, protein, carbs, fat)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
+def save_food_log(entry, user_id=DEFAULT_USER_ID):
+    _write_log('food_log', INSERT_FOOD_LOG, (
         entry['date'], entry['meal_type'], entry['food_item'],
-        entry['calories'], entry['protein'], entry['carbs'], entry['fat']
+        entry['calories'], entry['protein'], entry['carbs'], entry['fat'], user_id
     ))
-    conn.commit()
-    conn.close()
+    table_changed('food_log', user_id, entry['date'])
+
+# Load the running totals for one day
+@cached_query('food_log', 'workout_log')
+def load_daily_summary(date, user_id=DEFAULT_USER_ID):
+    _await_writes('food_log', 'workout_log')
+    with connection() as conn, timed('db_query', table='daily_summary'):
+        row = conn.execute(
+            f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM daily_summary WHERE user_id = ? AND date = ?",
+            (user_id, date)
+        ).fetchone()
+    return dict(zip(SUMMARY_COLUMNS, row or (0,) * len(SUMMARY_COLUMNS)))
+
+# Food totals of the logged days between two dates, as
+# (date, food_entries, calories, protein, carbs, fat) rows in no set order
+def load_daily_totals(start, end, user_id=DEFAULT_USER_ID):
+    _await_writes('food_log')
+    with connection() as conn:
+        return conn.execute('''
+            SELECT date, food_entries, calories, protein, carbs, fat FROM daily_summary
+            WHERE user_id = ? AND date BETWEEN ? AND ? AND food_entries > 0
+        ''', (user_id, start, end)).fetchall()
+
+# Daily food totals between two dates with rolling averages over the
+# trailing `window` calendar days (logged days only)
+def load_daily_trend(start, end, window=7, user_id=DEFAULT_USER_ID):
+    import pandas as pd
+
+    macros = ('calories', 'protein', 'carbs', 'fat')
+    rolling = ', '.join(
+        f'AVG({m}) OVER (ORDER BY julianday(date) RANGE BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW) '
+        f'AS {m}_avg'
+        for m in macros
+    )
+    # The rolling averages reach back before `start`, so the range is
+    # filtered after the window functions run
+    query = f'''
+        SELECT * FROM (
+            SELECT date, {', '.join(macros)}, {rolling}
+            FROM daily_summary
+            WHERE user_id = ? AND date BETWEEN date(?, '-{int(window) - 1} days') AND ? AND food_entries > 0
+        ) WHERE date >= ? ORDER BY date
+    '''
+    _await_writes('food_log')
+    with connection() as conn, timed('db_query', table='daily_summary'):
+        return pd.read_sql_query(query, conn, params=(user_id, start, end, start))
+
+def log_columns(table, columns):
+    if columns is None:
+        return list(TABLE_COLUMNS[table])
+    unknown = [col for col in columns if col not in TABLE_COLUMNS[table] and col != 'user_id']
+    if unknown:
+        raise ValueError(f"Unknown {table} columns: {', '.join(unknown)}")
+    return list(columns)
+
+# Build a projected, date-filtered SELECT against one of the log tables.
+# user_id=None selects the rows of every user and `where` adds conditions on
+# the table's columns. With `archive`, the schema an archived year is
+# attached as, the SELECT reads and decodes that partition instead. The
+# result is ordered by date and id (`order` ASC or DESC), or with sort_keys
+# left unordered with the keys as two extra columns, ready for UNION ALL.
+def _log_query(table, user_id, start=None, end=None, columns=None, where=(), archive=None, order='ASC',
+               sort_keys=False):
+    columns = log_columns(table, columns)
+    if archive is None:
+        expressions = {column: column for column in columns + ['date', 'id']}
+        source, prefix, bound = table, '', str
+        date_column = 'date'
+    else:
+        labels = ARCHIVE_LABELS[table]
+        expressions = {
+            column: f'date(t.day + {EPOCH_JULIAN_DAY})' if column == 'date'
+            else f'(SELECT text FROM {archive}.labels WHERE id = t.{column})' if column in labels
+            else f't.{column}'
+            for column in columns + ['date', 'id']
+        }
+        source, prefix, bound = f'{archive}.{table} t', 't.', _day_number
+        date_column = 't.day'
+
+    select = ', '.join(expressions[column] if expressions[column] == column else f'{expressions[column]} AS {column}'
+                       for column in columns)
+    if sort_keys:
+        select += f", {expressions['date']} AS _date, {expressions['id']} AS _id"
+    query = f"SELECT {select} FROM {source}"
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append(f'{prefix}user_id = ?')
+        params.append(user_id)
+    if start is not None and start == end:
+        conditions.append(f'{date_column} = ?')
+        params.append(bound(start))
+    else:
+        if start is not None:
+            conditions.append(f'{date_column} >= ?')
+            params.append(bound(start))
+        if end is not None:
+            conditions.append(f'{date_column} <= ?')
+            params.append(bound(end))
+    # After the indexed conditions: in front, they can steer the planner off the index
+    conditions += where
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if not sort_keys:
+        # id breaks ties in insertion order; it rides along in the date indexes
+        query += f' ORDER BY {date_column} {order}, {prefix}id {order}'
+    return query, params
+
+# Archived years of a log table as [(year, path)], oldest first
+def _archive_partitions(conn, table):
+    rows = conn.execute(
+        'SELECT year, path FROM archive_partitions WHERE table_name = ? ORDER BY year', (table,)
+    ).fetchall()
+    if not rows:
+        return []
+    directory = archive_dir()
+    return [(year, os.path.join(directory, path)) for year, path in rows]
+
+# Split a date range at the archived years: (start, end, partition) pieces
+# in date order, partition being None where only the live table has rows
+def _log_segments(partitions, start, end):
+    segments = []
+    low = start
+    for year, path in partitions:
+        first, last = f'{year:04d}-01-01', f'{year:04d}-12-31'
+        if (end is not None and end < first) or (low is not None and low > last):
+            continue
+        if low is None or low < first:
+            segments.append((low, f'{year - 1:04d}-12-31', None))
+        segments.append((max(low or first, first), min(end or last, last), (year, path)))
+        low = f'{year + 1:04d}-01-01'
+    if low is None or end is None or low <= end:
+        segments.append((low, end, None))
+    return segments
+
+# Attach an archive file unless it already is; returns whether it attached
+def _attach(conn, alias, path):
+    if any(row[1] == alias for row in conn.execute('PRAGMA database_list')):
+        return False
+    conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+    return True
+
+# Read a log table across the live rows and every archived year the date
+# range reaches, in batches of row tuples in date order. Each archived year
+# is attached only while its rows are read, so any number of years stays
+# under SQLite's limit on attached databases.
+def _log_batches(conn, table, user_id, start=None, end=None, columns=None, batch_size=10000, where=(),
+                 descending=False, limit=None):
+    order = 'DESC' if descending else 'ASC'
+    segments = _log_segments(_archive_partitions(conn, table), start, end)
+    if descending:
+        segments.reverse()
+    remaining = limit
+    for low, high, partition in segments:
+        alias = attached = None
+        if partition is None:
+            query, params = _log_query(table, user_id, low, high, columns, where, order=order)
+        else:
+            year, path = partition
+            alias = f'archive_{year}'
+            attached = _attach(conn, alias, path)
+            live, live_params = _log_query(table, user_id, low, high, columns, where, sort_keys=True)
+            archived, archived_params = _log_query(table, user_id, low, high, columns, where, archive=alias,
+                                                   sort_keys=True)
+            query = f'{live} UNION ALL {archived} ORDER BY _date {order}, _id {order}'
+            params = live_params + archived_params
+        if remaining is not None:
+            query += f' LIMIT {int(remaining)}'
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                if partition is not None:
+                    batch = [row[:-2] for row in batch]
+                if remaining is not None:
+                    remaining -= len(batch)
+                yield batch
+        finally:
+            cursor.close()
+            if attached:
+                conn.execute('DETACH DATABASE ' + alias)
+        if remaining is not None and remaining <= 0:
+            return
+
+# First row of a log read, or None
+def _first_log_row(conn, table, user_id, columns, where=(), descending=False):
+    batches = _log_batches(conn, table, user_id, columns=columns, where=where, descending=descending, limit=1)
+    try:
+        for batch in batches:
+            return batch[0]
+    finally:
+        batches.close()
+    return None
+
+# Run a projected, date-filtered SELECT into a DataFrame
+def _load_log(table, user_id, start=None, end=None, columns=None):
+    # pandas is only needed by the DataFrame loaders; the dashboard reads
+    # daily_summary and can render without importing it
+    import pandas as pd
+
+    _await_writes(table)
+    with connection() as conn, timed('db_query', table=table):
+        if not _archive_partitions(conn, table):
+            query, params = _log_query(table, user_id, start, end, columns)
+            return pd.read_sql_query(query, conn, params=params)
+        rows = [row for batch in _log_batches(conn, table, user_id, start, end, columns) for row in batch]
+        return pd.DataFrame.from_records(rows, columns=log_columns(table, columns), coerce_float=True)
 
 # Load food log
-def load_food_log(date=None):
-    conn = sqlite3.connect('data/health_tracker.db')
-    query = 'SELECT * FROM food_log'
-    if date:
-        query += f" WHERE date = '{date}'"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+@cached_query('food_log')
+def load_food_log(date=None, user_id=DEFAULT_USER_ID):
+    return _load_log('food_log', user_id, date or None, date or None)
+
+# Load food log between two dates (inclusive), optionally projecting columns
+@cached_query('food_log')
+def load_food_log_range(start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+    return _load_log('food_log', user_id, start, end, columns)
 
 # Save workout log
-def save_workout_log(entry):
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO workout_log (date, exercise_type, exercise, duration, calories_burned)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (
+def save_workout_log(entry, user_id=DEFAULT_USER_ID):
+    _write_log('workout_log', INSERT_WORKOUT_LOG, (
         entry['date'], entry['exercise_type'], entry['exercise'],
-        entry['duration'], entry['calories_burned']
+        entry['duration'], entry['calories_burned'], user_id
     ))
-    conn.commit()
-    conn.close()
+    table_changed('workout_log', user_id, entry['date'])
 
 # Load workout log
-def load_workout_log(date=None):
-    conn = sqlite3.connect('data/health_tracker.db')
-    query = 'SELECT * FROM workout_log'
-    if date:
-        query += f" WHERE date = '{date}'"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+@cached_query('workout_log')
+def load_workout_log(date=None, user_id=DEFAULT_USER_ID):
+    return _load_log('workout_log', user_id, date or None, date or None)
+
+# Load workout log between two dates (inclusive), optionally projecting columns
+@cached_query('workout_log')
+def load_workout_log_range(start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+    return _load_log('workout_log', user_id, start, end, columns)
 
 # Save progress
-def save_progress(entry):
-    conn = sqlite3.connect('data/health_tracker.db')
-    c = conn.cursor()
-    c.execute('''
-        INSERT INTO progress (date, weight, calories_consumed, exercise_minutes)
-        VALUES (?, ?, ?, ?)
-    ''', (
-        entry['date'], entry['weight'], entry['calories_consumed'], entry['exercise_minutes']
+def save_progress(entry, user_id=DEFAULT_USER_ID):
+    _write_log('progress', INSERT_PROGRESS, (
+        entry['date'], entry['weight'], entry['calories_consumed'], entry['exercise_minutes'], user_id
     ))
-    conn.commit()
-    conn.close()
+    table_changed('progress', user_id, entry['date'])
 
 # Load progress
-def load_progress():
-    conn = sqlite3.connect('data/health_tracker.db')
-    df = pd.read_sql_query('SELECT * FROM progress', conn)
-    conn.close()
-    return df
\ No newline at end of file
+@cached_query('progress')
+def load_progress(user_id=DEFAULT_USER_ID):
+    return _load_log('progress', user_id)
+
+# Load progress between two dates (inclusive), optionally projecting columns
+@cached_query('progress')
+def load_progress_range(start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+    return _load_log('progress', user_id, start, end, columns)
+
+# Weekly or monthly weight rollups: mean/min/max per period, a moving average
+# over the last `window` periods and the least-squares trend in kg per day
+@cached_query('progress')
+def load_progress_rollup(period='week', start=None, end=None, window=4, user_id=DEFAULT_USER_ID):
+    import pandas as pd
+
+    _await_writes('progress')
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown rollup period '{period}'. Choose one of: {', '.join(ROLLUP_PERIODS)}")
+    conditions = ['user_id = ?', 'period = ?']
+    params = [user_id, period]
+    if start is not None:
+        conditions.append(f"period_start >= {ROLLUP_PERIODS[period].format(date='?')}")
+        params.append(start)
+    if end is not None:
+        conditions.append('period_start <= ?')
+        params.append(end)
+    query = f'''
+        SELECT period_start, n AS entries, weight_sum / n AS weight_mean, weight_min, weight_max,
+               AVG(weight_sum / n) OVER (
+                   ORDER BY period_start ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW
+               ) AS moving_average,
+               CASE WHEN n * sxx - sx * sx > 0
+                    THEN (n * sxy - sx * weight_sum) / (n * sxx - sx * sx) END AS slope_per_day
+        FROM progress_rollup
+        WHERE {' AND '.join(conditions)}
+        ORDER BY period_start
+    '''
+    with connection() as conn, timed('db_query', table='progress_rollup'):
+        return pd.read_sql_query(query, conn, params=params)
+
+# First and last logged weight as (first, last), or None without any; two
+# index seeks rather than loading the whole progress table
+@cached_query('progress')
+def load_weight_change(user_id=DEFAULT_USER_ID):
+    _await_writes('progress')
+    with connection() as conn:
+        first, last = (
+            _first_log_row(conn, 'progress', user_id, ['weight'], ('weight IS NOT NULL',), descending)
+            for descending in (False, True)
+        )
+    return (first[0], last[0]) if first else None
+
+# Weight over time for charting, at most `max_points` points. Histories up to
+# `raw_limit` entries are downsampled from the raw rows, longer ones from the
+# weekly means; either way LTTB keeps the visual peaks and troughs.
+@cached_query('progress')
+def load_weight_series(max_points=500, raw_limit=20000, user_id=DEFAULT_USER_ID):
+    _await_writes('progress')
+    with connection() as conn, timed('db_query', table='progress'):
+        entries = conn.execute(
+            "SELECT COALESCE(SUM(n), 0) FROM progress_rollup WHERE user_id = ? AND period = 'week'", (user_id,)
+        ).fetchone()[0]
+        if entries <= raw_limit:
+            rows = [
+                row for batch in _log_batches(conn, 'progress', user_id, columns=['date', 'weight'],
+                                              where=('weight IS NOT NULL',))
+                for row in batch
+            ]
+        else:
+            rows = conn.execute('''
+                SELECT period_start AS date, weight_sum / n AS weight FROM progress_rollup
+                WHERE user_id = ? AND period = 'week' ORDER BY period_start
+            ''', (user_id,)).fetchall()
+    return weight_series_frame(rows, max_points)
+
+# Downsample (date, weight) rows in date order to at most `max_points` with LTTB
+def weight_series_frame(rows, max_points):
+    import pandas as pd
+    from timeseries import lttb
+
+    if not rows:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'weight': pd.Series(dtype=float)})
+    dates, weights = zip(*rows)
+    dates = pd.to_datetime(pd.Series(dates))
+    keep = lttb(dates.to_numpy(dtype='datetime64[s]').astype('float64'), weights, max_points)
+    return pd.DataFrame({'date': dates.to_numpy()[keep], 'weight': pd.Series(weights, dtype=float).to_numpy()[keep]})
+
+# Fold rows with id > ? into daily_summary (or progress_rollup, foods_fts) in
+# one statement; bulk_insert uses this instead of firing the per-row insert trigger
+SUMMARY_REFRESH = {
+    'food_log': ('trg_food_log_insert', '''
+        INSERT INTO daily_summary (user_id, date, food_entries, calories, protein, carbs, fat)
+        SELECT user_id, date, COUNT(*), TOTAL(calories), TOTAL(protein), TOTAL(carbs), TOTAL(fat)
+        FROM food_log WHERE id > ? GROUP BY user_id, date
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            food_entries = food_entries + excluded.food_entries,
+            calories = calories + excluded.calories,
+            protein = protein + excluded.protein,
+            carbs = carbs + excluded.carbs,
+            fat = fat + excluded.fat
+    '''),
+    'workout_log': ('trg_workout_log_insert', '''
+        INSERT INTO daily_summary (user_id, date, workout_entries, exercise_minutes, calories_burned)
+        SELECT user_id, date, COUNT(*), TOTAL(duration), TOTAL(calories_burned)
+        FROM workout_log WHERE id > ? GROUP BY user_id, date
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            workout_entries = workout_entries + excluded.workout_entries,
+            exercise_minutes = exercise_minutes + excluded.exercise_minutes,
+            calories_burned = calories_burned + excluded.calories_burned
+    '''),
+    'foods': ('trg_foods_insert', '''
+        INSERT INTO foods_fts (rowid, name, brand) SELECT id, name, brand FROM foods WHERE id > ?
+    '''),
+    'progress': ('trg_progress_insert', '''
+        WITH added AS (SELECT user_id, date, weight FROM progress WHERE id > ? AND weight IS NOT NULL)
+        INSERT INTO progress_rollup (user_id, period, period_start, n, weight_min, weight_max, weight_sum, sx, sxx, sxy)
+        SELECT user_id, period, bucket, COUNT(*), MIN(weight), MAX(weight), SUM(weight),
+               SUM(x), SUM(x * x), SUM(x * weight)
+        FROM ({buckets})
+        GROUP BY user_id, period, bucket
+        ON CONFLICT (user_id, period, period_start) DO UPDATE SET
+            n = n + excluded.n,
+            weight_min = MIN(weight_min, excluded.weight_min),
+            weight_max = MAX(weight_max, excluded.weight_max),
+            weight_sum = weight_sum + excluded.weight_sum,
+            sx = sx + excluded.sx,
+            sxx = sxx + excluded.sxx,
+            sxy = sxy + excluded.sxy
+    '''.format(buckets=' UNION ALL '.join(
+        f"SELECT user_id, weight, '{period}' AS period, {bucket.format(date='date')} AS bucket, "
+        f"julianday(date) - julianday({bucket.format(date='date')}) AS x FROM added"
+        for period, bucket in ROLLUP_PERIODS.items()
+    ))),
+}
+
+# Insert many rows into a log table for one user. Rows are tuples in
+# TABLE_COLUMNS order without the id; each batch goes in with one
+# executemany and one commit, and the table's summary or rollup is
+# refreshed once per batch. Shared tables (foods) take user_id=None.
+def bulk_insert(table, rows, batch_size=50000, user_id=DEFAULT_USER_ID):
+    insert = INSERT_STATEMENTS[table]
+    trigger, refresh = SUMMARY_REFRESH.get(table, (None, None))
+    owner = (user_id,) if user_id is not None else ()
+    rows = (row + owner for row in rows)
+    total = 0
+    with connection() as conn:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with conn:
+                # sqlite3 only opens a transaction before DML, so it is begun
+                # explicitly or the DROP TRIGGER below would commit on its own
+                conn.execute('BEGIN IMMEDIATE')
+                if trigger:
+                    # Swap the per-row summary trigger for one aggregate
+                    # update per batch. Both happen inside the batch's
+                    # transaction, so other connections never see the
+                    # trigger missing and a failed batch keeps it.
+                    trigger_sql = conn.execute(
+                        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)
+                    ).fetchone()[0]
+                    last_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+                    conn.execute(f'DROP TRIGGER {trigger}')
+                conn.executemany(insert, batch)
+                if trigger:
+                    conn.execute(refresh, (last_id,))
+                    conn.execute(trigger_sql)
+            table_changed(table, user_id)
+            total += len(batch)
+    return total
+
+# Rewrite calories_burned for many of a user's workouts, given (calories, id)
+# pairs, live or archived. daily_summary is moved by the difference per day
+# in one statement, instead of the per-row summary trigger, so days whose
+# workouts are partly archived stay right.
+def update_calories_burned(rows, user_id=DEFAULT_USER_ID):
+    updated = 0
+    with connection() as conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS burn_updates (id INTEGER PRIMARY KEY, calories REAL)')
+        with conn:
+            conn.execute('DELETE FROM temp.burn_updates')
+            conn.executemany('INSERT OR REPLACE INTO temp.burn_updates (id, calories) VALUES (?, ?)',
+                             ((row_id, calories) for calories, row_id in rows))
+
+        sources = [(None, 'main', 'w.date')] + [
+            ((year, path), f'archive_{year}', f'date(w.day + {EPOCH_JULIAN_DAY})')
+            for year, path in _archive_partitions(conn, 'workout_log')
+        ]
+        for partition, schema, day in sources:
+            attached = partition is not None and _attach(conn, schema, partition[1])
+            try:
+                with conn:
+                    # Keeps the trigger swap in this transaction, as in bulk_insert
+                    conn.execute('BEGIN IMMEDIATE')
+                    if partition is None:
+                        trigger_sql = conn.execute(
+                            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_workout_log_update'"
+                        ).fetchone()[0]
+                        conn.execute('DROP TRIGGER trg_workout_log_update')
+                    changes = f'''
+                        FROM temp.burn_updates b JOIN {schema}.workout_log w ON w.id = b.id
+                        WHERE w.user_id = ?
+                    '''
+                    conn.execute(f'''
+                        UPDATE daily_summary SET calories_burned = calories_burned + (
+                            SELECT TOTAL(b.calories - COALESCE(w.calories_burned, 0)) {changes}
+                                AND {day} = daily_summary.date
+                        )
+                        WHERE user_id = ? AND date IN (SELECT {day} {changes})
+                    ''', (user_id, user_id, user_id))
+                    updated += conn.execute(f'''
+                        UPDATE {schema}.workout_log
+                        SET calories_burned = (SELECT calories FROM temp.burn_updates b WHERE b.id = workout_log.id)
+                        WHERE user_id = ? AND id IN (SELECT id FROM temp.burn_updates)
+                    ''', (user_id,)).rowcount
+                    if partition is None:
+                        conn.execute(trigger_sql)
+            finally:
+                if attached:
+                    conn.execute(f'DETACH DATABASE {schema}')
+        with conn:
+            conn.execute('DELETE FROM temp.burn_updates')
+    table_changed('workout_log', user_id)
+    return updated
+
+# Create an attached archive file's labels table and its copy of `table`,
+# with the same columns except day numbers and label ids
+def _create_archive_table(conn, schema, table):
+    declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA main.table_info({table})')}
+    labels = ARCHIVE_LABELS[table]
+    definitions = ['id INTEGER PRIMARY KEY', 'user_id INTEGER NOT NULL', 'day INTEGER NOT NULL'] + [
+        f"{column} {'INTEGER' if column in labels else declared[column]}"
+        for column in TABLE_COLUMNS[table] if column not in ('id', 'date')
+    ]
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {schema}.labels (id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE)')
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} ({', '.join(definitions)})")
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_user_day ON {table} (user_id, day)')
+
+# Move one year of a log table's rows dated before `before` into its archive
+# file; returns the number of rows moved. The copy and the delete share a
+# transaction; in WAL mode that is atomic per file only, so the copy ignores
+# rows already archived and an interrupted move is finished by the next run.
+def _archive_year(conn, table, year, before, path):
+    schema = f'archive_{year}'
+    labels = ARCHIVE_LABELS[table]
+    # The newest row always stays, so SQLite never hands an archived id out again
+    condition = f'''
+        date BETWEEN '{year:04d}-01-01' AND '{year:04d}-12-31' AND date < ? AND julianday(date) IS NOT NULL
+        AND id < (SELECT MAX(id) FROM main.{table})
+    '''
+    columns = [column for column in TABLE_COLUMNS[table] if column != 'date'] + ['user_id']
+    encoded = [
+        f'(SELECT id FROM {schema}.labels WHERE text = {table}.{column})' if column in labels else column
+        for column in columns
+    ]
+    attached = _attach(conn, schema, path)
+    try:
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            _create_archive_table(conn, schema, table)
+            for column in labels:
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO {schema}.labels (text)
+                    SELECT DISTINCT {column} FROM main.{table} WHERE {condition} AND {column} IS NOT NULL
+                ''', (before,))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {schema}.{table} ({', '.join(columns)}, day)
+                SELECT {', '.join(encoded)}, CAST(julianday(date) - {EPOCH_JULIAN_DAY} AS INTEGER)
+                FROM main.{table} WHERE {condition}
+            ''', (before,))
+            if table == 'progress':
+                for period, bucket in ROLLUP_PERIODS.items():
+                    conn.execute(_ROLLUP_ARCHIVED.format(
+                        period=period, bucket=bucket.format(date='date'), condition=condition
+                    ), (before,))
+            # The rows stay counted in daily_summary and progress_rollup,
+            # so the delete trigger is swapped out like in bulk_insert
+            trigger = f'trg_{table}_delete'
+            trigger_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)
+            ).fetchone()[0]
+            conn.execute(f'DROP TRIGGER {trigger}')
+            moved = conn.execute(f'DELETE FROM main.{table} WHERE {condition}', (before,)).rowcount
+            conn.execute(trigger_sql)
+            conn.execute('''
+                INSERT INTO archive_partitions (table_name, year, path, rows) VALUES (?, ?, ?, ?)
+                ON CONFLICT (table_name, year) DO UPDATE SET rows = rows + excluded.rows
+            ''', (table, year, os.path.basename(path), moved))
+    finally:
+        if attached:
+            conn.execute(f'DETACH DATABASE {schema}')
+    return moved
+
+# Move log rows dated before `before` (default: ARCHIVE_DAYS days ago) into
+# per-year archive files with compact rows; returns {table: rows moved}.
+# The loaders read across live and archived rows, and daily_summary and
+# progress_rollup keep covering archived days. vacuum=True also shrinks the
+# main database file, which takes a while on a large one.
+def archive_logs(before=None, tables=tuple(ARCHIVE_LABELS), vacuum=False):
+    flush_writes()
+    before = before or datetime.fromordinal(datetime.now().toordinal() - ARCHIVE_DAYS).strftime('%Y-%m-%d')
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(get_pool().path))[0]
+    moved = {}
+    with connection() as conn, timed('archive_logs'):
+        for table in tables:
+            years = [int(row[0]) for row in conn.execute(
+                f'SELECT DISTINCT substr(date, 1, 4) FROM {table} WHERE date < ? AND julianday(date) IS NOT NULL',
+                (before,)
+            )]
+            moved[table] = sum(
+                _archive_year(conn, table, year, before, os.path.join(directory, f'{stem}-{year:04d}.db'))
+                for year in years
+            )
+            if moved[table]:
+                table_changed(table)
+        if vacuum and any(moved.values()):
+            conn.execute('VACUUM')
+    return moved
+
+# Stream a log table out in batches of row tuples without loading it whole
+def iter_log_rows(table, start=None, end=None, columns=None, batch_size=10000, user_id=DEFAULT_USER_ID):
+    _await_writes(table)
+    with connection() as conn:
+        yield from _log_batches(conn, table, user_id, start, end, columns, batch_size)
+
+# Declared type of each column of a table: INTEGER, REAL or TEXT
+def column_types(table):
+    with connection() as conn:
+        return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+FOOD_SELECT = 'SELECT f.name, f.brand, f.serving, f.calories, f.protein, f.carbs, f.fat FROM foods f'
+
+# Foods whose name or brand has a word starting with every one of
+# `prefixes` (any one with match_all=False), best bm25 match first, as
+# (name, brand, serving, calories, protein, carbs, fat) rows
+def find_foods(prefixes, limit=10, match_all=True):
+    match = (' AND ' if match_all else ' OR ').join(f'"{prefix}"*' for prefix in prefixes)
+    with connection() as conn:
+        return conn.execute(
+            f'''{FOOD_SELECT} JOIN foods_fts ON foods_fts.rowid = f.id
+                WHERE foods_fts MATCH ? ORDER BY bm25(foods_fts) LIMIT ?''',
+            (match, limit)
+        ).fetchall()
+
+# The foods a user logs most often as (name, uses, calories, protein, carbs,
+# fat) rows, the values averaged over every entry with that name
+def load_frequent_foods(user_id=DEFAULT_USER_ID, limit=200):
+    _await_writes('food_log')
+    with connection() as conn:
+        return conn.execute('''
+            SELECT MIN(food_item), COUNT(*) AS uses, AVG(calories), AVG(protein), AVG(carbs), AVG(fat)
+            FROM food_log
+            WHERE user_id = ? AND food_item IS NOT NULL AND food_item != ''
+            GROUP BY lower(food_item)
+            ORDER BY uses DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+
+# Column types for load_log_typed. Dates become datetime64, repeated labels
+# categoricals and measurements float32 (nullable integer columns included,
+# NULL turns into NaN).
+LOG_DTYPES = {
+    'id': 'int64',
+    'user_id': 'int32',
+    'date': 'datetime64[D]',
+    'meal_type': 'category',
+    'food_item': 'category',
+    'exercise_type': 'category',
+    'exercise': 'category',
+    'calories': 'float32',
+    'protein': 'float32',
+    'carbs': 'float32',
+    'fat': 'float32',
+    'duration': 'float32',
+    'calories_burned': 'float32',
+    'weight': 'float32',
+    'calories_consumed': 'float32',
+    'exercise_minutes': 'float32',
+}
+
+# Load a log table into typed columns instead of read_sql_query's per-cell
+# Python objects. Rows are converted `chunk_size` at a time, so only one
+# chunk of row tuples is alive at once; categoricals are encoded as they
+# stream in. By default every column but id is loaded. arrow=True returns
+# Arrow-backed columns (needs pyarrow).
+def load_log_typed(table, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID, arrow=False,
+                   chunk_size=20000):
+    import numpy as np
+    import pandas as pd
+
+    columns = list(columns or [column for column in TABLE_COLUMNS[table] if column != 'id'])
+    kinds = [LOG_DTYPES.get(column, 'object') for column in columns]
+    parts = [[] for _ in columns]
+    # Categoricals and dates are dictionary-encoded as they stream in; a log
+    # repeats the same few hundred dates, so each distinct one is parsed once
+    labels = [{} if kind in ('category', 'datetime64[D]') else None for kind in kinds]
+    with timed('db_query', table=table):
+        for rows in iter_log_rows(table, start, end, columns, chunk_size, user_id):
+            for part, values, kind, mapping in zip(parts, zip(*rows), kinds, labels):
+                if mapping is not None:
+                    # NULL gets code -1, which pandas reads as missing
+                    codes = [-1 if value is None else mapping.setdefault(value, len(mapping)) for value in values]
+                    part.append(np.array(codes, dtype='int32'))
+                else:
+                    part.append(np.array(values, dtype=kind))
+
+    data = {}
+    for column, part, kind, mapping in zip(columns, parts, kinds, labels):
+        values = np.concatenate(part) if part else np.array([], dtype='int32' if mapping is not None else kind)
+        if kind == 'datetime64[D]':
+            # NaT closes the lookup table so NULL's -1 code lands on it;
+            # pandas' coarsest datetime resolution is seconds
+            days = np.array([*mapping, None], dtype='datetime64[D]')
+            data[column] = days[values].astype('datetime64[s]')
+        elif mapping is not None:
+            data[column] = pd.Categorical.from_codes(values, categories=list(mapping))
+        else:
+            data[column] = values
+    frame = pd.DataFrame(data, columns=columns)
+    if arrow:
+        frame = _to_arrow_frame(frame)
+    return frame
+
+def _to_arrow_frame(frame):
+    import pandas as pd
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ValueError("Arrow-backed frames need pyarrow: pip install pyarrow")
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,202 @@
+# MET values from the Compendium of Physical Activities, by category, then
+# activity, then intensity (lowest first). An activity with a single entry
+# has no intensity levels.
+MET_ACTIVITIES = {
+    "Cardio": {
+        "Running": {
+            "4 mph": 6.0, "5 mph": 8.3, "5.2 mph": 9.0, "6 mph": 9.8, "6.7 mph": 10.5, "7 mph": 11.0,
+            "7.5 mph": 11.5, "8 mph": 11.8, "8.6 mph": 12.3, "9 mph": 12.8, "10 mph": 14.5,
+            "11 mph": 16.0, "12 mph": 19.0, "13 mph": 19.8, "14 mph": 23.0
+        },
+        "Running, cross country": {"": 9.0},
+        "Running, trail": {"": 9.0},
+        "Running, stairs": {"": 15.0},
+        "Jogging": {"general": 7.0, "in place": 8.0},
+        "Walking": {
+            "2 mph": 2.8, "2.5 mph": 3.0, "3 mph": 3.5, "3.5 mph": 4.3, "4 mph": 5.0,
+            "4.5 mph": 7.0, "5 mph": 8.3
+        },
+        "Walking, uphill": {"3.5 mph, 1-5% grade": 5.3, "3.5 mph, 6-15% grade": 8.0},
+        "Hiking": {"cross country": 6.0, "with daypack": 7.8, "with heavy pack": 9.0},
+        "Cycling": {
+            "leisure, under 10 mph": 4.0, "10-11.9 mph": 6.8, "12-13.9 mph": 8.0, "14-15.9 mph": 10.0,
+            "16-19 mph": 12.0, "over 20 mph": 15.8
+        },
+        "Cycling, mountain": {"general": 8.5, "uphill, vigorous": 14.0},
+        "Stationary bike": {"50 W": 3.5, "100 W": 6.8, "150 W": 8.8, "200 W": 11.0, "250 W": 14.0},
+        "Spinning class": {"": 8.5},
+        "Swimming": {
+            "leisure": 6.0, "freestyle, slow": 5.8, "freestyle, fast": 9.8, "backstroke": 4.8,
+            "backstroke, training": 9.5, "breaststroke": 5.3, "breaststroke, training": 10.3,
+            "sidestroke": 7.0, "butterfly": 13.8
+        },
+        "Treading water": {"moderate": 3.5, "vigorous": 9.8},
+        "Water aerobics": {"": 5.5},
+        "Rowing machine": {"50 W": 4.8, "100 W": 7.0, "150 W": 8.5, "200 W": 12.0},
+        "Elliptical trainer": {"light": 4.6, "moderate": 5.0, "vigorous": 6.0},
+        "Stair machine": {"light": 6.0, "moderate": 9.0},
+        "Jump rope": {"slow": 8.8, "moderate": 11.8, "fast": 12.3},
+        "Aerobics": {"low impact": 5.0, "high impact": 7.3},
+        "Step aerobics": {"4 inch step": 5.5, "6-8 inch step": 7.5, "10-12 inch step": 9.5},
+        "Dancing": {"ballroom, slow": 3.0, "ballroom, fast": 5.5, "aerobic": 7.3, "Zumba": 6.5},
+        "Skating, ice": {"general": 7.0, "fast": 9.0},
+        "Rollerblading": {"moderate": 7.5, "fast": 9.8},
+        "Cross-country skiing": {"slow": 6.8, "moderate": 9.0, "vigorous": 12.5},
+    },
+    "Strength": {
+        "Weight lifting": {"light": 3.5, "vigorous": 6.0},
+        "Powerlifting": {"": 6.0},
+        "Bodybuilding": {"": 5.0},
+        "Circuit training": {"moderate": 4.3, "vigorous": 8.0},
+        "Kettlebells": {"": 9.8},
+        "Resistance bands": {"": 3.5},
+        "Push-ups": {"moderate": 3.8, "vigorous": 8.0},
+        "Pull-ups": {"": 8.0},
+        "Sit-ups": {"moderate": 3.8, "vigorous": 8.0},
+        "Squats": {"bodyweight": 5.0, "weighted": 6.0},
+        "Lunges": {"": 4.0},
+        "Calisthenics": {"light": 2.8, "moderate": 3.8, "vigorous": 8.0},
+    },
+    "Flexibility": {
+        "Yoga": {"nadisodhana": 2.0, "hatha": 2.5, "sun salutation": 3.3, "power": 4.0},
+        "Stretching": {"mild": 2.3, "moderate": 2.8},
+        "Pilates": {"mat": 3.0, "reformer": 3.5},
+        "Tai chi": {"": 3.0},
+        "Barre": {"": 3.5},
+        "Foam rolling": {"": 2.0},
+    },
+    "HIIT": {
+        "Burpees": {"moderate": 8.0, "vigorous": 10.0},
+        "Interval training": {"moderate": 6.0, "vigorous": 8.0},
+        "Tabata": {"": 8.0},
+        "Boot camp": {"": 8.0},
+        "CrossFit": {"": 6.0},
+        "Mountain climbers": {"": 8.0},
+        "Battle ropes": {"": 10.3},
+        "Sprints": {"": 15.0},
+    },
+    "Sports": {
+        "Basketball": {"shooting": 4.5, "general": 6.5, "game": 8.0},
+        "Soccer": {"casual": 7.0, "competitive": 10.0},
+        "Tennis": {"doubles": 6.0, "general": 7.3, "singles": 8.0},
+        "Badminton": {"social": 5.5, "competitive": 7.0},
+        "Squash": {"": 7.3},
+        "Racquetball": {"": 7.0},
+        "Table tennis": {"": 4.0},
+        "Volleyball": {"noncompetitive": 3.0, "competitive": 6.0, "beach": 8.0},
+        "Baseball": {"": 5.0},
+        "Softball": {"": 5.0},
+        "Cricket": {"": 4.8},
+        "Golf": {"with cart": 3.5, "walking, carrying clubs": 4.3},
+        "Ice hockey": {"general": 8.0, "competitive": 10.0},
+        "Field hockey": {"": 7.8},
+        "Football": {"touch": 8.0, "competitive": 9.0},
+        "Rugby": {"touch": 6.3, "competitive": 8.3},
+        "Handball": {"": 12.0},
+        "Frisbee": {"casual": 3.0, "ultimate": 8.0},
+        "Boxing": {"punching bag": 5.5, "sparring": 7.8, "in ring": 12.8},
+        "Martial arts": {"slow": 5.3, "moderate": 10.3},
+        "Rock climbing": {"bouldering": 5.8, "ascending": 8.0},
+        "Skiing, downhill": {"light": 4.3, "moderate": 5.3, "vigorous": 8.0},
+        "Snowboarding": {"light": 4.3, "moderate": 5.3},
+        "Surfing": {"": 3.0},
+        "Kayaking": {"": 5.0},
+        "Canoeing": {"leisure": 3.5, "vigorous": 5.8},
+        "Stand-up paddleboarding": {"": 6.0},
+        "Horseback riding": {"walking": 3.8, "general": 5.5, "trotting": 5.8},
+        "Bowling": {"": 3.8},
+    },
+    "Daily life": {
+        "Gardening": {"": 3.8},
+        "Mowing lawn": {"riding mower": 2.5, "power mower": 5.5},
+        "Shoveling snow": {"": 5.3},
+        "House cleaning": {"light": 2.3, "vigorous": 3.8},
+        "Carrying groceries upstairs": {"": 7.5},
+        "Moving furniture": {"": 5.8},
+        "Playing with children": {"moderate": 3.5, "vigorous": 5.8},
+    },
+}
+
+# Flat lookup by lower-cased label: "Running, 6 mph", or "Walking" for the
+# activity at its middle intensity. Values are (category, label, MET).
+def _flatten(activities):
+    table = {}
+    for category, by_activity in activities.items():
+        for activity, levels in by_activity.items():
+            labels = [f"{activity}, {level}" if level else activity for level in levels]
+            for label, met in zip(labels, levels.values()):
+                table[label.lower()] = (category, label, met)
+            middle = (len(labels) - 1) // 2
+            table.setdefault(activity.lower(), (category, labels[middle], list(levels.values())[middle]))
+    return table
+
+MET_TABLE = _flatten(MET_ACTIVITIES)
+
+# Calories burned per kg of body weight and hour at a MET value: gross counts
+# the resting metabolism too (1 MET ~ 1 kcal/kg/h), net only the extra effort
+BURN_FORMULAS = {
+    "gross": lambda met: met,
+    "net": lambda met: met - 1
+}
+
+def _burn(formula):
+    if formula not in BURN_FORMULAS:
+        raise ValueError(f"Unknown burn formula '{formula}'. Choose one of: {', '.join(BURN_FORMULAS)}")
+    return BURN_FORMULAS[formula]
+
+# Intensity levels of an activity as {label: MET}, lowest first
+def intensities(category, activity):
+    levels = MET_ACTIVITIES[category][activity]
+    return {f"{activity}, {level}" if level else activity: met for level, met in levels.items()}
+
+def met_value(exercise):
+    entry = MET_TABLE.get(exercise.strip().lower())
+    if entry is None:
+        raise ValueError(f"Unknown exercise '{exercise}'")
+    return entry[2]
+
+def calories_burned(exercise, minutes, weight, formula="gross"):
+    return round(_burn(formula)(met_value(exercise)) * weight * minutes / 60, 1)
+
+# MET values for an array of exercise labels, one lookup per distinct label;
+# unknown labels give NaN
+def met_values_many(exercises):
+    import numpy as np
+
+    labels, inverse = np.unique(np.asarray(exercises, dtype=object).astype(str), return_inverse=True)
+    mets = np.array([MET_TABLE.get(label.strip().lower(), (None, None, np.nan))[2] for label in labels])
+    return mets[inverse.reshape(-1)]
+
+def calories_burned_many(exercises, minutes, weight, formula="gross"):
+    import numpy as np
+
+    return np.round(
+        _burn(formula)(met_values_many(exercises)) * np.asarray(weight, dtype=float)
+        * np.asarray(minutes, dtype=float) / 60, 1
+    )
+
+# Re-derive calories_burned over a user's whole workout_log in one pass, each
+# workout using the weight logged on or before its date (the first logged
+# weight before that, the profile weight without any). Rows whose exercise is
+# not in MET_TABLE keep their value. Returns the number of rows updated.
+def recompute_calories_burned(user_id, formula="gross"):
+    import numpy as np
+    import pandas as pd
+    from storage import get_storage
+
+    storage = get_storage()
+    workouts = storage.load_workout_log_range(columns=["id", "date", "exercise", "duration"], user_id=user_id)
+    if workouts.empty:
+        return 0
+    weights = storage.load_progress_range(columns=["date", "weight"], user_id=user_id).dropna()
+    workouts["date"] = pd.to_datetime(workouts["date"])
+    if weights.empty:
+        weight = np.full(len(workouts), storage.load_user_data(user_id).get("weight", np.nan), dtype=float)
+    else:
+        weights["date"] = pd.to_datetime(weights["date"])
+        weight = pd.merge_asof(workouts[["date"]], weights, on="date")["weight"]
+        weight = weight.fillna(weights["weight"].iloc[0]).to_numpy()
+
+    burned = calories_burned_many(workouts["exercise"], workouts["duration"], weight, formula)
+    known = ~np.isnan(burned)
+    return storage.update_calories_burned(zip(burned[known].tolist(), workouts["id"][known].tolist()), user_id)
@@ -0,0 +1,151 @@
+import difflib
+import re
+import threading
+from storage import get_storage
+
+FOOD_COLUMNS = ('name', 'brand', 'serving', 'calories', 'protein', 'carbs', 'fat')
+
+# Column names of public nutrient datasets, keyed by our column. Open Food
+# Facts exports are tab-separated and give nutrients per 100 g.
+DATASET_COLUMNS = {
+    'openfoodfacts': {
+        'name': 'product_name', 'brand': 'brands', 'serving': 'serving_size',
+        'calories': 'energy-kcal_100g', 'protein': 'proteins_100g',
+        'carbs': 'carbohydrates_100g', 'fat': 'fat_100g'
+    },
+}
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Bulk-load a nutrient dataset (CSV, JSON Lines or Parquet) into the foods
+# table; returns the number of foods added. `columns` maps our FOOD_COLUMNS to
+# the file's column names, or names a DATASET_COLUMNS preset; by default the
+# file uses our names. Rows without a name are skipped.
+def import_foods(path, columns=None, file_format=None, source=None, delimiter=',', chunk_size=50000):
+    from bulk_io import read_rows
+
+    if isinstance(columns, str):
+        if columns not in DATASET_COLUMNS:
+            raise ValueError(f"Unknown dataset '{columns}'. Choose one of: {', '.join(DATASET_COLUMNS)}")
+        source = source or columns
+        columns = DATASET_COLUMNS[columns]
+    columns = columns or {}
+    names = [columns.get(column, column) for column in FOOD_COLUMNS]
+
+    def rows():
+        for chunk in read_rows(path, names, file_format, chunk_size, delimiter):
+            for name, brand, serving, calories, protein, carbs, fat in chunk:
+                name = (name or '').strip()
+                if name:
+                    yield (name, brand or None, serving or None, _number(calories), _number(protein),
+                           _number(carbs), _number(fat), source)
+
+    return get_storage().bulk_insert('foods', rows(), batch_size=chunk_size, user_id=None)
+
+def _words(text):
+    return re.findall(r'\w+', text.lower())
+
+def _food(row):
+    return dict(zip(FOOD_COLUMNS, row))
+
+# Search the food database by name or brand. Every word is matched as a
+# prefix ("chick bre" finds "Chicken breast"), best match first; when
+# nothing matches, typos are tolerated by matching short prefixes and
+# ranking those candidates by similarity.
+def search_foods(query, limit=10):
+    words = _words(query)
+    if not words:
+        return []
+    storage = get_storage()
+    rows = storage.find_foods(words, limit)
+    if rows:
+        return [_food(row) for row in rows]
+
+    # Fuzzy fallback: any word's first two letters, best ratio first
+    prefixes = [word[:2] for word in words if len(word) >= 2]
+    if not prefixes:
+        return []
+    candidates = storage.find_foods(prefixes, 500, match_all=False)
+    text = ' '.join(words)
+    scored = [(difflib.SequenceMatcher(None, text, row[0].lower()).ratio(), row) for row in candidates]
+    scored = [item for item in scored if item[0] >= 0.6]
+    scored.sort(key=lambda item: -item[0])
+    return [_food(row) for _, row in scored[:limit]]
+
+# In-memory index of the foods a user logs most often, built from food_log,
+# so repeat entries resolve without touching the database or the model.
+# Values are the averages of what the user logged for that name.
+class FoodHotCache:
+    def __init__(self, user_id, size=200):
+        self.user_id = user_id
+        self.size = size
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        rows = get_storage().load_frequent_foods(self.user_id, self.size)
+        with self._lock:
+            self.items = {
+                name.lower(): {'name': name, 'uses': uses, 'calories': calories,
+                               'protein': protein, 'carbs': carbs, 'fat': fat}
+                for name, uses, calories, protein, carbs, fat in rows
+            }
+            self._name_words = {key: _words(key) for key in self.items}
+
+    # Fold a just-logged food_log entry into the cache
+    def record(self, entry):
+        name = (entry.get('food_item') or '').strip()
+        if not name:
+            return
+        with self._lock:
+            item = self.items.get(name.lower())
+            if item is None:
+                item = {'name': name, 'uses': 0, 'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+                self.items[name.lower()] = item
+                self._name_words[name.lower()] = _words(name)
+            uses = item['uses'] + 1
+            for column in ('calories', 'protein', 'carbs', 'fat'):
+                item[column] = (item[column] or 0) + ((entry.get(column) or 0) - (item[column] or 0)) / uses
+            item['uses'] = uses
+
+    # Items whose name has a word starting with each query word, most used first
+    def lookup(self, query, limit=10):
+        words = _words(query)
+        if not words:
+            return []
+        with self._lock:
+            matches = [
+                dict(item) for key, item in self.items.items()
+                if all(any(name_word.startswith(word) for name_word in self._name_words[key]) for word in words)
+            ]
+        matches.sort(key=lambda item: -item['uses'])
+        return matches[:limit]
+
+_hot_caches = {}
+_hot_caches_lock = threading.Lock()
+
+# The shared hot cache for a user, built on first use
+def hot_cache(user_id):
+    key = (get_storage().scope, user_id)
+    with _hot_caches_lock:
+        if key not in _hot_caches:
+            _hot_caches[key] = FoodHotCache(user_id)
+        return _hot_caches[key]
+
+# Autocomplete for manual entry: the user's frequent foods first, then the
+# food database, without duplicate names
+def suggest_foods(query, user_id, limit=8):
+    suggestions = hot_cache(user_id).lookup(query, limit)
+    seen = {item['name'].lower() for item in suggestions}
+    if len(suggestions) < limit:
+        for food in search_foods(query, limit):
+            if food['name'].lower() not in seen:
+                seen.add(food['name'].lower())
+                suggestions.append(food)
+    return suggestions[:limit]
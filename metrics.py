@@ -0,0 +1,206 @@
+import bisect
+import contextvars
+import functools
+import json
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds (the Prometheus client defaults)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "health_tracker"
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+# Process-wide counters, gauges and latency histograms, keyed by (name, labels)
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.gauges.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                     "buckets": dict(zip([*map(str, h.buckets), "+Inf"], h.counts))}
+                    for (name, labels), h in sorted(self.histograms.items())
+                ],
+            }
+
+    # Prometheus text exposition format (version 0.0.4)
+    def prometheus_text(self):
+        def label_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f"{PREFIX}_{name}_total{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {PREFIX}_{name} gauge")
+                for (key, labels), value in sorted(self.gauges.items()):
+                    if key == name:
+                        lines.append(f"{PREFIX}_{name}{label_text(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                metric = f"{PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (key, labels), h in sorted(self.histograms.items()):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{label_text(labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"{metric}_sum{label_text(labels)} {h.sum}")
+                    lines.append(f"{metric}_count{label_text(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Stage timings of the render in progress; see trace_render
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+# Time a block or, as a decorator, every call of a function. The latency goes
+# into the `name` histogram and, during trace_render, into the render trace.
+class timed:
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        REGISTRY.observe(self.name, seconds, **self.labels)
+        trace = _trace.get()
+        if trace is not None:
+            stage = self.name
+            if self.labels:
+                stage += "[" + ",".join(str(v) for v in self.labels.values()) + "]"
+            trace.append((stage, seconds))
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, **self.labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+def increment(name, value=1, **labels):
+    REGISTRY.increment(name, value, **labels)
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set_gauge(name, value, **labels)
+
+def observe(name, seconds, **labels):
+    REGISTRY.observe(name, seconds, **labels)
+
+# Collect every timed() stage run on this thread inside the block. Yields the
+# list of (stage, seconds) it fills in.
+class trace_render:
+    def __enter__(self):
+        self.stages = []
+        self._token = _trace.set(self.stages)
+        return self.stages
+
+    def __exit__(self, *exc):
+        _trace.reset(self._token)
+        return False
+
+# Per-stage calls, total and slowest milliseconds for a trace, slowest first
+def summarize_trace(stages):
+    totals = {}
+    for stage, seconds in stages:
+        calls, total, slowest = totals.get(stage, (0, 0.0, 0.0))
+        totals[stage] = (calls + 1, total + seconds, max(slowest, seconds))
+    return [
+        {"stage": stage, "calls": calls, "total_ms": round(total * 1000, 2), "max_ms": round(slowest * 1000, 2)}
+        for stage, (calls, total, slowest) in sorted(totals.items(), key=lambda item: -item[1][1])
+    ]
+
+def prometheus_text():
+    return REGISTRY.prometheus_text()
+
+def to_json():
+    return json.dumps(REGISTRY.snapshot(), indent=2)
+
+# Serve /metrics (Prometheus text) and /metrics.json from a daemon thread
+def serve(port, host="127.0.0.1"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
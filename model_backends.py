@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Raw bytes for an analyzer image, used for cache keys and replay lookups
+def image_bytes(image):
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    return f"{image.mode}:{image.size}".encode() + image.tobytes()
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+# Every backend turns (image, prompt) into the model's raw response text
+class ModelBackend:
+    name = "base"
+    model_name = "base"
+
+    def generate(self, image, prompt, timeout=None):
+        raise NotImplementedError
+
+    # Yields the response text in chunks; backends without streaming
+    # support return it in one piece
+    def generate_stream(self, image, prompt, timeout=None):
+        yield self.generate(image, prompt, timeout)
+
+# Google Gemini over the network
+class GeminiBackend(ModelBackend):
+    name = "gemini"
+
+    def __init__(self, model_name=DEFAULT_MODEL, api_key=None):
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def _contents(self, image, prompt):
+        if isinstance(image, (bytes, bytearray)):
+            # Already encoded by NutritionAnalyzer.preprocess_image
+            image = {"mime_type": "image/jpeg", "data": bytes(image)}
+        return [image, prompt]
+
+    def generate(self, image, prompt, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        response = self.model.generate_content(self._contents(image, prompt), request_options=request_options)
+        return response.text
+
+    def generate_stream(self, image, prompt, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        response = self.model.generate_content(
+            self._contents(image, prompt), stream=True, request_options=request_options
+        )
+        for chunk in response:
+            # The final chunk of a stream may carry no text parts
+            if chunk.parts:
+                yield chunk.text
+
+# Canned answers used by the replay backend when nothing was recorded
+CANNED_RESPONSES = {
+    "label": {
+        "calories": 250, "protein": 6, "carbohydrates": 32, "sugar": 12, "fat": 11,
+        "saturated_fat": 4, "sodium": 480, "fiber": 3, "serving_size": "1 cup (55g)"
+    },
+    "food": {
+        "food_items": [
+            {"name": "Grilled chicken breast", "portion": "150g", "calories": 248,
+             "protein": 46, "carbohydrates": 0, "fat": 5},
+            {"name": "Steamed rice", "portion": "1 cup", "calories": 206,
+             "protein": 4, "carbohydrates": 45, "fat": 0.4},
+            {"name": "Mixed salad", "portion": "1 bowl", "calories": 45,
+             "protein": 2, "carbohydrates": 8, "fat": 0.5}
+        ],
+        "total_calories": 499, "total_protein": 52, "total_carbs": 53, "total_fat": 5.9
+    }
+}
+
+# Deterministic offline stand-in that replays recorded responses.
+# Recordings are JSON lines of {"prompt": <sha256>, "image": <sha256>, "text": ...}
+# as written by RecordingBackend. A recorded (image, prompt) pair replays
+# exactly; other images get one of the prompt's recordings chosen by image
+# hash, and unknown prompts fall back to CANNED_RESPONSES.
+class ReplayBackend(ModelBackend):
+    name = "replay"
+
+    def __init__(self, path=None, model_name="replay", latency=0.0, chunk_size=64, chunk_latency=0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.exact = {}
+        self.by_prompt = {}
+        path = path or os.getenv("NUTRITION_REPLAY_PATH")
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self.add(**json.loads(line))
+
+    def add(self, prompt, image, text):
+        self.exact[(prompt, image)] = text
+        self.by_prompt.setdefault(prompt, []).append(text)
+
+    def generate(self, image, prompt, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt_key = _digest(prompt.encode())
+        image_key = _digest(image_bytes(image))
+        text = self.exact.get((prompt_key, image_key))
+        if text is not None:
+            return text
+        recorded = self.by_prompt.get(prompt_key)
+        if recorded:
+            return recorded[int(image_key, 16) % len(recorded)]
+        kind = "label" if "nutrition label" in prompt else "food"
+        return json.dumps(CANNED_RESPONSES[kind])
+
+    # Replays the response in fixed-size chunks to mimic a streamed reply
+    def generate_stream(self, image, prompt, timeout=None):
+        text = self.generate(image, prompt, timeout)
+        for start in range(0, len(text), self.chunk_size):
+            if self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield text[start:start + self.chunk_size]
+
+# Wraps another backend and appends every response to a replay file
+class RecordingBackend(ModelBackend):
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.name = inner.name
+        self.model_name = inner.model_name
+        self._lock = threading.Lock()
+
+    def generate(self, image, prompt, timeout=None):
+        text = self.inner.generate(image, prompt, timeout)
+        self._record(image, prompt, text)
+        return text
+
+    def generate_stream(self, image, prompt, timeout=None):
+        chunks = []
+        for chunk in self.inner.generate_stream(image, prompt, timeout):
+            chunks.append(chunk)
+            yield chunk
+        self._record(image, prompt, ''.join(chunks))
+
+    def _record(self, image, prompt, text):
+        record = {
+            "prompt": _digest(prompt.encode()),
+            "image": _digest(image_bytes(image)),
+            "text": text
+        }
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+# Nutrition label reader built on local Tesseract OCR (needs pytesseract).
+# Only understands the "Food Label" prompt.
+class OCRLabelBackend(ModelBackend):
+    name = "ocr"
+
+    PATTERNS = {
+        "calories": r"calories\D{0,10}(\d+(?:\.\d+)?)",
+        "protein": r"protein\D{0,10}(\d+(?:\.\d+)?)",
+        "carbohydrates": r"carbohydrate\w*\D{0,10}(\d+(?:\.\d+)?)",
+        "sugar": r"sugars?\D{0,10}(\d+(?:\.\d+)?)",
+        "saturated_fat": r"saturated\s+fat\D{0,10}(\d+(?:\.\d+)?)",
+        "fat": r"(?<!saturated )(?<!trans )\bfat\D{0,10}(\d+(?:\.\d+)?)",
+        "sodium": r"sodium\D{0,10}(\d+(?:\.\d+)?)",
+        "fiber": r"fib(?:er|re)\D{0,10}(\d+(?:\.\d+)?)",
+    }
+
+    def __init__(self, model_name="tesseract"):
+        self.model_name = model_name
+        try:
+            import pytesseract
+        except ImportError:
+            raise ValueError("The OCR backend needs pytesseract: pip install pytesseract")
+        self.pytesseract = pytesseract
+
+    def generate(self, image, prompt, timeout=None):
+        if "nutrition label" not in prompt:
+            raise ValueError("The OCR backend only supports nutrition labels")
+        if isinstance(image, (bytes, bytearray)):
+            import io
+            from PIL import Image
+            image = Image.open(io.BytesIO(image))
+        text = self.pytesseract.image_to_string(image, timeout=timeout or 0).lower()
+        result = {}
+        for field, pattern in self.PATTERNS.items():
+            match = re.search(pattern, text)
+            result[field] = float(match.group(1)) if match else 0
+        serving = re.search(r"serving size\s*([^\n]+)", text)
+        result["serving_size"] = serving.group(1).strip() if serving else ""
+        return json.dumps(result)
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "replay": ReplayBackend,
+    "ocr": OCRLabelBackend,
+}
+
+# Build the backend named by NUTRITION_BACKEND (default: gemini).
+# Setting NUTRITION_RECORD_PATH records every response for later replay.
+def create_backend(name=None, **options):
+    options = {key: value for key, value in options.items() if value is not None}
+    name = (name or os.getenv("NUTRITION_BACKEND", "gemini")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    backend = BACKENDS[name](**options)
+    record_path = os.getenv("NUTRITION_RECORD_PATH")
+    if record_path:
+        backend = RecordingBackend(backend, record_path)
+    return backend
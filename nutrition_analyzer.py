@@ -1,73 +1,406 @@
-import google.generativeai as genai
-from PIL import Image
+from PIL import Image, ImageOps
+import heapq
+import io
+import itertools
 import json
-from dotenv import load_dotenv
 import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+from analysis_cache import AnalysisCache
+from metrics import increment, observe, set_gauge, timed
+from model_backends import DEFAULT_MODEL, create_backend, image_bytes
 
-# Load environment variables
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables")
+# HEIC/HEIF (iPhone photos) decode through pillow-heif when it is installed
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
 
-genai.configure(api_key=GOOGLE_API_KEY)
+# Per-nutrient thresholds. Nutrients listed in MINIMUM_NUTRIENTS score when
+# they reach the threshold, every other nutrient when it stays at or below it.
+THRESHOLD_PROFILES = {
+    "default": {"calories": 300, "sugar": 25, "saturated_fat": 5, "sodium": 600, "protein": 5},
+    "low_sodium": {"calories": 300, "sugar": 25, "saturated_fat": 5, "sodium": 300, "protein": 5},
+    "weight_loss": {"calories": 200, "sugar": 12, "saturated_fat": 3, "sodium": 500, "protein": 8},
+    "high_protein": {"calories": 450, "sugar": 25, "saturated_fat": 6, "sodium": 700, "protein": 20},
+}
+MINIMUM_NUTRIENTS = {"protein"}
 
-class NutritionAnalyzer:
+# Scheduler priorities; lower runs first
+INTERACTIVE = 0
+BATCH = 10
+
+# Requests per minute allowed by default for each backend (the Gemini free
+# tier limit); NUTRITION_RATE_LIMIT overrides it, 0 means unlimited
+DEFAULT_RATE_LIMITS = {"gemini": 15}
+
+# Raised once the model keeps answering 429 after every retry
+class RateLimitError(ValueError):
+    pass
+
+# HTTP status of a backend error (google.api_core exceptions carry it in
+# `code`), or None
+def _status_code(error):
+    for attribute in ("code", "status_code"):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int):
+            return int(code)
+    return None
+
+def _retryable(error):
+    code = _status_code(error)
+    return code is not None and (code == 429 or 500 <= code < 600)
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # Take a token and return 0, or return the seconds until one is available
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+# The chunks of one streamed response as they arrive, for the requests
+# sharing it. Iterating replays the chunks received so far, then waits for
+# the rest; a stream that ended in an error raises it.
+class _SharedStream:
     def __init__(self):
-        self.model = genai.GenerativeModel("gemini-2.0-flash")
-        self.thresholds = {
-            "calories": 300,
-            "sugar": 25,
-            "saturated_fat": 5,
-            "sodium": 600,
-            "protein": 5
-        }
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.done or len(self.chunks) > position)
+                if position == len(self.chunks):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                chunk = self.chunks[position]
+            position += 1
+            yield chunk
+
+# Process-wide gate in front of a model backend. Requests are admitted in
+# priority order (then arrival order), at most `max_concurrency` at a time
+# and no faster than the token bucket allows; identical in-flight requests
+# share one call (or stream), and 429/5xx answers are retried with
+# jittered backoff.
+class ModelScheduler:
+    def __init__(self, name, rate_per_minute=None, burst=1, max_concurrency=4, retries=3, backoff=1.0,
+                 max_backoff=30.0):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute / 60, burst) if rate_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._inflight = {}
+        self._streams = {}
+
+    @contextmanager
+    def admit(self, priority=INTERACTIVE):
+        ticket = (priority, next(self._sequence))
+        enqueued = time.perf_counter()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            set_gauge("model_queue_depth", len(self._queue), backend=self.name)
+            try:
+                while True:
+                    if self._queue[0] == ticket and self._active < self.max_concurrency:
+                        wait = self.bucket.take() if self.bucket else 0
+                        if not wait:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+            self._active += 1
+            set_gauge("model_queue_depth", len(self._queue), backend=self.name)
+            # The next ticket may be admissible now
+            self._cond.notify_all()
+        observe("model_queue_wait", time.perf_counter() - enqueued, backend=self.name)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    # Count a failed attempt; re-raises unless it should be retried
+    def _failed(self, error, attempt, retryable=True):
+        code = _status_code(error)
+        if not (retryable and _retryable(error)) or attempt == self.retries:
+            increment("model_requests", backend=self.name, outcome=str(code or "error"))
+            if code == 429:
+                raise RateLimitError(f"The model is rate limited, try again shortly ({error})") from error
+            raise error
+        increment("model_retries", backend=self.name, status=str(code))
+        # Full jitter keeps retrying sessions from arriving in lockstep
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    # Run fn() once admitted, retrying 429/5xx errors
+    def call(self, fn, priority=INTERACTIVE):
+        for attempt in range(self.retries + 1):
+            try:
+                with self.admit(priority):
+                    result = fn()
+            except Exception as e:
+                self._failed(e, attempt)
+                continue
+            increment("model_requests", backend=self.name, outcome="ok")
+            return result
+
+    # Yield from the generator fn() once admitted, holding the slot until it
+    # is exhausted. Errors are only retried before the first chunk arrives.
+    def stream(self, fn, priority=INTERACTIVE):
+        for attempt in range(self.retries + 1):
+            started = False
+            try:
+                with self.admit(priority):
+                    for chunk in fn():
+                        started = True
+                        yield chunk
+            except Exception as e:
+                self._failed(e, attempt, retryable=not started)
+                continue
+            increment("model_requests", backend=self.name, outcome="ok")
+            return
+
+    # Like call, but concurrent requests with the same key share one call
+    def run(self, key, fn, priority=INTERACTIVE):
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            increment("model_coalesced", backend=self.name)
+            return future.result()
+        try:
+            result = self.call(fn, priority)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._cond:
+                del self._inflight[key]
+
+    # Like stream, but concurrent requests with the same key share one
+    # stream; a later request replays the chunks received so far
+    def run_stream(self, key, fn, priority=INTERACTIVE):
+        with self._cond:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream()
+        if not leader:
+            increment("model_coalesced", backend=self.name)
+            yield from shared
+            return
+        try:
+            for chunk in self.stream(fn, priority):
+                shared.append(chunk)
+                yield chunk
+            shared.finish()
+        except Exception as e:
+            shared.finish(e)
+            raise
+        except BaseException:
+            # The leader's caller stopped reading (GeneratorExit)
+            shared.finish(ValueError("The shared model response was abandoned"))
+            raise
+        finally:
+            with self._cond:
+                del self._streams[key]
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+# The process-wide scheduler for a backend, configured from
+# NUTRITION_RATE_LIMIT (requests/minute) and NUTRITION_MAX_CONCURRENCY
+def get_scheduler(backend_name):
+    with _schedulers_lock:
+        scheduler = _schedulers.get(backend_name)
+        if scheduler is None:
+            rate = os.getenv("NUTRITION_RATE_LIMIT")
+            rate = float(rate) if rate else DEFAULT_RATE_LIMITS.get(backend_name)
+            scheduler = _schedulers[backend_name] = ModelScheduler(
+                backend_name, rate_per_minute=rate,
+                max_concurrency=int(os.getenv("NUTRITION_MAX_CONCURRENCY", "4"))
+            )
+        return scheduler
+
+class NutritionAnalyzer:
+    # The backend defaults to NUTRITION_BACKEND (Gemini unless configured),
+    # see model_backends.create_backend
+    def __init__(self, model_name=DEFAULT_MODEL, cache=None, request_timeout=60, backend=None,
+                 image_size=1024, image_quality=85, threshold_profile="default", scheduler=None):
+        if backend is None:
+            backend = create_backend(model_name=model_name)
+        self.backend = backend
+        # Shared by every analyzer on the same backend unless one is passed
+        self.scheduler = scheduler or get_scheduler(backend.name)
+        self.model_name = f"{backend.name}:{backend.model_name}"
+        self.request_timeout = request_timeout
+        self.image_size = image_size
+        self.image_quality = image_quality
+        # Pass cache=False to always call the model
+        self.cache = AnalysisCache() if cache is None else cache
+        self.thresholds = dict(THRESHOLD_PROFILES[threshold_profile])
     
-    def preprocess_image(self, image_file):
+    # Decode, orient, downscale and re-encode an upload as compact JPEG bytes
+    @timed('preprocess_image')
+    def preprocess_image(self, image_file, max_size=None, quality=None):
+        max_size = max_size or self.image_size
+        quality = quality or self.image_quality
         try:
             image = Image.open(image_file)
+            # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding
+            # instead of materializing the full-resolution photo
+            if image.format == 'JPEG':
+                image.draft('RGB', (max_size, max_size))
+            # Apply the camera's EXIF orientation so the model sees the photo upright
+            image = ImageOps.exif_transpose(image)
             # Convert to RGB if necessary
             if image.mode not in ('RGB', 'L'):
                 image = image.convert('RGB')
-            # Resize if too large
-            max_size = 1024
+            # Resize if too large; reducing_gap does a cheap integer reduce
+            # before the final LANCZOS pass
             if max(image.size) > max_size:
-                ratio = max_size / max(image.size)
-                new_size = tuple(int(dim * ratio) for dim in image.size)
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-            return image
+                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality)
+            return buffer.getvalue()
         except Exception as e:
             raise ValueError(f"Error processing image: {str(e)}")
 
-    def extract_nutrition_info(self, image, prompt):
+    def cache_key(self, image, prompt):
+        return AnalysisCache.make_key(image_bytes(image), prompt, self.model_name)
+
+    # priority is INTERACTIVE or BATCH, see ModelScheduler
+    def extract_nutrition_info(self, image, prompt, timeout=None, priority=INTERACTIVE):
+        key = self.cache_key(image, prompt)
+        if self.cache:
+            cached = self.cache.get(key)
+            increment('analysis_cache', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                return cached
+
+        result = self._analyze(image, prompt, timeout, key, priority)
+        if self.cache:
+            self.cache.put(key, result, self.model_name)
+        return result
+
+    def _analyze(self, image, prompt, timeout=None, key=None, priority=INTERACTIVE):
+        def generate():
+            with timed('model_call', backend=self.backend.name):
+                return self.backend.generate(image, prompt, timeout or self.request_timeout)
+
         try:
-            response = self.model.generate_content([image, prompt])
+            text = self.scheduler.run(key or self.cache_key(image, prompt), generate, priority)
             
-            # Log the raw response text
-            print("Raw response from Gemini:", response.text)
-            
-            if not response.text.strip():
+            if not text.strip():
                 raise ValueError("Empty response received from the model")
             
-            # Extract JSON from response
-            json_str = response.text.strip('`').strip()
-            if json_str.startswith('json'):
-                json_str = json_str[4:]
-            
-            # Handle extra data by finding the first valid JSON object
-            try:
-                # Find the first occurrence of '{' and the last occurrence of '}'
-                start = json_str.find('{')
-                end = json_str.rfind('}') + 1
-                json_str = json_str[start:end]
-                
-                # Parse JSON
-                return json.loads(json_str)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Failed to parse JSON response: {str(e)}")
+            return parse_json_response(text)
+        except RateLimitError:
+            raise
         except Exception as e:
             raise ValueError(f"Error analyzing image: {str(e)}")
             
+    # Streaming variant of extract_nutrition_info. Yields ("item", food_item)
+    # for every detected food item as soon as it has arrived, then
+    # ("result", full_result) once the response is complete.
+    def extract_nutrition_info_stream(self, image, prompt, timeout=None, priority=INTERACTIVE):
+        key = self.cache_key(image, prompt)
+        if self.cache:
+            cached = self.cache.get(key)
+            increment('analysis_cache', result='miss' if cached is None else 'hit')
+            if cached is not None:
+                for item in cached.get("food_items", []):
+                    yield "item", item
+                yield "result", cached
+                return
+
+        parser = IncrementalJSONParser()
+        chunks = self.scheduler.run_stream(
+            key, lambda: self.backend.generate_stream(image, prompt, timeout or self.request_timeout), priority
+        )
+        try:
+            # Includes the time the caller spends on each yielded item
+            with timed('model_stream', backend=self.backend.name):
+                for chunk in chunks:
+                    for item in parser.feed(chunk):
+                        yield "item", item
+            if not parser.buffer.strip():
+                raise ValueError("Empty response received from the model")
+            result = parser.result()
+        except RateLimitError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error analyzing image: {str(e)}")
+
+        if self.cache:
+            self.cache.put(key, result, self.model_name)
+        yield "result", result
+
+    # Preprocess and analyze several uploads concurrently. Results come back
+    # in input order; an upload that still fails after the scheduler's
+    # retries yields the ValueError in its slot instead of aborting the
+    # whole batch.
+    def analyze_many(self, images, image_type, max_workers=4, timeout=None):
+        prompt = get_analysis_prompt(image_type)
+
+        def analyze_one(image_file):
+            image = self.preprocess_image(image_file)
+            return self.extract_nutrition_info(image, prompt, timeout, priority=BATCH)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as pool:
+            futures = [pool.submit(analyze_one, image_file) for image_file in images]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except ValueError as e:
+                    results.append(e)
+        return results
+
     def calculate_health_score(self, nutrition_data):
         scores = {
             "calories": 1 if nutrition_data.get("calories", 0) <= self.thresholds["calories"] else 0,
@@ -81,6 +414,134 @@ class NutritionAnalyzer:
             "component_scores": scores
         }
 
+    # Vectorized calculate_health_score over many records at once. `data` is
+    # a DataFrame or a mapping of nutrient name to array-like. With
+    # continuous=True a nutrient loses credit linearly past its threshold
+    # (reaching 0 at twice the limit, or at 0 for minimum nutrients)
+    # instead of scoring 0/1. `weights` maps nutrient to relative weight;
+    # `thresholds` may be a profile name or a dict.
+    def score_many(self, data, weights=None, continuous=False, thresholds=None):
+        if isinstance(thresholds, str):
+            thresholds = THRESHOLD_PROFILES[thresholds]
+        thresholds = thresholds or self.thresholds
+        weights = weights or {}
+        length = len(data) if hasattr(data, 'columns') else len(next(iter(data.values()), []))
+
+        component_scores = {}
+        total = np.zeros(length)
+        weight_sum = 0.0
+        for nutrient, limit in thresholds.items():
+            values = _nutrient_column(data, nutrient, length)
+            if nutrient in MINIMUM_NUTRIENTS:
+                scores = np.clip(values / limit, 0, 1) if continuous else (values >= limit).astype(float)
+            else:
+                scores = np.clip(2 - values / limit, 0, 1) if continuous else (values <= limit).astype(float)
+            weight = weights.get(nutrient, 1.0)
+            component_scores[nutrient] = scores
+            total += weight * scores
+            weight_sum += weight
+
+        return {
+            "total_score": total / weight_sum * 100 if weight_sum else total,
+            "component_scores": component_scores
+        }
+
+# Column of `data` as a float array, with missing columns and NaN treated as 0
+def _nutrient_column(data, name, length):
+    if name not in data:
+        return np.zeros(length)
+    values = np.asarray(data[name], dtype=float)
+    return np.nan_to_num(values, nan=0.0)
+
+# Parse the first JSON object in a model response, ignoring code fences,
+# surrounding prose and anything after the object
+def parse_json_response(text):
+    decoder = json.JSONDecoder()
+    start = text.find('{')
+    error = None
+    while start != -1:
+        try:
+            value, _ = decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError as e:
+            error = error or e
+        start = text.find('{', start + 1)
+    raise ValueError(f"Failed to parse JSON response: {error or 'no JSON object found'}")
+
+# Scans a streamed response chunk by chunk. feed() returns the elements of
+# the `array_key` array (e.g. each detected food item) as soon as each one
+# is complete; result() parses the whole object once the stream has ended.
+class IncrementalJSONParser:
+    def __init__(self, array_key="food_items"):
+        self.array_key = array_key
+        self.buffer = ""
+        self.start = None
+        self.end = None
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._array_depth = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        buffer = self.buffer
+        items = []
+        for i in range(self._pos, len(buffer)):
+            if self.end is not None:
+                break
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = buffer[self._string_start:i]
+            elif self.start is None:
+                # Skip code fences and any preamble before the object
+                if ch == '{':
+                    self.start = i
+                    self._stack.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch in '{[':
+                if ch == '[' and len(self._stack) == 1 and self._last_string == self.array_key:
+                    self._array_depth = 2
+                elif ch == '{' and len(self._stack) == self._array_depth:
+                    self._item_start = i
+                self._stack.append(ch)
+            elif ch in '}]':
+                self._stack.pop()
+                depth = len(self._stack)
+                if ch == '}' and self._item_start is not None and depth == self._array_depth:
+                    try:
+                        items.append(json.loads(buffer[self._item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                elif ch == ']' and self._array_depth is not None and depth == self._array_depth - 1:
+                    self._array_depth = None
+                if not self._stack:
+                    self.end = i + 1
+        self._pos = len(buffer)
+        return items
+
+    def result(self):
+        if self.end is not None:
+            try:
+                return json.loads(self.buffer[self.start:self.end])
+            except json.JSONDecodeError:
+                pass
+        return parse_json_response(self.buffer)
+
 def get_analysis_prompt(image_type):
     if image_type == "Food Label":
         return """
@@ -0,0 +1,712 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count, islice
+import data_manager
+from data_manager import (
+    DEFAULT_USER_ID, PROFILE_COLUMNS, ROLLUP_PERIODS, SUMMARY_COLUMNS, TABLE_COLUMNS, cached_query, log_columns,
+    table_changed, weight_series_frame
+)
+from metrics import timed
+
+# Every backend keeps the same data behind the data_manager API: user
+# profiles, the food, workout and progress logs with their daily totals and
+# weight rollups, and the shared foods table. Dates go in and come out as
+# 'YYYY-MM-DD' strings, and the loaders return what data_manager's do.
+class StorageBackend:
+    name = "base"
+
+    # Names the database, for caches kept per database
+    @property
+    def scope(self):
+        raise NotImplementedError
+
+    # Create or migrate the schema
+    def init(self):
+        raise NotImplementedError
+
+    # Share one connection across every call on this thread inside the block
+    def connection(self):
+        raise NotImplementedError
+
+    # Users and profiles
+    def list_users(self):
+        raise NotImplementedError
+
+    def create_user(self, name):
+        raise NotImplementedError
+
+    def save_user_data(self, user_data, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_user_data(self, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    # Logs
+    def save_food_log(self, entry, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_food_log(self, date=None, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_food_log_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def save_workout_log(self, entry, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_workout_log(self, date=None, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_workout_log_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def save_progress(self, entry, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_progress(self, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_progress_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def iter_log_rows(self, table, start=None, end=None, columns=None, batch_size=10000, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def bulk_insert(self, table, rows, batch_size=50000, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def update_calories_burned(self, rows, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    # Writes that failed after their save returned, as (table, params,
+    # error); only queued (write-behind) saves can fail this way
+    def take_failed_writes(self, user_id):
+        return []
+
+    def column_types(self, table):
+        raise NotImplementedError
+
+    # Aggregates
+    def load_daily_summary(self, date, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_daily_totals(self, start, end, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_daily_trend(self, start, end, window=7, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_progress_rollup(self, period='week', start=None, end=None, window=4, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_weight_change(self, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    def load_weight_series(self, max_points=500, raw_limit=20000, user_id=DEFAULT_USER_ID):
+        raise NotImplementedError
+
+    # Foods
+    def find_foods(self, prefixes, limit=10, match_all=True):
+        raise NotImplementedError
+
+    def load_frequent_foods(self, user_id=DEFAULT_USER_ID, limit=200):
+        raise NotImplementedError
+
+# The SQLite file of data_manager (HEALTH_TRACKER_DB), for a single node.
+# Write-behind, the archive tier and load_log_typed stay data_manager
+# features of this backend.
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    @property
+    def scope(self):
+        return data_manager.get_pool().path
+
+    init = staticmethod(data_manager.init_db)
+    connection = staticmethod(data_manager.connection)
+    list_users = staticmethod(data_manager.list_users)
+    create_user = staticmethod(data_manager.create_user)
+    save_user_data = staticmethod(data_manager.save_user_data)
+    load_user_data = staticmethod(data_manager.load_user_data)
+    save_food_log = staticmethod(data_manager.save_food_log)
+    load_food_log = staticmethod(data_manager.load_food_log)
+    load_food_log_range = staticmethod(data_manager.load_food_log_range)
+    save_workout_log = staticmethod(data_manager.save_workout_log)
+    load_workout_log = staticmethod(data_manager.load_workout_log)
+    load_workout_log_range = staticmethod(data_manager.load_workout_log_range)
+    save_progress = staticmethod(data_manager.save_progress)
+    load_progress = staticmethod(data_manager.load_progress)
+    load_progress_range = staticmethod(data_manager.load_progress_range)
+    iter_log_rows = staticmethod(data_manager.iter_log_rows)
+    bulk_insert = staticmethod(data_manager.bulk_insert)
+    update_calories_burned = staticmethod(data_manager.update_calories_burned)
+    take_failed_writes = staticmethod(data_manager.take_failed_writes)
+    column_types = staticmethod(data_manager.column_types)
+    load_daily_summary = staticmethod(data_manager.load_daily_summary)
+    load_daily_totals = staticmethod(data_manager.load_daily_totals)
+    load_daily_trend = staticmethod(data_manager.load_daily_trend)
+    load_progress_rollup = staticmethod(data_manager.load_progress_rollup)
+    load_weight_change = staticmethod(data_manager.load_weight_change)
+    load_weight_series = staticmethod(data_manager.load_weight_series)
+    find_foods = staticmethod(data_manager.find_foods)
+    load_frequent_foods = staticmethod(data_manager.load_frequent_foods)
+
+# Writes announce themselves on this channel so every app process sharing
+# the database drops its cached reads (see PostgresBackend._listen)
+PG_CHANNEL = "health_tracker_changes"
+
+# Held while migrating, so replicas starting together migrate once
+PG_MIGRATION_LOCK = 0x4854
+
+# Schema versions, applied in order and recorded in schema_version. Daily
+# totals and rollups are aggregated by the server at read time from the
+# covering (user_id, date) indexes, so concurrent writers never contend on
+# shared summary rows.
+PG_MIGRATIONS = [
+    '''
+    CREATE TABLE users (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        weight DOUBLE PRECISION,
+        height DOUBLE PRECISION,
+        age INTEGER,
+        gender TEXT,
+        target_weight DOUBLE PRECISION,
+        goal TEXT,
+        exercise_level TEXT,
+        dietary_pref TEXT,
+        allergies TEXT,
+        last_updated TEXT
+    );
+    CREATE TABLE accounts (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        current_profile_id BIGINT REFERENCES users (id),
+        created DATE NOT NULL DEFAULT CURRENT_DATE
+    );
+    INSERT INTO accounts (id, name) VALUES (1, 'Default');
+    SELECT setval(pg_get_serial_sequence('accounts', 'id'), 1);
+
+    CREATE TABLE food_log (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        date DATE NOT NULL,
+        meal_type TEXT,
+        food_item TEXT,
+        calories DOUBLE PRECISION,
+        protein DOUBLE PRECISION,
+        carbs DOUBLE PRECISION,
+        fat DOUBLE PRECISION
+    );
+    CREATE INDEX idx_food_log_user_date ON food_log (user_id, date, id)
+        INCLUDE (calories, protein, carbs, fat);
+
+    CREATE TABLE workout_log (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        date DATE NOT NULL,
+        exercise_type TEXT,
+        exercise TEXT,
+        duration INTEGER,
+        calories_burned DOUBLE PRECISION
+    );
+    CREATE INDEX idx_workout_log_user_date ON workout_log (user_id, date, id)
+        INCLUDE (duration, calories_burned);
+
+    CREATE TABLE progress (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        date DATE NOT NULL,
+        weight DOUBLE PRECISION,
+        calories_consumed DOUBLE PRECISION,
+        exercise_minutes INTEGER
+    );
+    CREATE INDEX idx_progress_user_date ON progress (user_id, date, id) INCLUDE (weight);
+
+    CREATE TABLE foods (
+        id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        name TEXT NOT NULL,
+        brand TEXT,
+        serving TEXT,
+        calories DOUBLE PRECISION,
+        protein DOUBLE PRECISION,
+        carbs DOUBLE PRECISION,
+        fat DOUBLE PRECISION,
+        source TEXT,
+        search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', name || ' ' || COALESCE(brand, ''))) STORED
+    );
+    CREATE INDEX idx_foods_search ON foods USING gin (search);
+    ''',
+]
+
+# Columns each insert takes, in the order of data_manager's INSERT_STATEMENTS
+PG_INSERT_COLUMNS = {
+    **{table: tuple(column for column in columns if column != 'id') for table, columns in TABLE_COLUMNS.items()},
+    'foods': ('name', 'brand', 'serving', 'calories', 'protein', 'carbs', 'fat', 'source'),
+}
+
+# Food totals per logged day of a date range, grouped from the food_log index
+PG_DAILY_TOTALS = '''
+    SELECT date, COUNT(*) AS food_entries, COALESCE(SUM(calories), 0) AS calories,
+           COALESCE(SUM(protein), 0) AS protein, COALESCE(SUM(carbs), 0) AS carbs,
+           COALESCE(SUM(fat), 0) AS fat
+    FROM food_log WHERE user_id = %s AND date BETWEEN {start} AND %s
+    GROUP BY date
+'''
+
+PG_COLUMN_TYPES = {'bigint': 'INTEGER', 'integer': 'INTEGER', 'double precision': 'REAL'}
+
+# psycopg is an optional dependency (see requirements.txt), imported only
+# when the postgres backend is built
+def _require_psycopg():
+    try:
+        import psycopg
+        import psycopg_pool
+    except ImportError:
+        raise ValueError("PostgreSQL storage needs psycopg: pip install 'psycopg[binary,pool]'")
+    return psycopg_pool
+
+# One PostgreSQL database shared by any number of app processes. Connections
+# come from a psycopg pool and run in autocommit, writes in explicit
+# transactions. Aggregates are computed by the server; the query cache stays
+# per process and is kept coherent across processes by LISTEN/NOTIFY.
+class PostgresBackend(StorageBackend):
+    name = "postgres"
+
+    def __init__(self, url=None, min_size=1, max_size=10, timeout=30.0):
+        psycopg_pool = _require_psycopg()
+        self.url = url or os.getenv("HEALTH_TRACKER_DATABASE_URL")
+        if not self.url:
+            raise ValueError("PostgreSQL storage needs a URL: set HEALTH_TRACKER_DATABASE_URL")
+        self.pool = psycopg_pool.ConnectionPool(
+            self.url, min_size=min_size, max_size=max_size, timeout=timeout,
+            kwargs={'autocommit': True}, check=psycopg_pool.ConnectionPool.check_connection, open=True
+        )
+        self._local = threading.local()
+        self._cursor_ids = count()
+        self._listener = None
+        self._closed = False
+
+    @property
+    def scope(self):
+        return self.url
+
+    def init(self):
+        with self._transaction() as conn:
+            conn.execute('SELECT pg_advisory_xact_lock(%s)', (PG_MIGRATION_LOCK,))
+            conn.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+            version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+            for number, script in enumerate(PG_MIGRATIONS[version:], start=version + 1):
+                conn.execute(script)
+                conn.execute('INSERT INTO schema_version (version) VALUES (%s)', (number,))
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, name='storage-listener', daemon=True)
+            self._listener.start()
+
+    def close(self):
+        self._closed = True
+        self.pool.close()
+
+    @contextmanager
+    def connection(self):
+        # Nested calls on the same thread share the outer connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with self.pool.connection() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+
+    @contextmanager
+    def _transaction(self):
+        with self.connection() as conn, conn.transaction():
+            yield conn
+
+    # Publish a write to the other processes when the transaction commits
+    def _notify(self, conn, table, user_id=None, date=None):
+        conn.execute('SELECT pg_notify(%s, %s)', (PG_CHANNEL, json.dumps([table, user_id, date])))
+
+    # Feed other processes' writes into table_changed. After a lost
+    # connection every table counts as changed, since notifications sent
+    # meanwhile are gone.
+    def _listen(self):
+        import psycopg
+
+        while not self._closed:
+            try:
+                with psycopg.connect(self.url, autocommit=True) as conn:
+                    conn.execute(f'LISTEN {PG_CHANNEL}')
+                    while not self._closed:
+                        for notify in conn.notifies(timeout=5.0):
+                            table, user_id, date = json.loads(notify.payload)
+                            table_changed(table, user_id, date)
+            except psycopg.Error:
+                time.sleep(1.0)
+            for table in ('users', *PG_INSERT_COLUMNS):
+                table_changed(table)
+
+    def list_users(self):
+        with self.connection() as conn:
+            return conn.execute('SELECT id, name FROM accounts ORDER BY id').fetchall()
+
+    def create_user(self, name):
+        with self._transaction() as conn:
+            return conn.execute('INSERT INTO accounts (name) VALUES (%s) RETURNING id', (name.strip(),)).fetchone()[0]
+
+    # Same versioning as data_manager.save_user_data; the account row is
+    # locked so concurrent saves from two processes cannot both add a version
+    def save_user_data(self, user_data, user_id=DEFAULT_USER_ID):
+        values = (
+            user_data['weight'], user_data['height'], user_data['age'], user_data['gender'],
+            user_data['target_weight'], user_data['goal'], user_data['exercise_level'],
+            user_data['dietary_pref'], ','.join(user_data['allergies']), user_data['last_updated']
+        )
+        with self._transaction() as conn:
+            current = conn.execute('''
+                SELECT u.id, u.last_updated FROM accounts a LEFT JOIN users u ON u.id = a.current_profile_id
+                WHERE a.id = %s FOR UPDATE OF a
+            ''', (user_id,)).fetchone()
+            if current and current[0] is not None and current[1] == user_data['last_updated']:
+                conn.execute(
+                    f"UPDATE users SET {', '.join(f'{column} = %s' for column in PROFILE_COLUMNS)} WHERE id = %s",
+                    values + (current[0],)
+                )
+            else:
+                profile_id = conn.execute(f'''
+                    INSERT INTO users ({', '.join(PROFILE_COLUMNS)}, user_id)
+                    VALUES ({', '.join(['%s'] * (len(PROFILE_COLUMNS) + 1))}) RETURNING id
+                ''', values + (user_id,)).fetchone()[0]
+                conn.execute('UPDATE accounts SET current_profile_id = %s WHERE id = %s', (profile_id, user_id))
+            self._notify(conn, 'users', user_id)
+        table_changed('users', user_id)
+
+    @cached_query('users')
+    def load_user_data(self, user_id=DEFAULT_USER_ID):
+        with self.connection() as conn, timed('db_query', table='users'):
+            user_data = conn.execute(f'''
+                SELECT {', '.join('u.' + column for column in PROFILE_COLUMNS)}
+                FROM accounts a JOIN users u ON u.id = a.current_profile_id
+                WHERE a.id = %s
+            ''', (user_id,)).fetchone()
+        if user_data:
+            user_data = dict(zip(PROFILE_COLUMNS, user_data))
+            user_data['allergies'] = user_data['allergies'].split(',')
+            return user_data
+        return {}
+
+    def _insert_log(self, table, values, user_id, date):
+        columns = PG_INSERT_COLUMNS[table] + ('user_id',)
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                values + (user_id,)
+            )
+            self._notify(conn, table, user_id, date)
+        table_changed(table, user_id, date)
+
+    def save_food_log(self, entry, user_id=DEFAULT_USER_ID):
+        self._insert_log('food_log', (
+            entry['date'], entry['meal_type'], entry['food_item'],
+            entry['calories'], entry['protein'], entry['carbs'], entry['fat']
+        ), user_id, entry['date'])
+
+    def save_workout_log(self, entry, user_id=DEFAULT_USER_ID):
+        self._insert_log('workout_log', (
+            entry['date'], entry['exercise_type'], entry['exercise'], entry['duration'], entry['calories_burned']
+        ), user_id, entry['date'])
+
+    def save_progress(self, entry, user_id=DEFAULT_USER_ID):
+        self._insert_log('progress', (
+            entry['date'], entry['weight'], entry['calories_consumed'], entry['exercise_minutes']
+        ), user_id, entry['date'])
+
+    # A projected, date-filtered SELECT on a log table in date and id order;
+    # user_id=None reads every user's rows
+    def _log_query(self, table, user_id, start=None, end=None, columns=None, where=()):
+        select = ', '.join('date::text AS date' if column == 'date' else column
+                           for column in log_columns(table, columns))
+        conditions = []
+        params = []
+        if user_id is not None:
+            conditions.append('user_id = %s')
+            params.append(user_id)
+        if start is not None and start == end:
+            conditions.append('date = %s')
+            params.append(start)
+        else:
+            if start is not None:
+                conditions.append('date >= %s')
+                params.append(start)
+            if end is not None:
+                conditions.append('date <= %s')
+                params.append(end)
+        conditions += where
+        query = f'SELECT {select} FROM {table}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return query + ' ORDER BY date, id', params
+
+    def _load_log(self, table, user_id, start=None, end=None, columns=None):
+        import pandas as pd
+
+        query, params = self._log_query(table, user_id, start, end, columns)
+        with self.connection() as conn, timed('db_query', table=table):
+            rows = conn.execute(query, params).fetchall()
+        return pd.DataFrame.from_records(rows, columns=log_columns(table, columns), coerce_float=True)
+
+    @cached_query('food_log')
+    def load_food_log(self, date=None, user_id=DEFAULT_USER_ID):
+        return self._load_log('food_log', user_id, date or None, date or None)
+
+    @cached_query('food_log')
+    def load_food_log_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        return self._load_log('food_log', user_id, start, end, columns)
+
+    @cached_query('workout_log')
+    def load_workout_log(self, date=None, user_id=DEFAULT_USER_ID):
+        return self._load_log('workout_log', user_id, date or None, date or None)
+
+    @cached_query('workout_log')
+    def load_workout_log_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        return self._load_log('workout_log', user_id, start, end, columns)
+
+    @cached_query('progress')
+    def load_progress(self, user_id=DEFAULT_USER_ID):
+        return self._load_log('progress', user_id)
+
+    @cached_query('progress')
+    def load_progress_range(self, start=None, end=None, columns=None, user_id=DEFAULT_USER_ID):
+        return self._load_log('progress', user_id, start, end, columns)
+
+    # A named (server-side) cursor sends the rows over batch_size at a time
+    def iter_log_rows(self, table, start=None, end=None, columns=None, batch_size=10000, user_id=DEFAULT_USER_ID):
+        query, params = self._log_query(table, user_id, start, end, columns)
+        with self.connection() as conn, conn.transaction():
+            with conn.cursor(name=f'log_rows_{next(self._cursor_ids)}') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    yield batch
+
+    # Each batch goes in with one COPY and one commit. Only foods is shared;
+    # log rows without a user go to the default account, as in SQLite.
+    def bulk_insert(self, table, rows, batch_size=50000, user_id=DEFAULT_USER_ID):
+        if table != 'foods' and user_id is None:
+            user_id = DEFAULT_USER_ID
+        columns = PG_INSERT_COLUMNS[table] + (('user_id',) if user_id is not None else ())
+        owner = (user_id,) if user_id is not None else ()
+        rows = iter(rows)
+        total = 0
+        with self.connection() as conn:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                with conn.transaction(), conn.cursor() as cursor:
+                    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                        for row in batch:
+                            copy.write_row(row + owner)
+                    self._notify(conn, table, user_id)
+                table_changed(table, user_id)
+                total += len(batch)
+        return total
+
+    # One UPDATE joined against the (calories, id) pairs sent as two arrays
+    def update_calories_burned(self, rows, user_id=DEFAULT_USER_ID):
+        pairs = list(rows)
+        if not pairs:
+            return 0
+        calories, ids = zip(*pairs)
+        with self._transaction() as conn:
+            updated = conn.execute('''
+                UPDATE workout_log w SET calories_burned = u.calories
+                FROM unnest(%s::double precision[], %s::bigint[]) AS u (calories, id)
+                WHERE w.id = u.id AND w.user_id = %s
+            ''', (list(calories), list(ids), user_id)).rowcount
+            self._notify(conn, 'workout_log', user_id)
+        table_changed('workout_log', user_id)
+        return updated
+
+    def column_types(self, table):
+        with self.connection() as conn:
+            rows = conn.execute(
+                '''
+                SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s
+                ''', (table,)
+            ).fetchall()
+        return {column: PG_COLUMN_TYPES.get(data_type, 'TEXT') for column, data_type in rows}
+
+    @cached_query('food_log', 'workout_log')
+    def load_daily_summary(self, date, user_id=DEFAULT_USER_ID):
+        with self.connection() as conn, timed('db_query', table='daily_summary'):
+            row = conn.execute('''
+                SELECT f.*, w.* FROM (
+                    SELECT COUNT(*), COALESCE(SUM(calories), 0), COALESCE(SUM(protein), 0),
+                           COALESCE(SUM(carbs), 0), COALESCE(SUM(fat), 0)
+                    FROM food_log WHERE user_id = %s AND date = %s
+                ) f, (
+                    SELECT COUNT(*), COALESCE(SUM(duration), 0), COALESCE(SUM(calories_burned), 0)
+                    FROM workout_log WHERE user_id = %s AND date = %s
+                ) w
+            ''', (user_id, date, user_id, date)).fetchone()
+        return dict(zip(SUMMARY_COLUMNS, row))
+
+    def load_daily_totals(self, start, end, user_id=DEFAULT_USER_ID):
+        with self.connection() as conn:
+            return conn.execute(
+                f"SELECT date::text, food_entries, calories, protein, carbs, fat FROM "
+                f"({PG_DAILY_TOTALS.format(start='%s')}) t",
+                (user_id, start, end)
+            ).fetchall()
+
+    def load_daily_trend(self, start, end, window=7, user_id=DEFAULT_USER_ID):
+        import pandas as pd
+
+        macros = ('calories', 'protein', 'carbs', 'fat')
+        rolling = ', '.join(
+            f"AVG({m}) OVER (ORDER BY date RANGE BETWEEN '{int(window) - 1} days'::interval PRECEDING "
+            f"AND CURRENT ROW) AS {m}_avg"
+            for m in macros
+        )
+        query = f'''
+            SELECT date::text AS date, {', '.join(macros)}, {', '.join(m + '_avg' for m in macros)} FROM (
+                SELECT date, {', '.join(macros)}, {rolling}
+                FROM ({PG_DAILY_TOTALS.format(start=f"%s::date - {int(window) - 1}")}) t
+            ) r WHERE date >= %s ORDER BY date
+        '''
+        with self.connection() as conn, timed('db_query', table='daily_summary'):
+            cursor = conn.execute(query, (user_id, start, end, start))
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=[c.name for c in cursor.description],
+                                             coerce_float=True)
+
+    # Buckets match ROLLUP_PERIODS: weeks start on Monday, months on the 1st
+    @cached_query('progress')
+    def load_progress_rollup(self, period='week', start=None, end=None, window=4, user_id=DEFAULT_USER_ID):
+        import pandas as pd
+
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown rollup period '{period}'. Choose one of: {', '.join(ROLLUP_PERIODS)}")
+        bucket = f"date_trunc('{period}', date)::date"
+        conditions = ['user_id = %s', 'weight IS NOT NULL']
+        params = [user_id]
+        if start is not None:
+            conditions.append(f"date >= date_trunc('{period}', %s::date)")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"date < date_trunc('{period}', %s::date) + interval '1 {period}'")
+            params.append(end)
+        query = f'''
+            SELECT period_start::text AS period_start, entries, weight_mean, weight_min, weight_max,
+                   AVG(weight_mean) OVER (
+                       ORDER BY period_start ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW
+                   ) AS moving_average,
+                   slope_per_day
+            FROM (
+                SELECT {bucket} AS period_start, COUNT(*) AS entries, AVG(weight) AS weight_mean,
+                       MIN(weight) AS weight_min, MAX(weight) AS weight_max,
+                       regr_slope(weight, date - {bucket}) AS slope_per_day
+                FROM progress
+                WHERE {' AND '.join(conditions)}
+                GROUP BY 1
+            ) r
+            ORDER BY period_start
+        '''
+        with self.connection() as conn, timed('db_query', table='progress_rollup'):
+            cursor = conn.execute(query, params)
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=[c.name for c in cursor.description],
+                                             coerce_float=True)
+
+    @cached_query('progress')
+    def load_weight_change(self, user_id=DEFAULT_USER_ID):
+        with self.connection() as conn:
+            first, last = conn.execute('''
+                SELECT (SELECT weight FROM progress WHERE user_id = %s AND weight IS NOT NULL
+                        ORDER BY date, id LIMIT 1),
+                       (SELECT weight FROM progress WHERE user_id = %s AND weight IS NOT NULL
+                        ORDER BY date DESC, id DESC LIMIT 1)
+            ''', (user_id, user_id)).fetchone()
+        return (first, last) if first is not None else None
+
+    @cached_query('progress')
+    def load_weight_series(self, max_points=500, raw_limit=20000, user_id=DEFAULT_USER_ID):
+        with self.connection() as conn, timed('db_query', table='progress'):
+            entries = conn.execute(
+                'SELECT COUNT(*) FROM progress WHERE user_id = %s AND weight IS NOT NULL', (user_id,)
+            ).fetchone()[0]
+            if entries <= raw_limit:
+                query, params = self._log_query('progress', user_id, columns=['date', 'weight'],
+                                                where=('weight IS NOT NULL',))
+            else:
+                query, params = '''
+                    SELECT date_trunc('week', date)::date::text, AVG(weight) FROM progress
+                    WHERE user_id = %s AND weight IS NOT NULL GROUP BY 1 ORDER BY 1
+                ''', (user_id,)
+            rows = conn.execute(query, params).fetchall()
+        return weight_series_frame(rows, max_points)
+
+    # Prefix matches of the words of name and brand, best ts_rank first
+    def find_foods(self, prefixes, limit=10, match_all=True):
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT f.name, f.brand, f.serving, f.calories, f.protein, f.carbs, f.fat
+                FROM foods f, (
+                    SELECT to_tsquery('simple', string_agg(quote_literal(p) || ':*', %s)) AS q
+                    FROM unnest(%s::text[]) p
+                ) m
+                WHERE f.search @@ m.q
+                ORDER BY ts_rank(f.search, m.q) DESC, f.id
+                LIMIT %s
+            ''', (' & ' if match_all else ' | ', list(prefixes), limit)).fetchall()
+
+    def load_frequent_foods(self, user_id=DEFAULT_USER_ID, limit=200):
+        with self.connection() as conn:
+            return conn.execute('''
+                SELECT MIN(food_item), COUNT(*) AS uses, AVG(calories), AVG(protein), AVG(carbs), AVG(fat)
+                FROM food_log
+                WHERE user_id = %s AND food_item IS NOT NULL AND food_item != ''
+                GROUP BY lower(food_item)
+                ORDER BY uses DESC
+                LIMIT %s
+            ''', (user_id, limit)).fetchall()
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "postgres": PostgresBackend,
+}
+
+# Build the backend named by HEALTH_TRACKER_STORAGE (default: sqlite)
+def create_storage(name=None, **options):
+    options = {key: value for key, value in options.items() if value is not None}
+    name = (name or os.getenv("HEALTH_TRACKER_STORAGE", "sqlite")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**options)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+# The process-wide backend, built on first use
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+# Replace the process-wide backend (benchmarks, scripts); returns it
+def set_storage(backend):
+    global _storage
+    with _storage_lock:
+        _storage = backend
+    return backend
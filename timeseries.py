@@ -0,0 +1,31 @@
+import numpy as np
+
+# Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013). Returns the
+# indexes of at most `n_out` points of (x, y) that keep the visual shape of
+# the series: the first and last points plus, for each bucket in between, the
+# point forming the largest triangle with the previously kept point and the
+# mean of the next bucket. x must be sorted.
+def lttb(x, y, n_out):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out < 3:
+        raise ValueError("n_out must be at least 3")
+    if n <= n_out:
+        return np.arange(n)
+
+    # Bucket boundaries for the n - 2 interior points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Mean of the next bucket (just the last point for the final bucket)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        ax, ay = x[keep[i]], y[keep[i]]
+        area = np.abs((ax - avg_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y - ay))
+        keep[i + 1] = lo + int(np.argmax(area))
+    return keep
@@ -1,38 +1,142 @@
+from functools import lru_cache
+
+# The scalar helpers run on every rerun with the same profile, so they are
+# memoized on their arguments; the *_many versions take arrays or DataFrame
+# columns and import numpy only when called.
+
+ACTIVITY_MULTIPLIERS = {
+    "Sedentary": 1.2,
+    "Light": 1.375,
+    "Moderate": 1.55,
+    "Active": 1.725,
+    "Very Active": 1.9
+}
+
+# Daily calorie adjustment for each goal
+GOAL_ADJUSTMENTS = {
+    "Weight Loss": -500,  # 500 calorie deficit
+    "Maintenance": 0,
+    "Weight Gain": 500    # 500 calorie surplus
+}
+
+BMI_CATEGORIES = (
+    (18.5, "Underweight"),
+    (25, "Normal weight"),
+    (30, "Overweight"),
+    (float("inf"), "Obese")
+)
+
+# BMR formulas. `male` is 1 or 0 (or an array of them) so the same arithmetic
+# serves scalars and arrays; body_fat is a percentage.
+def _harris_benedict(weight, height, age, male, body_fat=None):
+    return (male * (88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age))
+            + (1 - male) * (447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)))
+
+def _mifflin_st_jeor(weight, height, age, male, body_fat=None):
+    return (10 * weight) + (6.25 * height) - (5 * age) + (male * 5 + (1 - male) * -161)
+
+def _katch_mcardle(weight, height, age, male, body_fat=None):
+    if body_fat is None:
+        raise ValueError("The Katch-McArdle formula needs body_fat")
+    return 370 + 21.6 * weight * (1 - body_fat / 100)
+
+BMR_FORMULAS = {
+    "harris_benedict": _harris_benedict,
+    "mifflin_st_jeor": _mifflin_st_jeor,
+    "katch_mcardle": _katch_mcardle
+}
+
+def _formula(name):
+    if name not in BMR_FORMULAS:
+        raise ValueError(f"Unknown BMR formula '{name}'. Choose one of: {', '.join(BMR_FORMULAS)}")
+    return BMR_FORMULAS[name]
+
+@lru_cache(maxsize=1024)
 def calculate_bmi(weight, height_cm):
     height_m = height_cm / 100
     return round(weight / (height_m * height_m), 2)
 
+@lru_cache(maxsize=1024)
 def get_bmi_category(bmi):
-    if bmi < 18.5:
-        return "Underweight"
-    elif bmi < 25:
-        return "Normal weight"
-    elif bmi < 30:
-        return "Overweight"
-    else:
-        return "Obese"
-
-def calculate_daily_calories(weight, height, age, gender, activity_level, goal):
-    # Harris-Benedict equation
-    if gender == "Male":
-        bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
-    else:
-        bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
-    
-    activity_multipliers = {
-        "Sedentary": 1.2,
-        "Light": 1.375,
-        "Moderate": 1.55,
-        "Active": 1.725,
-        "Very Active": 1.9
-    }
-    
-    maintenance_calories = bmr * activity_multipliers[activity_level]
-    
-    # Adjust based on goal
-    if goal == "Weight Loss":
-        return round(maintenance_calories - 500)  # 500 calorie deficit
-    elif goal == "Weight Gain":
-        return round(maintenance_calories + 500)  # 500 calorie surplus
-    else:
-        return round(maintenance_calories)
\ No newline at end of file
+    for limit, category in BMI_CATEGORIES:
+        if bmi < limit:
+            return category
+    return BMI_CATEGORIES[-1][1]
+
+@lru_cache(maxsize=1024)
+def calculate_bmr(weight, height, age, gender, formula="harris_benedict", body_fat=None):
+    return _formula(formula)(weight, height, age, 1 if gender == "Male" else 0, body_fat)
+
+@lru_cache(maxsize=1024)
+def calculate_daily_calories(weight, height, age, gender, activity_level, goal,
+                             formula="harris_benedict", body_fat=None):
+    maintenance_calories = calculate_bmr(weight, height, age, gender, formula, body_fat) \
+        * ACTIVITY_MULTIPLIERS[activity_level]
+    return round(maintenance_calories + GOAL_ADJUSTMENTS.get(goal, 0))
+
+# Map an array of labels through a lookup table, one dict lookup per distinct
+# label. Labels missing from the table take `default`, or raise without one.
+def _lookup(table, labels, what, default=None):
+    import numpy as np
+
+    values, inverse = np.unique(np.asarray(labels, dtype=object).astype(str), return_inverse=True)
+    unknown = [value for value in values if value not in table]
+    if unknown and default is None:
+        raise ValueError(f"Unknown {what}: {', '.join(unknown)}")
+    return np.array([table.get(value, default) for value in values], dtype=float)[inverse.reshape(-1)]
+
+def calculate_bmi_many(weight, height_cm):
+    import numpy as np
+
+    height_m = np.asarray(height_cm, dtype=float) / 100
+    return np.round(np.asarray(weight, dtype=float) / (height_m * height_m), 2)
+
+def get_bmi_category_many(bmi):
+    import numpy as np
+
+    limits = [limit for limit, _ in BMI_CATEGORIES[:-1]]
+    labels = np.array([category for _, category in BMI_CATEGORIES], dtype=object)
+    return labels[np.searchsorted(limits, np.asarray(bmi, dtype=float), side="right")]
+
+def calculate_bmr_many(weight, height, age, gender, formula="harris_benedict", body_fat=None):
+    import numpy as np
+
+    male = (np.asarray(gender, dtype=object) == "Male").astype(float)
+    if body_fat is not None:
+        body_fat = np.asarray(body_fat, dtype=float)
+    return _formula(formula)(
+        np.asarray(weight, dtype=float), np.asarray(height, dtype=float),
+        np.asarray(age, dtype=float), male, body_fat
+    )
+
+# BMR, TDEE, calorie target, BMI and BMI category for every row of `profiles`,
+# a DataFrame with weight, height, age, gender, exercise_level and goal columns
+# (the `users` table layout) plus body_fat for Katch-McArdle. Use it for user
+# cohorts, or with daily_targets to back-fill targets over a weight history.
+def metabolic_profile_many(profiles, formula="harris_benedict"):
+    import numpy as np
+    import pandas as pd
+
+    body_fat = profiles["body_fat"] if "body_fat" in profiles else None
+    bmr = calculate_bmr_many(
+        profiles["weight"], profiles["height"], profiles["age"], profiles["gender"], formula, body_fat
+    )
+    tdee = bmr * _lookup(ACTIVITY_MULTIPLIERS, profiles["exercise_level"], "activity level")
+    target = np.round(tdee + _lookup(GOAL_ADJUSTMENTS, profiles["goal"], "goal", default=0))
+    bmi = calculate_bmi_many(profiles["weight"], profiles["height"])
+    return pd.DataFrame({
+        "bmr": bmr,
+        "tdee": tdee,
+        "calorie_target": target.astype("int64"),
+        "bmi": bmi,
+        "bmi_category": get_bmi_category_many(bmi)
+    }, index=profiles.index)
+
+# Daily calorie targets over a progress history: each logged weight combined
+# with the rest of `profile` (a load_user_data dict)
+def daily_targets(progress_df, profile, formula="harris_benedict"):
+    profiles = progress_df[["date", "weight"]].assign(**{
+        column: profile[column] for column in ("height", "age", "gender", "exercise_level", "goal", "body_fat")
+        if column in profile
+    })
+    return progress_df[["date", "weight"]].join(metabolic_profile_many(profiles, formula))